@@ -0,0 +1,787 @@
+from __future__ import annotations
+
+import argparse
+import csv
+import hashlib
+import html
+import io
+import os
+import random
+import re
+import shutil
+import sys
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+
+def project_root() -> Path:
+    """
+    Retorna a raiz do projeto assumindo a estrutura:
+    <raiz>/teste_1, <raiz>/teste_2 e <raiz>/pipeline
+    """
+    return Path(__file__).resolve().parents[1]
+
+
+ROOT_DIR = project_root()
+
+# Espelho local do portal de dados abertos da ANS, gerado com dados
+# sintéticos (só biblioteca padrão: roda offline, sem requests / bs4)
+DEFAULT_MIRROR_DIR = ROOT_DIR / "pipeline" / "output" / "espelho"
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Mesmos caminhos do portal (dadosabertos.ans.gov.br)
+CONTABEIS_PATH = "FTP/PDA/demonstracoes_contabeis/"
+CADOP_PATH = "FTP/PDA/operadoras_de_plano_de_saude_ativas/"
+CADOP_FILENAME = "Relatorio_cadop.csv"
+CADOP_CANCELED_PATH = "FTP/PDA/operadoras_de_plano_de_saude_canceladas/"
+CADOP_CANCELED_FILENAME = "Relatorio_cadop_canceladas.csv"
+
+DEFAULT_YEARS = "2023:2024"
+DEFAULT_OPERATORS = 200
+DEFAULT_SEED = 42
+
+# Contas de cada operadora por trimestre: a do enunciado, a subconta dela
+# (mesma hierarquia dos arquivos reais) e contas que o filtro descarta
+ACCOUNTS: List[Tuple[str, str]] = [
+    ("4", "DESPESAS"),
+    ("41", "DESPESAS COM EVENTOS / SINISTROS"),
+    ("411", "Eventos / Sinistros Conhecidos ou Avisados"),
+    ("31", "CONTRAPRESTAÇÕES EFETIVAS DE PLANO DE ASSISTÊNCIA À SAÚDE"),
+    ("46", "DESPESAS ADMINISTRATIVAS"),
+]
+
+# Contas extras por operadora, só para engordar os arquivos (--contas-extras)
+DEFAULT_EXTRA_ACCOUNTS = 20
+
+# Uma em cada N operadoras fica fora do CADOP (exercita o "sem match"):
+# ela aparece na lista de canceladas, descredenciada no último ano
+MISSING_FROM_CADOP_EVERY = 50
+
+MODALIDADES = [
+    "Medicina de Grupo",
+    "Cooperativa Médica",
+    "Seguradora Especializada em Saúde",
+    "Autogestão",
+    "Odontologia de Grupo",
+    "Filantropia",
+]
+UFS = ["SP", "RJ", "MG", "RS", "PR", "BA", "PE", "SC", "GO", "DF"]
+
+# Escrita das respostas em blocos (também a granularidade do limite de banda)
+WRITE_CHUNK_SIZE = 16 * 1024
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+QUARTER_PATTERN = re.compile(r"^(20\d{2})T([1-4])$", re.IGNORECASE)
+
+
+def parse_years(text: str) -> List[int]:
+    """
+    '2023:2024' -> [2023, 2024]; '2024' -> [2024].
+    """
+    start, _, end = text.partition(":")
+    first, last = int(start), int(end or start)
+    if first > last:
+        raise ValueError(f"Intervalo de anos invertido: {text!r}")
+    return list(range(first, last + 1))
+
+
+def cnpj_with_digits(base: str) -> str:
+    """
+    Completa 12 dígitos com os dois verificadores (CNPJ válido no validator).
+    """
+    digits = base
+    for weights in ([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]):
+        remainder = sum(int(n) * w for n, w in zip(digits, weights)) % 11
+        digits += "0" if remainder < 2 else str(11 - remainder)
+    return digits
+
+
+def format_money(value: float) -> str:
+    """
+    Valor no formato dos arquivos da ANS: 1234567,89 (vírgula decimal).
+    """
+    return f"{value:.2f}".replace(".", ",")
+
+
+def operator_registry(operators: int) -> List[str]:
+    """
+    REG_ANS das operadoras sintéticas (6 dígitos, como no portal).
+    """
+    return [str(300000 + index * 7) for index in range(operators)]
+
+
+def quarter_csv(year: int, quarter: int, operators: int, extra_accounts: int, seed: int, revision: int = 0) -> bytes:
+    """
+    Demonstração contábil de um trimestre (CSV latin-1, ';'), determinística
+    para (ano, trimestre, seed, revisão). Uma revisão > 0 muda os valores,
+    como numa republicação da ANS.
+    """
+    rng = random.Random(f"{seed}:{year}:{quarter}:{revision}")
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";", quoting=csv.QUOTE_ALL, lineterminator="\n")
+    writer.writerow(["DATA", "REG_ANS", "CD_CONTA_CONTABIL", "DESCRICAO", "VL_SALDO_INICIAL", "VL_SALDO_FINAL"])
+
+    date = f"{year}-{(quarter - 1) * 3 + 1:02d}-01"
+
+    for reg_ans in operator_registry(operators):
+        expenses = rng.uniform(1e4, 5e8)
+        for code, description in ACCOUNTS:
+            final = expenses if code.startswith("4") else expenses * rng.uniform(1.0, 1.3)
+            writer.writerow([date, reg_ans, code, description, format_money(final * 0.7), format_money(final)])
+        for extra in range(extra_accounts):
+            writer.writerow([
+                date, reg_ans, f"2{extra:04d}", f"CONTA PATRIMONIAL {extra}",
+                format_money(rng.uniform(0, 1e7)), format_money(rng.uniform(0, 1e7)),
+            ])
+
+    return buffer.getvalue().encode("latin-1")
+
+
+def registration_date(reg_ans: str) -> str:
+    """
+    Data de registro na ANS (determinística, anterior aos trimestres gerados).
+    """
+    number = int(reg_ans)
+    return f"{2000 + number % 20}-{1 + number % 12:02d}-{1 + number % 28:02d}"
+
+
+def cadop_csv(operators: int, seed: int) -> bytes:
+    """
+    Cadastro de operadoras ativas (CADOP) das operadoras sintéticas.
+    """
+    rng = random.Random(f"{seed}:cadop")
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";", quoting=csv.QUOTE_ALL, lineterminator="\n")
+    writer.writerow([
+        "REGISTRO_OPERADORA", "CNPJ", "Razao_Social", "Nome_Fantasia", "Modalidade", "Cidade", "UF",
+        "Data_Registro_ANS",
+    ])
+
+    for index, reg_ans in enumerate(operator_registry(operators)):
+        if index % MISSING_FROM_CADOP_EVERY == MISSING_FROM_CADOP_EVERY - 1:
+            continue
+        writer.writerow([
+            reg_ans,
+            cnpj_with_digits(f"{rng.randrange(10 ** 8):08d}0001"),
+            f"OPERADORA SINTÉTICA {reg_ans} LTDA",
+            f"SAÚDE {reg_ans}",
+            rng.choice(MODALIDADES),
+            "São Paulo",
+            rng.choice(UFS),
+            registration_date(reg_ans),
+        ])
+
+    return buffer.getvalue().encode("latin-1")
+
+
+def cadop_canceled_csv(operators: int, seed: int, last_year: int) -> bytes:
+    """
+    Operadoras canceladas: as que ficaram fora do CADOP de ativas,
+    descredenciadas em novembro do último ano gerado.
+    """
+    rng = random.Random(f"{seed}:canceladas")
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";", quoting=csv.QUOTE_ALL, lineterminator="\n")
+    writer.writerow([
+        "REGISTRO_OPERADORA", "CNPJ", "Razao_Social", "Nome_Fantasia", "Modalidade", "Cidade", "UF",
+        "Data_Registro_ANS", "Data_Descredenciamento", "Motivo_do_Descredenciamento",
+    ])
+
+    for index, reg_ans in enumerate(operator_registry(operators)):
+        if index % MISSING_FROM_CADOP_EVERY != MISSING_FROM_CADOP_EVERY - 1:
+            continue
+        writer.writerow([
+            reg_ans,
+            cnpj_with_digits(f"{rng.randrange(10 ** 8):08d}0001"),
+            f"OPERADORA SINTÉTICA {reg_ans} LTDA",
+            f"SAÚDE {reg_ans}",
+            rng.choice(MODALIDADES),
+            "São Paulo",
+            rng.choice(UFS),
+            registration_date(reg_ans),
+            f"{last_year}-11-15",
+            "CANCELAMENTO A PEDIDO",
+        ])
+
+    return buffer.getvalue().encode("latin-1")
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f".{path.name}.tmp")
+    temp_path.write_bytes(data)
+    os.replace(temp_path, path)
+
+
+def write_quarter(
+    root: Path,
+    year: int,
+    quarter: int,
+    operators: int,
+    extra_accounts: int,
+    seed: int,
+    revision: int = 0
+) -> Path:
+    """
+    Grava <raiz>/FTP/PDA/demonstracoes_contabeis/<ano>/<T>T<ano>.zip.
+    """
+    name = f"{quarter}T{year}"
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr(f"{name}.csv", quarter_csv(year, quarter, operators, extra_accounts, seed, revision))
+
+    path = root / CONTABEIS_PATH / str(year) / f"{name}.zip"
+    write_atomic(path, buffer.getvalue())
+    return path
+
+
+def generate_tree(
+    root: Path,
+    years: List[int],
+    operators: int = DEFAULT_OPERATORS,
+    extra_accounts: int = DEFAULT_EXTRA_ACCOUNTS,
+    seed: int = DEFAULT_SEED
+) -> List[Path]:
+    """
+    Gera a árvore do espelho (apaga a anterior): ZIPs de todos os
+    trimestres dos anos pedidos e os CSVs do CADOP (ativas e canceladas).
+    """
+    if root.exists():
+        shutil.rmtree(root)
+
+    written = [
+        write_quarter(root, year, quarter, operators, extra_accounts, seed)
+        for year in years
+        for quarter in range(1, 5)
+    ]
+
+    cadop_path = root / CADOP_PATH / CADOP_FILENAME
+    write_atomic(cadop_path, cadop_csv(operators, seed))
+    written.append(cadop_path)
+
+    canceled_path = root / CADOP_CANCELED_PATH / CADOP_CANCELED_FILENAME
+    write_atomic(canceled_path, cadop_canceled_csv(operators, seed, max(years)))
+    written.append(canceled_path)
+
+    return written
+
+
+def republish_quarter(
+    root: Path,
+    year: int,
+    quarter: int,
+    operators: int = DEFAULT_OPERATORS,
+    extra_accounts: int = DEFAULT_EXTRA_ACCOUNTS,
+    seed: int = DEFAULT_SEED
+) -> Path:
+    """
+    Regrava o ZIP de um trimestre com outros valores e o mesmo nome
+    (ETag / Last-Modified mudam, como numa republicação da ANS).
+    """
+    revision = time.time_ns()
+    return write_quarter(root, year, quarter, operators, extra_accounts, seed, revision)
+
+
+class FaultProfile:
+    """
+    Condições de rede simuladas em cada resposta:
+    - latency / jitter: espera antes de responder (segundos);
+    - bandwidth: limite de bytes/s por resposta (None = sem limite);
+    - error_rate: fração das requisições respondidas com um dos error_codes;
+    - truncate_rate: fração dos arquivos cortados no meio (conexão fechada
+      antes do Content-Length anunciado).
+
+    Os sorteios usam um Random com semente: a mesma sequência de
+    requisições recebe as mesmas falhas.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        bandwidth: Optional[int] = None,
+        error_rate: float = 0.0,
+        error_codes: Tuple[int, ...] = (500, 503),
+        truncate_rate: float = 0.0,
+        seed: int = DEFAULT_SEED
+    ) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_codes = error_codes
+        self.truncate_rate = truncate_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self) -> float:
+        with self._lock:
+            return self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def injected_error(self) -> Optional[int]:
+        with self._lock:
+            if self.error_rate and self._random.random() < self.error_rate:
+                return self._random.choice(self.error_codes)
+        return None
+
+    def truncate(self) -> bool:
+        with self._lock:
+            return bool(self.truncate_rate) and self._random.random() < self.truncate_rate
+
+    def describe(self) -> str:
+        parts = []
+        if self.latency or self.jitter:
+            parts.append(f"latência {self.latency * 1000:.0f}+{self.jitter * 1000:.0f} ms")
+        if self.bandwidth:
+            parts.append(f"banda {self.bandwidth / 1024:.0f} KB/s")
+        if self.error_rate:
+            parts.append(f"erros {self.error_rate:.0%} ({', '.join(map(str, self.error_codes))})")
+        if self.truncate_rate:
+            parts.append(f"cortes {self.truncate_rate:.0%}")
+        return ", ".join(parts) or "sem falhas injetadas"
+
+
+class MirrorStats:
+    """
+    Contadores do servidor (requisições por status e bytes enviados).
+    """
+
+    def __init__(self) -> None:
+        self.by_status: Dict[int, int] = {}
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+
+    def record(self, status: int, sent: int) -> None:
+        with self._lock:
+            self.by_status[status] = self.by_status.get(status, 0) + 1
+            self.bytes_sent += sent
+
+    @property
+    def requests(self) -> int:
+        return sum(self.by_status.values())
+
+    def describe(self) -> str:
+        statuses = ", ".join(f"{status}: {count}" for status, count in sorted(self.by_status.items()))
+        return f"{self.requests} requisições ({statuses or '-'}), {self.bytes_sent / 1024 ** 2:.2f} MB enviados"
+
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+
+def file_etag(path: Path) -> str:
+    stat = path.stat()
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    'bytes=a-b' / 'bytes=a-' / 'bytes=-n' -> (início, fim inclusivo).
+    None se o intervalo não puder ser atendido (416). Vários intervalos
+    não são suportados (respondidos como arquivo inteiro pelo chamador).
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or not any(match.groups()):
+        return None
+
+    start_text, end_text = match.groups()
+    if not start_text:
+        length = int(end_text)
+        if length == 0:
+            return None
+        return max(0, size - length), size - 1
+
+    start = int(start_text)
+    end = min(int(end_text), size - 1) if end_text else size - 1
+    if start >= size or start > end:
+        return None
+    return start, end
+
+
+class MirrorHandler(BaseHTTPRequestHandler):
+    """
+    Serve a árvore do espelho como o portal da ANS: listagens HTML no
+    estilo Apache (só links <a href>) e arquivos com ETag, Last-Modified,
+    GET condicional (304) e Range (206).
+    """
+
+    server_version = "ANSMirror/1.0"
+    protocol_version = "HTTP/1.1"
+
+    # Preenchidos por MirrorServer
+    root: Path
+    profile: FaultProfile
+    stats: MirrorStats
+    verbose: bool
+
+    def log_message(self, format: str, *args) -> None:
+        if self.verbose:
+            sys.stderr.write(f"   · {self.address_string()} {format % args}\n")
+
+    def do_GET(self) -> None:
+        self.respond(send_body=True)
+
+    def do_HEAD(self) -> None:
+        self.respond(send_body=False)
+
+    def resolve(self) -> Optional[Path]:
+        relative = unquote(urlsplit(self.path).path).lstrip("/")
+        target = (self.root / relative).resolve()
+        root = self.root.resolve()
+        if target != root and root not in target.parents:
+            return None
+        return target
+
+    def respond(self, send_body: bool) -> None:
+        time.sleep(self.profile.delay())
+
+        error = self.profile.injected_error()
+        if error is not None:
+            self.send_simple(error, f"Falha injetada ({error})", send_body, {"Retry-After": "1"} if error == 503 else None)
+            return
+
+        target = self.resolve()
+        if target is None or not target.exists():
+            self.send_simple(404, "Não encontrado", send_body)
+            return
+
+        if target.is_dir():
+            if not self.path.split("?", 1)[0].endswith("/"):
+                self.send_simple(301, "Movido", send_body, {"Location": self.path.split("?", 1)[0] + "/"})
+                return
+            self.send_listing(target, send_body)
+            return
+
+        self.send_file(target, send_body)
+
+    def not_modified(self, etag: str, modified: float) -> bool:
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return int(modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def send_simple(self, status: int, message: str, send_body: bool, headers: Optional[Dict[str, str]] = None) -> None:
+        body = f"<html><body><h1>{status}</h1><p>{html.escape(message)}</p></body></html>\n".encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.write_body(body if send_body else b"", status)
+
+    def send_listing(self, directory: Path, send_body: bool) -> None:
+        entries = sorted(directory.iterdir(), key=lambda entry: entry.name)
+        entries = [entry for entry in entries if not entry.name.startswith(".")]
+        url_path = self.path.split("?", 1)[0]
+
+        lines = [
+            f"<html><head><title>Index of {html.escape(url_path)}</title></head><body>",
+            f"<h1>Index of {html.escape(url_path)}</h1><pre>",
+            f'<a href="{html.escape(url_path.rstrip("/").rsplit("/", 1)[0] + "/")}">Parent Directory</a>',
+        ]
+        for entry in entries:
+            name = entry.name + ("/" if entry.is_dir() else "")
+            stat = entry.stat()
+            size = "-" if entry.is_dir() else str(stat.st_size)
+            stamp = time.strftime("%Y-%m-%d %H:%M", time.gmtime(stat.st_mtime))
+            lines.append(f'<a href="{html.escape(name)}">{html.escape(name)}</a>  {stamp}  {size}')
+        lines.append("</pre></body></html>")
+
+        body = "\n".join(lines).encode("utf-8")
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        modified = max([entry.stat().st_mtime for entry in entries] or [directory.stat().st_mtime])
+
+        if self.not_modified(etag, modified):
+            self.send_not_modified(etag, modified)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", http_date(modified))
+        self.end_headers()
+        self.write_body(body if send_body else b"", 200)
+
+    def send_not_modified(self, etag: str, modified: float) -> None:
+        self.send_response(304)
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", http_date(modified))
+        self.end_headers()
+        self.stats.record(304, 0)
+
+    def send_file(self, path: Path, send_body: bool) -> None:
+        stat = path.stat()
+        size = stat.st_size
+        etag = file_etag(path)
+
+        if self.not_modified(etag, stat.st_mtime):
+            self.send_not_modified(etag, stat.st_mtime)
+            return
+
+        start, end, status = 0, size - 1, 200
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if range_header and (if_range is None or if_range.strip() == etag):
+            requested = parse_range(range_header, size)
+            if requested is None:
+                self.send_simple(416, "Intervalo inválido", send_body, {"Content-Range": f"bytes */{size}"})
+                return
+            start, end, status = requested[0], requested[1], 206
+
+        length = end - start + 1
+        content_type = "application/zip" if path.suffix.lower() == ".zip" else "text/csv"
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(length))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", http_date(stat.st_mtime))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+
+        if not send_body:
+            self.stats.record(status, 0)
+            return
+
+        # Corte simulado: manda metade e derruba a conexão
+        limit = length // 2 if self.profile.truncate() else length
+
+        with path.open("rb") as file:
+            file.seek(start)
+            sent = self.stream(file, limit)
+
+        self.stats.record(status, sent)
+        if sent < length:
+            self.close_connection = True
+
+    def stream(self, file, limit: int) -> int:
+        """
+        Envia até `limit` bytes em blocos, respeitando o limite de banda.
+        """
+        bandwidth = self.profile.bandwidth
+        started = time.monotonic()
+        sent = 0
+
+        try:
+            while sent < limit:
+                chunk = file.read(min(WRITE_CHUNK_SIZE, limit - sent))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                sent += len(chunk)
+
+                if bandwidth:
+                    ahead = sent / bandwidth - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+        return sent
+
+    def write_body(self, body: bytes, status: int) -> None:
+        sent = self.stream(io.BytesIO(body), len(body)) if body else 0
+        self.stats.record(status, sent)
+
+
+class MirrorServer:
+    """
+    Servidor do espelho numa thread própria. Com port=0 o sistema
+    escolhe uma porta livre (vários espelhos em paralelo).
+    """
+
+    def __init__(
+        self,
+        root: Path = DEFAULT_MIRROR_DIR,
+        profile: Optional[FaultProfile] = None,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        verbose: bool = False
+    ) -> None:
+        self.stats = MirrorStats()
+        handler = type("BoundMirrorHandler", (MirrorHandler,), {
+            "root": root,
+            "profile": profile or FaultProfile(),
+            "stats": self.stats,
+            "verbose": verbose,
+        })
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def environment(self) -> Dict[str, str]:
+        """
+        Variáveis que apontam teste_1, teste_2 e o watcher para o espelho.
+        """
+        return {
+            "ANS_BASE_URL": self.base_url + CONTABEIS_PATH,
+            "ANS_CADOP_BASE_URL": self.base_url + CADOP_PATH,
+            "ANS_CADOP_CANCELADAS_BASE_URL": self.base_url + CADOP_CANCELED_PATH,
+        }
+
+    def start(self) -> "MirrorServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="ans-mirror", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+
+@contextmanager
+def running_mirror(
+    root: Path = DEFAULT_MIRROR_DIR,
+    profile: Optional[FaultProfile] = None,
+    port: int = 0
+) -> Iterator[MirrorServer]:
+    """
+    Sobe o espelho durante o bloco (para benchmarks e testes de regressão):
+
+        with running_mirror(pasta, FaultProfile(latency=0.05)) as mirror:
+            subprocess.run([...], env={**os.environ, **mirror.environment()})
+
+    As URLs são lidas na importação de downloader.py / enricher.py, então
+    as variáveis precisam estar no ambiente antes (ex: num subprocesso).
+    """
+    server = MirrorServer(root, profile, port=port).start()
+    try:
+        yield server
+    finally:
+        server.stop()
+
+
+def parse_size(text: str) -> int:
+    """
+    '512K' / '2M' / '100000' -> bytes por segundo.
+    """
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([KMG]?)B?\s*$", text, re.IGNORECASE)
+    if not match:
+        raise argparse.ArgumentTypeError(f"Tamanho inválido: {text!r} (ex: 512K, 2M)")
+    factor = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}[match.group(2).upper()]
+    return int(float(match.group(1)) * factor)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Espelho local do portal da ANS (dados sintéticos, latência / banda / falhas configuráveis)."
+    )
+    parser.add_argument("--pasta", type=Path, default=DEFAULT_MIRROR_DIR, help="Raiz da árvore do espelho.")
+    parser.add_argument("--porta", type=int, default=DEFAULT_PORT, help=f"Porta HTTP (padrão: {DEFAULT_PORT}).")
+    parser.add_argument("--gerar", action="store_true", help="Gera (ou regera) a árvore antes de servir.")
+    parser.add_argument("--so-gerar", action="store_true", help="Só gera a árvore e sai.")
+    parser.add_argument("--anos", default=DEFAULT_YEARS, help=f"Anos gerados (padrão: {DEFAULT_YEARS}).")
+    parser.add_argument("--operadoras", type=int, default=DEFAULT_OPERATORS, help="Operadoras sintéticas.")
+    parser.add_argument(
+        "--contas-extras",
+        type=int,
+        default=DEFAULT_EXTRA_ACCOUNTS,
+        help="Contas descartáveis por operadora (aumenta o tamanho dos ZIPs).",
+    )
+    parser.add_argument("--semente", type=int, default=DEFAULT_SEED, help="Semente dos dados e das falhas.")
+    parser.add_argument(
+        "--republicar",
+        action="append",
+        default=[],
+        help="Regrava o ZIP de um trimestre com outros valores (ex: 2024T3). Pode repetir.",
+    )
+    parser.add_argument("--latencia", type=float, default=0.0, help="Latência por requisição (ms).")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Variação aleatória somada à latência (ms).")
+    parser.add_argument("--banda", type=parse_size, default=None, help="Limite de banda por resposta (ex: 512K, 2M).")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="Fração das requisições com erro HTTP (0-1).")
+    parser.add_argument(
+        "--codigos-erro",
+        default="500,503",
+        help="Códigos usados na injeção de erro (padrão: 500,503).",
+    )
+    parser.add_argument("--taxa-corte", type=float, default=0.0, help="Fração dos arquivos cortados no meio (0-1).")
+    parser.add_argument("--verbose", action="store_true", help="Mostra cada requisição.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    """
+    Gera (se preciso) e serve o espelho até Ctrl+C:
+
+        python pipeline/mirror.py --gerar --latencia 80 --banda 2M --taxa-erro 0.05
+
+    e, em outro terminal, aponta o pipeline para ele com as variáveis
+    ANS_BASE_URL / ANS_CADOP_BASE_URL / ANS_CADOP_CANCELADAS_BASE_URL
+    mostradas na saída.
+    """
+    args = parse_args()
+    root: Path = args.pasta
+    years = parse_years(args.anos)
+
+    if args.gerar or args.so_gerar or not (root / CONTABEIS_PATH).is_dir():
+        print(f"🏗️  Gerando espelho em {root} (anos {years[0]}-{years[-1]}, {args.operadoras} operadoras)...")
+        written = generate_tree(root, years, args.operadoras, args.contas_extras, args.semente)
+        total = sum(path.stat().st_size for path in written)
+        print(f"   ✔ {len(written)} arquivos ({total / 1024 ** 2:.1f} MB)")
+
+    for text in args.republicar:
+        match = QUARTER_PATTERN.match(text.strip())
+        if not match:
+            raise ValueError(f"Trimestre inválido: {text!r} (use o formato 2024T3)")
+        path = republish_quarter(
+            root, int(match.group(1)), int(match.group(2)),
+            args.operadoras, args.contas_extras, args.semente
+        )
+        print(f"   ✔ Republicado: {path}")
+
+    if args.so_gerar:
+        return
+
+    profile = FaultProfile(
+        latency=args.latencia / 1000,
+        jitter=args.jitter / 1000,
+        bandwidth=args.banda,
+        error_rate=args.taxa_erro,
+        error_codes=tuple(int(code) for code in args.codigos_erro.split(",") if code.strip()),
+        truncate_rate=args.taxa_corte,
+        seed=args.semente,
+    )
+    server = MirrorServer(root, profile, port=args.porta, verbose=args.verbose)
+
+    print(f"🌐 Espelho da ANS em {server.base_url} ({profile.describe()})")
+    for name, value in server.environment().items():
+        print(f"   export {name}={value}")
+    print("   (Ctrl+C para encerrar)\n")
+
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(f"\n📊 {server.stats.describe()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,467 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from watcher import OUTPUT_DIR, ROOT_DIR, LockHeld, pipeline_lock
+
+# Fingerprint de cada etapa na última execução bem-sucedida e cache dos
+# hashes de arquivo (por tamanho + mtime, para não reler o que não mudou)
+STATE_FILE = OUTPUT_DIR / "estado_runner.json"
+STATE_VERSION = 1
+
+LOG_DIR = OUTPUT_DIR / "logs"
+
+# Etapas rodando ao mesmo tempo
+DEFAULT_JOBS = 2
+
+# Linhas finais do log mostradas quando uma etapa falha
+FAILURE_TAIL_LINES = 20
+
+# Arquivos temporários / parciais ignorados no hash de pastas
+IGNORED_SUFFIXES = (".part", ".tmp")
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+TESTE_1_CODE = [
+    "teste_1/main.py",
+    "teste_1/backfill.py",
+    "teste_1/downloader.py",
+    "teste_1/extractor.py",
+    "teste_1/file_reader.py",
+    "teste_1/expense_filter.py",
+    "teste_1/deduplicator.py",
+    "teste_1/consolidator.py",
+    "teste_1/archive.py",
+    "teste_1/dataset.py",
+    "teste_1/arrow_io.py",
+    "teste_1/offset_index.py",
+    "teste_1/utils.py",
+]
+
+
+class Stage:
+    """
+    Uma etapa do pipeline: comando (main.py de teste_1 ou teste_2 com
+    argumentos), arquivos/pastas de entrada e de saída e o código do
+    qual o resultado depende. As dependências entre etapas saem das
+    declarações: quem lê um caminho depende de quem o produz.
+
+    Etapas de origem (source=True) baixam dados da ANS: o resultado depende
+    do servidor, não de arquivos locais, então nunca são puladas. Quem vem
+    depois continua sendo pulado se o que foi baixado não mudou.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        folder: str,
+        arguments: List[str],
+        inputs: List[str],
+        outputs: List[str],
+        code: List[str],
+        source: bool = False,
+    ) -> None:
+        self.name = name
+        self.cwd = ROOT_DIR / folder
+        self.arguments = arguments
+        self.inputs = inputs
+        self.outputs = outputs
+        self.code = code
+        self.source = source
+        self.deps: Set[str] = set()
+
+
+def build_stages(window: Optional[str], quarter_jobs: int) -> List[Stage]:
+    """
+    DAG do Teste 1 + Teste 2.
+
+    zips ──> consolidado ──┐
+                           ├──> enriquecimento -> validacao -> agregacao -> pacote
+    cadop ─────────────────┘
+
+    zips e cadop são as etapas de origem: rodam sempre (um trimestre novo ou
+    um CADOP republicado só aparecem consultando a ANS).
+    """
+    window_args = ["--trimestres", window] if window else []
+    jobs_args = ["--jobs", str(quarter_jobs)]
+    teste_2_common = ["teste_2/main.py", "teste_2/dataset.py", "teste_2/arrow_io.py", "teste_2/utils.py"]
+
+    stages = [
+        Stage(
+            "zips", "teste_1",
+            ["--so-download", *window_args, *jobs_args],
+            inputs=[],
+            outputs=["teste_1/data/raw/zips"],
+            code=["teste_1/main.py", "teste_1/backfill.py", "teste_1/downloader.py", "teste_1/utils.py"],
+            source=True,
+        ),
+        Stage(
+            "cadop", "teste_2",
+            # A ANS republica o CADOP com o mesmo nome: sem --atualizar-cadop
+            # o arquivo em cache seria devolvido para sempre
+            ["--etapas", "cadop", "--atualizar-cadop"],
+            inputs=[],
+            outputs=["teste_2/data/cadop"],
+            code=[*teste_2_common, "teste_2/enricher.py", "teste_2/cadop_history.py"],
+            source=True,
+        ),
+        Stage(
+            "consolidado", "teste_1",
+            [*window_args, *jobs_args],
+            inputs=["teste_1/data/raw/zips"],
+            outputs=[
+                "teste_1/output/consolidado_despesas.zip",
+                "teste_1/output/despesas_eventos_sinistros",
+            ],
+            code=TESTE_1_CODE,
+        ),
+        Stage(
+            "enriquecimento", "teste_2",
+            ["--etapas", "enriquecimento"],
+            inputs=[
+                "teste_1/output/despesas_eventos_sinistros",
+                "teste_2/data/cadop",
+            ],
+            outputs=["teste_2/output/despesas_enriquecidas.csv"],
+            code=[
+                *teste_2_common,
+                "teste_2/enricher.py",
+                "teste_2/cadop_history.py",
+                "teste_2/offset_index.py",
+                "teste_2/spill.py",
+            ],
+        ),
+        Stage(
+            "validacao", "teste_2",
+            ["--etapas", "validacao"],
+            inputs=["teste_2/output/despesas_enriquecidas.csv"],
+            outputs=["teste_2/output/despesas_validadas.csv"],
+            code=[*teste_2_common, "teste_2/validator.py"],
+        ),
+        Stage(
+            "agregacao", "teste_2",
+            ["--etapas", "agregacao"],
+            inputs=["teste_2/output/despesas_validadas.csv"],
+            outputs=["teste_2/output/despesas_agregadas.csv"],
+            code=[*teste_2_common, "teste_2/aggregator.py", "teste_2/columnar.py", "teste_2/sketches.py", "teste_2/spill.py"],
+        ),
+        Stage(
+            "pacote", "teste_2",
+            ["--etapas", "pacote"],
+            inputs=["teste_2/output/despesas_agregadas.csv"],
+            outputs=["teste_2/output/Teste_Whybid.zip"],
+            code=[*teste_2_common, "teste_2/packer.py", "teste_2/archive.py"],
+        ),
+    ]
+
+    link_stages(stages)
+    return stages
+
+
+def link_stages(stages: List[Stage]) -> None:
+    """
+    Preenche Stage.deps a partir de entradas/saídas e rejeita ciclos.
+    """
+    producers: Dict[str, str] = {}
+    for stage in stages:
+        for output in stage.outputs:
+            if output in producers:
+                raise ValueError(f"Saída {output} declarada por {producers[output]} e {stage.name}")
+            producers[output] = stage.name
+
+    for stage in stages:
+        stage.deps = {producers[path] for path in stage.inputs if path in producers} - {stage.name}
+
+    remaining = {stage.name: set(stage.deps) for stage in stages}
+    while remaining:
+        ready = [name for name, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"Ciclo entre as etapas: {', '.join(sorted(remaining))}")
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+
+def load_state(path: Path = STATE_FILE) -> Dict[str, Dict]:
+    if path.exists():
+        with path.open("r", encoding="utf-8") as fin:
+            state = json.load(fin)
+        if state.get("version") == STATE_VERSION:
+            return state
+    return {"version": STATE_VERSION, "etapas": {}, "hashes": {}}
+
+
+def save_state(state: Dict[str, Dict], path: Path = STATE_FILE) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(path.name + ".tmp")
+
+    with temp_path.open("w", encoding="utf-8") as fout:
+        json.dump(state, fout, ensure_ascii=False, indent=2, sort_keys=True)
+
+    os.replace(temp_path, path)
+
+
+def iter_files(path: Path) -> Iterator[Path]:
+    """
+    Arquivos de um caminho (o próprio arquivo, ou os de uma pasta em
+    ordem estável), sem temporários nem ocultos.
+    """
+    if path.is_file():
+        yield path
+        return
+
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(name for name in dirs if not name.startswith("."))
+        for name in sorted(files):
+            if name.startswith(".") or name.endswith(IGNORED_SUFFIXES):
+                continue
+            yield Path(root) / name
+
+
+class FileHasher:
+    """
+    SHA-256 de arquivos com cache por (tamanho, mtime): um ZIP de 200 MB
+    que não mudou não é relido a cada execução. Usado só pela thread
+    que agenda as etapas.
+    """
+
+    def __init__(self, cache: Dict[str, List]) -> None:
+        self.cache = cache
+
+    def file_hash(self, path: Path) -> str:
+        stat = path.stat()
+        key = str(path.relative_to(ROOT_DIR))
+        cached = self.cache.get(key)
+
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with path.open("rb") as fin:
+            for chunk in iter(lambda: fin.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+
+        self.cache[key] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def path_hash(self, relative: str) -> str:
+        """
+        Hash de um arquivo ou pasta (nomes relativos + conteúdo).
+        Caminho inexistente tem hash próprio ("ausente").
+        """
+        path = ROOT_DIR / relative
+        if not path.exists():
+            return "ausente"
+
+        digest = hashlib.sha256()
+        for file in iter_files(path):
+            digest.update(str(file.relative_to(path)).encode("utf-8"))
+            digest.update(self.file_hash(file).encode("ascii"))
+        return digest.hexdigest()
+
+
+def stage_fingerprint(stage: Stage, hasher: FileHasher) -> str:
+    """
+    Combina argumentos, versão do código (hash dos módulos) e hash das entradas.
+    """
+    payload = {
+        "argumentos": stage.arguments,
+        "codigo": {path: hasher.path_hash(path) for path in stage.code},
+        "entradas": {path: hasher.path_hash(path) for path in stage.inputs},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def run_stage(stage: Stage) -> Tuple[int, float, Path]:
+    """
+    Roda o main.py da etapa em subprocesso (na pasta dela), com a saída
+    num log próprio — etapas em paralelo não se misturam no console.
+    """
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    log_path = LOG_DIR / f"{stage.name}.log"
+
+    started = time.perf_counter()
+    with log_path.open("w", encoding="utf-8") as log:
+        result = subprocess.run(
+            [sys.executable, "main.py", *stage.arguments],
+            cwd=str(stage.cwd),
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            check=False,
+        )
+    return result.returncode, time.perf_counter() - started, log_path
+
+
+def log_tail(path: Path, lines: int = FAILURE_TAIL_LINES) -> List[str]:
+    with path.open("r", encoding="utf-8", errors="replace") as fin:
+        return fin.read().splitlines()[-lines:]
+
+
+class StageResult:
+    def __init__(self, status: str, seconds: float = 0.0, detail: str = "") -> None:
+        self.status = status
+        self.seconds = seconds
+        self.detail = detail
+
+
+def run_pipeline(
+    stages: List[Stage],
+    jobs: int = DEFAULT_JOBS,
+    force: Optional[Set[str]] = None,
+) -> Dict[str, StageResult]:
+    """
+    Executa o DAG: uma etapa entra na fila quando todas as dependências
+    terminaram; etapas independentes rodam ao mesmo tempo (até `jobs`).
+
+    Uma etapa é pulada quando o fingerprint (argumentos + código + entradas)
+    é o mesmo da última execução bem-sucedida e as saídas existem — exceto
+    as etapas de origem, que sempre rodam. Falha numa etapa bloqueia só as que dependem dela.
+    """
+    force = force or set()
+    state = load_state()
+    hasher = FileHasher(state.setdefault("hashes", {}))
+    results: Dict[str, StageResult] = {}
+    running: Dict[Future, Tuple[Stage, str]] = {}
+
+    def ready_stages() -> List[Stage]:
+        busy = {stage.name for stage, _ in running.values()}
+        return [
+            stage for stage in stages
+            if stage.name not in results and stage.name not in busy
+            and all(dep in results for dep in stage.deps)
+        ]
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        while len(results) < len(stages):
+            for stage in ready_stages():
+                failed = sorted(dep for dep in stage.deps if results[dep].status in ("falhou", "bloqueada"))
+                if failed:
+                    results[stage.name] = StageResult("bloqueada", detail=f"depende de {', '.join(failed)}")
+                    print(f"   ⛔ {stage.name}: bloqueada ({', '.join(failed)} não terminou)", flush=True)
+                    continue
+
+                fingerprint = stage_fingerprint(stage, hasher)
+                previous = state["etapas"].get(stage.name, {}).get("fingerprint")
+                outputs_ok = all((ROOT_DIR / output).exists() for output in stage.outputs)
+
+                forced = stage.source or stage.name in force or "todas" in force
+                if not forced and previous == fingerprint and outputs_ok:
+                    results[stage.name] = StageResult("pulada", detail="entradas e código sem mudança")
+                    print(f"   ⏭️  {stage.name}: sem mudanças", flush=True)
+                    continue
+
+                print(f"   ▶ {stage.name}: main.py {' '.join(stage.arguments)}", flush=True)
+                running[executor.submit(run_stage, stage)] = (stage, fingerprint)
+
+            if not running:
+                continue
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, fingerprint = running.pop(future)
+                code, seconds, log_path = future.result()
+
+                if code == 0:
+                    results[stage.name] = StageResult("executada", seconds)
+                    state["etapas"][stage.name] = {"fingerprint": fingerprint}
+                    save_state(state)
+                    print(f"   ✔ {stage.name} ({seconds:.1f}s)", flush=True)
+                else:
+                    results[stage.name] = StageResult("falhou", seconds, f"código {code}, log em {log_path}")
+                    state["etapas"].pop(stage.name, None)
+                    save_state(state)
+                    print(f"   ✖ {stage.name}: código {code} ({seconds:.1f}s) — últimas linhas de {log_path}:", flush=True)
+                    for line in log_tail(log_path):
+                        print(f"      {line}", flush=True)
+
+    return results
+
+
+def print_report(stages: List[Stage], results: Dict[str, StageResult], wall_seconds: float) -> None:
+    """
+    Relatório de tempo por etapa (na ordem do DAG).
+    """
+    print()
+    print(f"{'Etapa':<16}{'Status':<12}{'Tempo':>9}  Detalhe")
+    print("-" * 60)
+    for stage in stages:
+        result = results[stage.name]
+        seconds = f"{result.seconds:.1f}s" if result.status in ("executada", "falhou") else "-"
+        print(f"{stage.name:<16}{result.status:<12}{seconds:>9}  {result.detail}")
+    print("-" * 60)
+
+    busy = sum(result.seconds for result in results.values())
+    print(f"Tempo total: {wall_seconds:.1f}s (soma das etapas: {busy:.1f}s)")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Executa o Teste 1 + Teste 2 como um DAG, pulando etapas sem mudança."
+    )
+    parser.add_argument(
+        "--trimestres",
+        default=None,
+        help="Janela de trimestres repassada ao Teste 1 (ex: 2024T1:2025T2; padrão: últimos 3).",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help=f"Etapas independentes executadas ao mesmo tempo (padrão: {DEFAULT_JOBS}).",
+    )
+    parser.add_argument(
+        "--jobs-trimestres",
+        type=int,
+        default=4,
+        help="Trimestres em paralelo dentro do Teste 1 (--jobs do teste_1/main.py).",
+    )
+    parser.add_argument(
+        "--forcar",
+        default="",
+        help="Etapas executadas mesmo sem mudança, separadas por vírgula ('todas' para todas).",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    stages = build_stages(args.trimestres, args.jobs_trimestres)
+    force = {name.strip() for name in args.forcar.split(",") if name.strip()}
+
+    unknown = force - {stage.name for stage in stages} - {"todas"}
+    if unknown:
+        raise SystemExit(f"Etapas desconhecidas em --forcar: {', '.join(sorted(unknown))}")
+
+    print("=" * 60)
+    print("🧩 Pipeline ANS (DAG)")
+    for stage in stages:
+        after = f" (depois de {', '.join(sorted(stage.deps))})" if stage.deps else ""
+        print(f"   • {stage.name}{after}")
+    print("=" * 60, flush=True)
+
+    started = time.perf_counter()
+    try:
+        with pipeline_lock():
+            results = run_pipeline(stages, jobs=args.jobs, force=force)
+    except LockHeld as exc:
+        print(f"⏭️  Execução ignorada: {exc}")
+        sys.exit(1)
+
+    print_report(stages, results, time.perf_counter() - started)
+
+    if any(result.status in ("falhou", "bloqueada") for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,464 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urljoin
+
+import requests
+from bs4 import BeautifulSoup
+
+
+def project_root() -> Path:
+    """
+    Retorna a raiz do projeto assumindo a estrutura:
+    <raiz>/teste_1, <raiz>/teste_2 e <raiz>/pipeline
+    """
+    return Path(__file__).resolve().parents[1]
+
+
+ROOT_DIR = project_root()
+
+OUTPUT_DIR = ROOT_DIR / "pipeline" / "output"
+
+# O que já foi visto na ANS (validadores HTTP, hash das listagens e dos ZIPs)
+STATE_FILE = OUTPUT_DIR / "estado_watcher.json"
+STATE_VERSION = 1
+
+# Impede dois ciclos ao mesmo tempo (ex: cron + execução manual)
+LOCK_FILE = OUTPUT_DIR / "watcher.lock"
+
+# Mesmas variáveis de ambiente lidas pelo teste_1 e pelo teste_2
+# (apontar as três etapas para um espelho local)
+ANS_BASE_URL = os.environ.get(
+    "ANS_BASE_URL",
+    "https://dadosabertos.ans.gov.br/FTP/PDA/demonstracoes_contabeis/"
+)
+ANS_CADOP_BASE_URL = os.environ.get(
+    "ANS_CADOP_BASE_URL",
+    "https://dadosabertos.ans.gov.br/FTP/PDA/operadoras_de_plano_de_saude_ativas/"
+)
+
+# Intervalo entre verificações (segundos)
+DEFAULT_INTERVAL = 6 * 60 * 60
+
+# Pastas de ano verificadas a cada ciclo (as mais recentes; anos antigos
+# só mudam em republicações raras — use --anos-recentes para ampliar)
+DEFAULT_RECENT_YEARS = 2
+
+REQUEST_TIMEOUT = 30
+
+ZIP_PATTERN = re.compile(r"([1-4])T(20\d{2})\.zip", re.IGNORECASE)
+
+
+class LockHeld(Exception):
+    """
+    Outro ciclo do watcher (ainda vivo) está com o lock.
+    """
+
+
+def pid_alive(pid: int) -> bool:
+    """
+    True se existe processo com esse PID (lock de um processo morto é descartado).
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+@contextmanager
+def pipeline_lock(path: Path = LOCK_FILE) -> Iterator[None]:
+    """
+    Lock por arquivo criado com O_EXCL (atômico), contendo o PID do dono.
+    Um lock deixado por processo que já morreu é removido e retomado.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    for _ in range(2):
+        try:
+            fd = os.open(str(path), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                owner = int(path.read_text(encoding="ascii").strip() or 0)
+            except (OSError, ValueError):
+                owner = 0
+
+            if owner and pid_alive(owner):
+                raise LockHeld(f"pipeline já em execução (PID {owner}, lock em {path})")
+
+            # Lock órfão: remove e tenta de novo
+            path.unlink(missing_ok=True)
+    else:
+        raise LockHeld(f"não foi possível obter o lock em {path}")
+
+    with os.fdopen(fd, "w", encoding="ascii") as fout:
+        fout.write(str(os.getpid()))
+
+    try:
+        yield
+    finally:
+        path.unlink(missing_ok=True)
+
+
+def load_state(path: Path = STATE_FILE) -> Dict[str, Dict]:
+    if not path.exists():
+        return {"version": STATE_VERSION, "paginas": {}, "arquivos": {}}
+
+    with path.open("r", encoding="utf-8") as fin:
+        state = json.load(fin)
+
+    if state.get("version") != STATE_VERSION:
+        return {"version": STATE_VERSION, "paginas": {}, "arquivos": {}}
+    return state
+
+
+def save_state(state: Dict[str, Dict], path: Path = STATE_FILE) -> None:
+    """
+    Grava o estado de forma atômica (arquivo temporário + os.replace).
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(path.name + ".tmp")
+
+    with temp_path.open("w", encoding="utf-8") as fout:
+        json.dump(state, fout, ensure_ascii=False, indent=2, sort_keys=True)
+
+    os.replace(temp_path, path)
+
+
+def parse_links(html: str) -> List[str]:
+    """
+    Links (href) de uma listagem de diretório.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    return [link.get("href") for link in soup.find_all("a") if link.get("href")]
+
+
+def fetch_listing(
+    session: requests.Session,
+    url: str,
+    seen: Optional[Dict[str, str]],
+) -> Tuple[bool, Optional[List[str]], Dict[str, str]]:
+    """
+    GET condicional de uma listagem (If-None-Match / If-Modified-Since).
+
+    Retorna (mudou, links, validadores). Com 304 a listagem não é baixada
+    (links = None). Servidores sem ETag/Last-Modified ainda são comparados
+    pelo hash do HTML.
+    """
+    seen = seen or {}
+    headers = {}
+    if seen.get("etag"):
+        headers["If-None-Match"] = seen["etag"]
+    if seen.get("last_modified"):
+        headers["If-Modified-Since"] = seen["last_modified"]
+
+    response = session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    if response.status_code == 304:
+        return False, None, seen
+
+    response.raise_for_status()
+
+    current = {
+        "etag": response.headers.get("ETag", ""),
+        "last_modified": response.headers.get("Last-Modified", ""),
+        "sha256": hashlib.sha256(response.content).hexdigest(),
+    }
+    return current["sha256"] != seen.get("sha256"), parse_links(response.text), current
+
+
+def file_signature(session: requests.Session, url: str) -> str:
+    """
+    Assinatura barata de um arquivo remoto (HEAD): ETag, Last-Modified e tamanho.
+    """
+    response = session.head(url, timeout=REQUEST_TIMEOUT, allow_redirects=True)
+    response.raise_for_status()
+
+    return "|".join(
+        response.headers.get(name, "")
+        for name in ("ETag", "Last-Modified", "Content-Length")
+    )
+
+
+class Observation:
+    """
+    Resultado de um ciclo: o que mudou e o estado a gravar se as etapas
+    terminarem bem (se falharem, o próximo ciclo detecta de novo).
+    """
+
+    def __init__(self, state: Dict[str, Dict]) -> None:
+        self.pages: Dict[str, Dict[str, str]] = dict(state.get("paginas", {}))
+        self.files: Dict[str, str] = dict(state.get("arquivos", {}))
+        self.years: List[int] = list(state.get("anos", []))
+        self.quarters: Set[Tuple[int, int]] = set()
+        self.cadop_changed = False
+        self.requests = 0
+
+    def to_state(self) -> Dict[str, Dict]:
+        return {
+            "version": STATE_VERSION,
+            "paginas": self.pages,
+            "arquivos": self.files,
+            "anos": self.years,
+        }
+
+
+def check_listing(
+    session: requests.Session,
+    observation: Observation,
+    url: str,
+) -> Optional[List[str]]:
+    """
+    Listagem via GET condicional, guardando os validadores na observação.
+    None = listagem sem mudança.
+    """
+    observation.requests += 1
+    changed, links, validators = fetch_listing(session, url, observation.pages.get(url))
+    observation.pages[url] = validators
+    return links if changed else None
+
+
+def check_accounting(
+    session: requests.Session,
+    observation: Observation,
+    recent_years: int,
+    base_url: str = ANS_BASE_URL,
+) -> None:
+    """
+    Verifica o índice de demonstrações contábeis e as pastas dos anos
+    mais recentes (GET condicional) e os ZIPs dessas pastas (HEAD).
+    Cada ZIP novo ou com assinatura diferente marca o seu trimestre
+    como alterado.
+    """
+    first_run = not observation.years
+    known_years = set(observation.years)
+
+    links = check_listing(session, observation, base_url)
+
+    if links is None:
+        # Índice sem mudança: usa os anos já conhecidos
+        years = sorted(known_years)
+    else:
+        years = sorted(int(link.strip("/")) for link in links if link.endswith("/") and link.strip("/").isdigit())
+        observation.years = years
+
+    to_check = set(years[-recent_years:]) if recent_years > 0 else set(years)
+    if not first_run:
+        # Ano que apareceu no índice depois da última verificação
+        to_check |= set(years) - known_years
+
+    for year in sorted(to_check):
+        year_url = f"{base_url}{year}/"
+        year_links = check_listing(session, observation, year_url)
+
+        if year_links is None:
+            # Listagem sem mudança: confere os ZIPs já conhecidos, pois um
+            # ZIP republicado com o mesmo nome nem sempre altera a listagem
+            zip_urls = sorted(url for url in observation.files if url.startswith(year_url))
+        else:
+            zip_urls = [urljoin(year_url, link) for link in year_links]
+
+        for zip_url in zip_urls:
+            match = ZIP_PATTERN.search(zip_url.rsplit("/", 1)[-1])
+            if not match:
+                continue
+
+            observation.requests += 1
+            signature = file_signature(session, zip_url)
+
+            if observation.files.get(zip_url) != signature:
+                observation.files[zip_url] = signature
+                observation.quarters.add((int(match.group(2)), int(match.group(1))))
+
+
+def check_cadop(
+    session: requests.Session,
+    observation: Observation,
+    base_url: str = ANS_CADOP_BASE_URL,
+) -> None:
+    """
+    Verifica a pasta de operadoras ativas: CSV novo ou com assinatura
+    diferente (a ANS costuma manter o nome do arquivo) marca o CADOP.
+    """
+    links = check_listing(session, observation, base_url)
+
+    csv_urls = sorted(
+        urljoin(base_url, link) for link in (links or []) if link.lower().endswith(".csv")
+    )
+    if links is None:
+        csv_urls = sorted(url for url in observation.files if url.startswith(base_url))
+
+    if not csv_urls:
+        return
+
+    latest = csv_urls[-1]
+    observation.requests += 1
+    signature = file_signature(session, latest)
+
+    if observation.files.get(latest) != signature:
+        observation.files[latest] = signature
+        observation.cadop_changed = True
+
+
+def quarter_window_text(quarters: Set[Tuple[int, int]]) -> str:
+    """
+    Janela no formato do --trimestres (ex: 2025T2:2025T3).
+    """
+    start, end = min(quarters), max(quarters)
+    return f"{start[0]}T{start[1]}:{end[0]}T{end[1]}"
+
+
+def plan_stages(observation: Observation) -> List[Tuple[str, Path, List[str]]]:
+    """
+    Etapas a rodar: (nome, pasta, argumentos do main.py).
+
+    - trimestre novo/alterado: Teste 1 só com esses trimestres (ZIPs
+      baixados de novo) e Teste 2 incremental sobre eles;
+    - CADOP alterado: Teste 2 com --alteracoes-cadop (só as linhas das
+      operadoras que mudaram); junto com trimestres novos, Teste 2 sobre o
+      dataset inteiro.
+
+    O Teste 2 roda sempre com --incremental, para manter o estado da
+    agregação em dia para o próximo ciclo.
+    """
+    stages: List[Tuple[str, Path, List[str]]] = []
+
+    if observation.quarters:
+        window = quarter_window_text(observation.quarters)
+        stages.append(("teste_1", ROOT_DIR / "teste_1", ["--trimestres", window, "--atualizar"]))
+
+    if observation.cadop_changed and not observation.quarters:
+        stages.append(("teste_2", ROOT_DIR / "teste_2", ["--alteracoes-cadop", "--atualizar-cadop"]))
+    elif observation.cadop_changed:
+        stages.append(("teste_2", ROOT_DIR / "teste_2", ["--incremental", "--atualizar-cadop"]))
+    elif observation.quarters:
+        stages.append(("teste_2", ROOT_DIR / "teste_2", ["--incremental", "--trimestres", window]))
+
+    return stages
+
+
+def run_stage(name: str, cwd: Path, arguments: List[str]) -> int:
+    """
+    Roda o main.py de uma etapa em subprocesso (na pasta dela, pois o
+    Teste 1 usa caminhos relativos). Retorna o código de saída.
+    """
+    command = [sys.executable, "main.py", *arguments]
+    print(f"   ▶ {name}: {' '.join(command[1:])}", flush=True)
+
+    started = time.perf_counter()
+    result = subprocess.run(command, cwd=str(cwd), check=False)
+    print(f"   {'✔' if result.returncode == 0 else '✖'} {name}: código {result.returncode} "
+          f"({time.perf_counter() - started:.1f}s)", flush=True)
+    return result.returncode
+
+
+def run_cycle(recent_years: int = DEFAULT_RECENT_YEARS, dry_run: bool = False) -> bool:
+    """
+    Um ciclo completo: verifica a ANS, roda as etapas afetadas e, se
+    todas terminarem bem, grava o novo estado. Retorna True em sucesso.
+    """
+    observation = Observation(load_state())
+
+    with requests.Session() as session:
+        check_accounting(session, observation, recent_years)
+        check_cadop(session, observation)
+
+    stages = plan_stages(observation)
+    quarters = ", ".join(f"{year}/{quarter}T" for year, quarter in sorted(observation.quarters)) or "nenhum"
+    print(f"🔍 {observation.requests} requisições | trimestres alterados: {quarters} | "
+          f"CADOP alterado: {'sim' if observation.cadop_changed else 'não'}", flush=True)
+
+    if not stages:
+        save_state(observation.to_state())
+        print("   ✔ Nada mudou: nenhuma etapa executada.", flush=True)
+        return True
+
+    if dry_run:
+        for name, _, arguments in stages:
+            print(f"   (dry-run) {name}: main.py {' '.join(arguments)}", flush=True)
+        return True
+
+    for name, cwd, arguments in stages:
+        if run_stage(name, cwd, arguments) != 0:
+            print(f"   ✖ Etapa {name} falhou: estado não gravado (será tentado no próximo ciclo).", flush=True)
+            return False
+
+    save_state(observation.to_state())
+    return True
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Watcher: consulta a ANS periodicamente e roda só as etapas afetadas."
+    )
+    parser.add_argument(
+        "--intervalo",
+        type=int,
+        default=DEFAULT_INTERVAL,
+        help=f"Segundos entre verificações (padrão: {DEFAULT_INTERVAL}).",
+    )
+    parser.add_argument(
+        "--uma-vez",
+        action="store_true",
+        help="Faz um único ciclo e sai (para cron / agendador externo).",
+    )
+    parser.add_argument(
+        "--anos-recentes",
+        type=int,
+        default=DEFAULT_RECENT_YEARS,
+        help=f"Pastas de ano verificadas por ciclo (padrão: {DEFAULT_RECENT_YEARS}; 0 = todas).",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Só mostra as etapas que seriam executadas (não grava o estado).",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+
+    print("=" * 60)
+    print("👀 Watcher do pipeline ANS")
+    print(f"   Demonstrações contábeis: {ANS_BASE_URL}")
+    print(f"   CADOP: {ANS_CADOP_BASE_URL}")
+    print("=" * 60, flush=True)
+
+    while True:
+        ok = True
+        try:
+            with pipeline_lock():
+                ok = run_cycle(args.anos_recentes, args.dry_run)
+        except LockHeld as exc:
+            print(f"⏭️  Ciclo ignorado: {exc}", flush=True)
+        except requests.RequestException as exc:
+            ok = False
+            print(f"⚠️  Falha ao consultar a ANS: {exc}", flush=True)
+
+        if args.uma_vez:
+            sys.exit(0 if ok else 1)
+
+        try:
+            time.sleep(max(1, args.intervalo))
+        except KeyboardInterrupt:
+            print("\n👋 Encerrando watcher...")
+            return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import csv
+import os
+import sys
+from pathlib import Path
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.ipc as ipc
+except ImportError:  # pyarrow é opcional: só é necessário para o formato arrow
+    pa = None
+    pc = None
+    ipc = None
+
+# Arquivos intermediários em Arrow IPC (formato "file", o mesmo do
+# Feather v2), como alternativa aos CSVs entre as etapas:
+# - Ano e Trimestre são gravados como inteiros e ValorDespesas como float64
+#   (TYPED_COLUMNS); as demais colunas, como texto. O texto de cada número
+#   (str do valor) é o mesmo que vai para o CSV, então quem lê linha a
+#   linha recebe o mesmo texto e cada etapa produz exatamente o mesmo
+#   resultado nos dois formatos;
+# - a leitura mapeia o arquivo em memória: sem separar campos nem tratar
+#   aspas, e as colunas podem ser usadas sem cópia (ver teste_2/columnar.py);
+# - sem compressão, para o mapeamento em memória valer.
+#
+# Cada tabela tem um caminho "CSV" de referência (ex: despesas_validadas.csv);
+# a versão Arrow fica ao lado (despesas_validadas.arrow). Quem lê usa a que
+# existir (resolve_table); quem grava apaga a do outro formato.
+#
+# Este arquivo é copiado sem alterações em teste_1, teste_2 e teste_3
+# (mesma estratégia do dataset.py).
+
+FORMATS = ["csv", "arrow"]
+DELIMITER = ";"
+ARROW_SUFFIX = ".arrow"
+
+# Linhas por record batch (também a unidade de divisão da leitura paralela)
+BATCH_ROWS = 65_536
+
+# Colunas numéricas (nome -> tipo no Arrow); as demais são texto
+TYPED_COLUMNS = {"Ano": "int16", "Trimestre": "int16", "ValorDespesas": "float64"}
+
+
+def require_pyarrow() -> None:
+    """
+    Falha com mensagem clara quando pyarrow não está instalado.
+    """
+    if pa is None:
+        raise RuntimeError(
+            "O formato arrow precisa do pyarrow. Instale com: pip install pyarrow "
+            "(ou use o formato padrão: --formato csv)."
+        )
+
+
+def arrow_path_for(csv_path: Path) -> Path:
+    """
+    Versão Arrow de uma tabela: <nome>.arrow ao lado do <nome>.csv.
+    """
+    return Path(csv_path).with_suffix(ARROW_SUFFIX)
+
+
+def resolve_table(csv_path: Path) -> Path:
+    """
+    Arquivo a ler de uma tabela: o .arrow, se existir, senão o CSV.
+    """
+    arrow_path = arrow_path_for(csv_path)
+    return arrow_path if arrow_path.exists() else Path(csv_path)
+
+
+def table_exists(csv_path: Path) -> bool:
+    return Path(csv_path).exists() or arrow_path_for(csv_path).exists()
+
+
+def remove_table(csv_path: Path) -> None:
+    """
+    Apaga a tabela nos dois formatos.
+    """
+    for path in (Path(csv_path), arrow_path_for(csv_path)):
+        if path.exists():
+            path.unlink()
+
+
+def move_table(source_csv_path: Path, csv_path: Path) -> None:
+    """
+    Publica uma tabela gravada em outro caminho (ex: temporário) no lugar
+    de csv_path, nos dois formatos: o que não veio da origem é apagado.
+    """
+    for source, target in ((Path(source_csv_path), Path(csv_path)), (arrow_path_for(source_csv_path), arrow_path_for(csv_path))):
+        if source.exists():
+            os.replace(source, target)
+        elif target.exists():
+            target.unlink()
+
+
+def is_arrow(path: Path) -> bool:
+    return Path(path).suffix == ARROW_SUFFIX
+
+
+def open_arrow(path: Path) -> "ipc.RecordBatchFileReader":
+    """
+    Abre um arquivo Arrow mapeado em memória (nada é lido até o uso).
+    """
+    require_pyarrow()
+    return ipc.open_file(pa.memory_map(str(path), "r"))
+
+
+def read_arrow_table(path: Path) -> "pa.Table":
+    """
+    Tabela inteira, sem cópia: as colunas apontam para o arquivo mapeado.
+    """
+    return open_arrow(path).read_all()
+
+
+def arrow_batch_count(path: Path) -> int:
+    return open_arrow(path).num_record_batches
+
+
+def arrow_row_count(path: Path) -> int:
+    reader = open_arrow(path)
+    return sum(reader.get_batch(index).num_rows for index in range(reader.num_record_batches))
+
+
+def read_fieldnames(path: Path) -> List[str]:
+    """
+    Colunas de uma tabela (CSV ou Arrow); lista vazia se não houver cabeçalho.
+    """
+    if is_arrow(path):
+        return list(open_arrow(path).schema.names)
+
+    with Path(path).open(mode="r", encoding="utf-8", newline="") as file:
+        return next(csv.reader(file, delimiter=DELIMITER), [])
+
+
+def is_text_type(data_type: "pa.DataType") -> bool:
+    return pa.types.is_string(data_type) or pa.types.is_large_string(data_type)
+
+
+def batch_rows(batch: "pa.RecordBatch") -> Iterator[Dict[str, str]]:
+    """
+    Linhas de um record batch como dicionários de texto (como no
+    csv.DictReader): as colunas numéricas voltam ao texto do CSV.
+    """
+    names = batch.schema.names
+    columns = []
+    for position, field in enumerate(batch.schema):
+        values = batch.column(position).to_pylist()
+        if not is_text_type(field.type):
+            values = [text_value(value) for value in values]
+        columns.append(values)
+
+    for values in zip(*columns):
+        yield dict(zip(names, values))
+
+
+def iter_arrow_rows(path: Path, start: int = 0, end: Optional[int] = None) -> Iterator[Dict[str, str]]:
+    """
+    Linhas (dicionários, como no csv.DictReader) dos record batches
+    [start, end) de um arquivo Arrow.
+    """
+    reader = open_arrow(path)
+    end = reader.num_record_batches if end is None else min(end, reader.num_record_batches)
+
+    for index in range(start, end):
+        yield from batch_rows(reader.get_batch(index))
+
+
+def iter_matching_arrow_rows(path: Path, column: str, values: Set[str]) -> Iterator[Dict[str, str]]:
+    """
+    Só as linhas em que `column` está em `values`: o filtro roda no
+    pyarrow, batch a batch, e só as linhas selecionadas viram dicionários.
+    """
+    reader = open_arrow(path)
+    if column not in reader.schema.names:
+        raise ValueError(f"Coluna {column} não encontrada em {path}.")
+
+    value_set = pa.array(sorted(values), type=pa.string())
+    for index in range(reader.num_record_batches):
+        batch = reader.get_batch(index)
+        selected = batch.filter(pc.is_in(pc.utf8_trim_whitespace(batch.column(column)), value_set=value_set))
+        yield from batch_rows(selected)
+
+
+def iter_rows(path: Path, require_header: bool = False) -> Iterator[Dict[str, str]]:
+    """
+    Linhas de uma tabela, em streaming, no formato do arquivo.
+    Com require_header=True, um CSV sem cabeçalho levanta ValueError.
+    """
+    if is_arrow(path):
+        yield from iter_arrow_rows(path)
+        return
+
+    with Path(path).open(mode="r", encoding="utf-8", newline="") as file:
+        reader = csv.DictReader(file, delimiter=DELIMITER)
+        if require_header and not reader.fieldnames:
+            raise ValueError("CSV de entrada não possui cabeçalho.")
+        yield from reader
+
+
+def text_value(value: object) -> str:
+    """
+    Mesmo texto que o csv.writer grava para o valor.
+    """
+    return "" if value is None else str(value)
+
+
+def typed_value(name: str, value: object) -> object:
+    """
+    Valor de uma coluna de TYPED_COLUMNS para o Arrow: vazio vira nulo.
+    Levanta ValueError se o texto não voltar igual do número (ex: '1.234,56'
+    ou '2024.0'), porque a leitura devolveria outro texto.
+    """
+    text = text_value(value)
+    if not text:
+        return None
+
+    try:
+        number = float(text) if TYPED_COLUMNS[name] == "float64" else int(text)
+    except ValueError:
+        number = None
+
+    if number is None or str(number) != text:
+        raise ValueError(
+            f"Valor {text!r} da coluna {name} não é gravado sem perda no formato arrow; "
+            "use --formato csv."
+        )
+    return number
+
+
+class ArrowWriter:
+    """
+    Grava linhas (dicionários) num arquivo Arrow, em record batches de
+    `batch_rows` linhas: as colunas de TYPED_COLUMNS com o tipo numérico,
+    as demais como texto. O arquivo é escrito num temporário e só
+    substitui o anterior no close() (os.replace).
+    """
+
+    def __init__(self, path: Path, fieldnames: List[str], batch_rows: int = BATCH_ROWS) -> None:
+        require_pyarrow()
+        self.path = Path(path)
+        self.fieldnames = list(fieldnames)
+        self.typed = [name in TYPED_COLUMNS for name in self.fieldnames]
+        self.schema = pa.schema([
+            (name, pa.type_for_alias(TYPED_COLUMNS.get(name, "string"))) for name in self.fieldnames
+        ])
+        self.batch_rows = max(1, batch_rows)
+        self.columns: List[List[object]] = [[] for _ in self.fieldnames]
+        self.pending = 0
+        self.rows = 0
+
+        self.temp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        self.sink = pa.OSFile(str(self.temp_path), "wb")
+        self.writer = ipc.new_file(self.sink, self.schema)
+
+    def __enter__(self) -> "ArrowWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def writerow(self, row: Dict[str, object]) -> None:
+        for values, name, typed in zip(self.columns, self.fieldnames, self.typed):
+            value = row.get(name)
+            values.append(typed_value(name, value) if typed else text_value(value))
+        self.pending += 1
+        self.rows += 1
+
+        if self.pending >= self.batch_rows:
+            self.flush()
+
+    def writerows(self, rows: Iterable[Dict[str, object]]) -> None:
+        for row in rows:
+            self.writerow(row)
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        arrays = [pa.array(values, type=field.type) for values, field in zip(self.columns, self.schema)]
+        self.writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        self.columns = [[] for _ in self.fieldnames]
+        self.pending = 0
+
+    def close(self) -> Path:
+        self.flush()
+        self.writer.close()
+        self.sink.close()
+        os.replace(self.temp_path, self.path)
+        return self.path
+
+    def abort(self) -> None:
+        self.sink.close()
+        if self.temp_path.exists():
+            self.temp_path.unlink()
+
+
+class TableFormat:
+    """
+    Formato das tabelas intermediárias: "csv" (padrão) ou "arrow".
+    Com export_csv=True o formato arrow grava também o CSV (exportação).
+    """
+
+    def __init__(self, name: str = "csv", export_csv: bool = False) -> None:
+        if name not in FORMATS:
+            raise ValueError(f"Formato desconhecido: {name} (use: {', '.join(FORMATS)})")
+        if name == "arrow":
+            require_pyarrow()
+        self.name = name
+        self.export_csv = export_csv
+
+    def describe(self) -> str:
+        if self.name == "arrow":
+            return "arrow + csv" if self.export_csv else "arrow"
+        return self.name
+
+    def writer(self, csv_path: Path, fieldnames: List[str], force_csv: bool = False) -> "TableWriter":
+        """
+        Abre a gravação de uma tabela; force_csv grava o CSV mesmo no
+        formato arrow (ex: CSV que vai ganhar índice de offsets).
+        """
+        return TableWriter(csv_path, fieldnames, self.name, self.export_csv or force_csv)
+
+
+class TableWriter:
+    """
+    Grava uma tabela no formato escolhido com a interface do csv.DictWriter
+    (writerow / writerows). No close(), a versão no outro formato que
+    sobrou de uma execução anterior é apagada.
+
+    O CSV também é escrito num temporário e publicado com os.replace: quem
+    estiver lendo o arquivo antigo (ex: o serviço de consulta, que mapeia
+    o CSV em memória) continua com o arquivo inteiro, sem truncamento.
+    """
+
+    def __init__(self, csv_path: Path, fieldnames: List[str], file_format: str = "csv", export_csv: bool = False) -> None:
+        self.csv_path = Path(csv_path)
+        self.arrow_path = arrow_path_for(self.csv_path)
+        self.file_format = file_format
+        self.write_csv = file_format == "csv" or export_csv
+        self.path = self.arrow_path if file_format == "arrow" else self.csv_path
+
+        self.arrow_writer = ArrowWriter(self.arrow_path, fieldnames) if file_format == "arrow" else None
+        self.csv_file = None
+        self.csv_writer = None
+        self.csv_temp_path = self.csv_path.with_name(f".{self.csv_path.name}.{os.getpid()}.tmp")
+        if self.write_csv:
+            self.csv_file = self.csv_temp_path.open(mode="w", encoding="utf-8", newline="")
+            self.csv_writer = csv.DictWriter(self.csv_file, fieldnames=fieldnames, delimiter=DELIMITER)
+            self.csv_writer.writeheader()
+
+    def __enter__(self) -> "TableWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def writerow(self, row: Dict[str, object]) -> None:
+        if self.arrow_writer is not None:
+            self.arrow_writer.writerow(row)
+        if self.csv_writer is not None:
+            self.csv_writer.writerow(row)
+
+    def writerows(self, rows: Iterable[Dict[str, object]]) -> None:
+        for row in rows:
+            self.writerow(row)
+
+    def close(self) -> Path:
+        if self.csv_file is not None:
+            self.csv_file.close()
+            os.replace(self.csv_temp_path, self.csv_path)
+        if self.arrow_writer is not None:
+            self.arrow_writer.close()
+
+        stale = self.arrow_path if self.file_format == "csv" else (None if self.write_csv else self.csv_path)
+        if stale is not None and stale.exists():
+            stale.unlink()
+        return self.path
+
+    def abort(self) -> None:
+        if self.csv_file is not None:
+            self.csv_file.close()
+            if self.csv_temp_path.exists():
+                self.csv_temp_path.unlink()
+        if self.arrow_writer is not None:
+            self.arrow_writer.abort()
+
+
+def export_csv(arrow_path: Path, csv_path: Optional[Path] = None) -> Tuple[Path, int]:
+    """
+    Converte um arquivo Arrow para CSV (mesmo conteúdo do formato csv:
+    as colunas numéricas voltam a texto só aqui e na leitura por linhas).
+    Retorna (CSV gravado, linhas).
+    """
+    csv_path = Path(csv_path) if csv_path is not None else Path(arrow_path).with_suffix(".csv")
+    count = 0
+
+    with csv_path.open(mode="w", encoding="utf-8", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=read_fieldnames(arrow_path), delimiter=DELIMITER)
+        writer.writeheader()
+        for row in iter_arrow_rows(arrow_path):
+            writer.writerow(row)
+            count += 1
+
+    return csv_path, count
+
+
+if __name__ == "__main__":
+    # Uso: python arrow_io.py <arquivo.arrow> [saida.csv]
+    # Exporta uma tabela intermediária em Arrow para CSV.
+    if len(sys.argv) not in (2, 3):
+        sys.exit("Uso: python arrow_io.py <arquivo.arrow> [saida.csv]")
+
+    try:
+        exported, total = export_csv(Path(sys.argv[1]), Path(sys.argv[2]) if len(sys.argv) == 3 else None)
+    except (RuntimeError, OSError, ValueError) as exc:
+        sys.exit(f"❌ {exc}")
+    print(f"✅ CSV exportado: {exported} ({total} linhas)")
@@ -0,0 +1,157 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+import threading
+import time
+import zipfile
+
+from downloader import download_quarter_zips
+from extractor import extract_all_zips
+from file_reader import read_file
+from expense_filter import AccountIndex, filter_expense_rows
+from deduplicator import RowDeduplicator
+
+
+# Quantidade padrão de trimestres processados ao mesmo tempo
+DEFAULT_JOBS = 4
+
+_print_lock = threading.Lock()
+
+
+def log(message: str) -> None:
+    """
+    Print protegido por lock (várias threads escrevem no console).
+    """
+    with _print_lock:
+        print(message, flush=True)
+
+
+def quarter_label(year: int, quarter: int) -> str:
+    return f"{year}/{quarter}T"
+
+
+def process_quarter(
+    year: int,
+    quarter: int,
+    urls: List[str],
+    index: Optional[AccountIndex] = None,
+    deduplicator: Optional[RowDeduplicator] = None,
+    refresh: bool = False
+) -> List[Dict[str, object]]:
+    """
+    Processa um trimestre inteiro:
+    download -> extração -> leitura -> filtro das contas do catálogo
+    (uma única leitura de cada arquivo, qualquer que seja o número de contas),
+    descartando as linhas já vistas em outro arquivo (se houver deduplicador).
+
+    Retorna os registros filtrados, na ordem dos arquivos.
+    """
+    downloaded = download_quarter_zips(year, quarter, urls, refresh)
+
+    try:
+        extracted_files = extract_all_zips(downloaded)
+    except zipfile.BadZipFile:
+        # Remove o ZIP corrompido do cache para ser baixado de novo na próxima execução
+        for _, _, zip_path in downloaded:
+            if not zipfile.is_zipfile(zip_path):
+                os.remove(zip_path)
+        raise
+
+    rows_of_quarter: List[Dict[str, object]] = []
+
+    for file_year, file_quarter, file_path in extracted_files:
+        rows = read_file(file_path)
+
+        if not rows:
+            log(f"      ⚠ {quarter_label(year, quarter)}: arquivo ignorado "
+                f"(formato não suportado ou vazio): {file_path}")
+            continue
+
+        rows_of_quarter.extend(
+            filter_expense_rows(
+                rows=rows,
+                year=file_year,
+                quarter=file_quarter,
+                index=index,
+                is_duplicate=deduplicator.checker(file_path) if deduplicator else None
+            )
+        )
+
+    return rows_of_quarter
+
+
+def download_only(
+    trimesters: Dict[Tuple[int, int], List[str]],
+    jobs: int = DEFAULT_JOBS,
+    refresh: bool = False
+) -> int:
+    """
+    Só baixa os ZIPs dos trimestres (em paralelo), sem extrair nem filtrar.
+    Usado pela etapa de download do pipeline/runner.py. Retorna a
+    quantidade de ZIPs disponíveis no cache.
+    """
+    def download_one(item: Tuple[Tuple[int, int], List[str]]) -> int:
+        (year, quarter), urls = item
+        downloaded = download_quarter_zips(year, quarter, urls, refresh)
+        log(f"   ✔ {quarter_label(year, quarter)}: {len(downloaded)} ZIP(s)")
+        return len(downloaded)
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        return sum(executor.map(download_one, trimesters.items()))
+
+
+def run_backfill(
+    trimesters: Dict[Tuple[int, int], List[str]],
+    jobs: int = DEFAULT_JOBS,
+    index: Optional[AccountIndex] = None,
+    deduplicator: Optional[RowDeduplicator] = None,
+    refresh: bool = False
+) -> Tuple[Iterator[Dict[str, object]], List[Tuple[int, int, str]]]:
+    """
+    Agenda os trimestres em paralelo (no máximo `jobs` ao mesmo tempo).
+
+    Retorna (registros, falhas):
+    - registros: iterador na mesma ordem de `trimesters`, independente
+      da ordem em que os trimestres terminam (saída determinística);
+    - falhas: lista (ano, trimestre, erro), preenchida enquanto o
+      iterador é consumido. Um trimestre com erro (ex: ZIP corrompido)
+      não interrompe os demais.
+    """
+    failures: List[Tuple[int, int, str]] = []
+    total = len(trimesters)
+    finished = [0]
+
+    def run_one(year: int, quarter: int, urls: List[str]) -> List[Dict[str, object]]:
+        started = time.perf_counter()
+        label = quarter_label(year, quarter)
+
+        try:
+            rows = process_quarter(year, quarter, urls, index, deduplicator, refresh)
+        except Exception as error:
+            with _print_lock:
+                finished[0] += 1
+                print(f"   ✖ [{finished[0]}/{total}] {label}: falhou ({type(error).__name__}: {error})", flush=True)
+            failures.append((year, quarter, f"{type(error).__name__}: {error}"))
+            return []
+
+        with _print_lock:
+            finished[0] += 1
+            print(
+                f"   ✔ [{finished[0]}/{total}] {label}: {len(rows)} registros "
+                f"({len(urls)} ZIP(s), {time.perf_counter() - started:.1f}s)",
+                flush=True
+            )
+        return rows
+
+    def ordered_rows() -> Iterator[Dict[str, object]]:
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            futures: List[Future] = [
+                executor.submit(run_one, year, quarter, urls)
+                for (year, quarter), urls in trimesters.items()
+            ]
+
+            # Consome na ordem de agendamento e libera cada resultado logo após gravar
+            while futures:
+                yield from futures.pop(0).result()
+
+    return ordered_rows(), failures
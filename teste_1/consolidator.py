@@ -1,12 +1,21 @@
 import csv
-import zipfile
+import io
+import os
+from contextlib import ExitStack
 from pathlib import Path
-from typing import List, Dict
+from typing import Dict, Iterable, Optional, Tuple
+
+from archive import CompressionSettings, open_member, zip_archive
+from dataset import DATASET_DIRNAME
+from offset_index import remove_index, sorted_rows, write_index
 
 OUTPUT_DIR = Path("output")
 CSV_FILENAME = "despesas_eventos_sinistros.csv"
 ZIP_FILENAME = "consolidado_despesas.zip"
 
+# Mesmo conteúdo do CSV, particionado por ano/trimestre (ver dataset.py)
+DATASET_DIR = OUTPUT_DIR / DATASET_DIRNAME
+
 
 def ensure_output_dir() -> None:
     """
@@ -15,14 +24,32 @@ def ensure_output_dir() -> None:
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
 
-def write_csv(data: List[Dict[str, object]]) -> Path:
+def write_zip(
+    data: Iterable[Dict[str, object]],
+    settings: Optional[CompressionSettings] = None,
+    keep_csv: bool = False,
+    sort_by_operator: bool = False
+) -> Tuple[Path, Optional[Path]]:
     """
-    Gera o arquivo CSV consolidado.
-    Saída correta: REG_ANS, Ano, Trimestre, ValorDespesas
+    Grava o CSV consolidado direto dentro do ZIP final, em streaming:
+    as linhas são comprimidas conforme chegam, sem CSV intermediário no disco.
+    Saída correta: REG_ANS, Ano, Trimestre, ValorDespesas, Conta
+
+    Com keep_csv=True também grava o CSV puro em output/ (mesmo conteúdo),
+    num temporário publicado com os.replace no final: quem estiver lendo
+    o CSV antigo (mapeado em memória pelo índice de offsets) não o vê
+    truncado.
+
+    Com sort_by_operator=True as linhas saem ordenadas por (REG_ANS, Ano,
+    Trimestre) — ordenação externa, ver offset_index.py — e o CSV puro
+    ganha o índice <csv>.idx para consultar uma operadora sem varrer o arquivo.
+    Retorna (caminho do ZIP, caminho do CSV ou None).
     """
     ensure_output_dir()
 
-    csv_path = OUTPUT_DIR / CSV_FILENAME
+    zip_path = OUTPUT_DIR / ZIP_FILENAME
+    csv_path = OUTPUT_DIR / CSV_FILENAME if keep_csv else None
+    csv_temp_path = OUTPUT_DIR / f".{CSV_FILENAME}.{os.getpid()}.tmp"
 
     fieldnames = [
         "REG_ANS",
@@ -30,31 +57,39 @@ def write_csv(data: List[Dict[str, object]]) -> Path:
         "RazaoSocial",
         "Ano",
         "Trimestre",
-        "ValorDespesas"
+        "ValorDespesas",
+        "Conta"
     ]
 
-    with csv_path.open(mode="w", newline="", encoding="utf-8") as csv_file:
-        writer = csv.DictWriter(
-            csv_file,
-            fieldnames=fieldnames,
-            delimiter=";"
-        )
-        writer.writeheader()
-        writer.writerows(data)
+    try:
+        with ExitStack() as stack:
+            zip_file = stack.enter_context(zip_archive(zip_path))
+            member = stack.enter_context(open_member(zip_file, CSV_FILENAME, settings))
+            text = stack.enter_context(io.TextIOWrapper(member, encoding="utf-8", newline=""))
 
-    return csv_path
+            writers = [csv.DictWriter(text, fieldnames=fieldnames, delimiter=";")]
 
+            if csv_path is not None:
+                csv_file = stack.enter_context(csv_temp_path.open(mode="w", newline="", encoding="utf-8"))
+                writers.append(csv.DictWriter(csv_file, fieldnames=fieldnames, delimiter=";"))
 
-def zip_result(csv_path: Path) -> Path:
-    """
-    Compacta o CSV final em um arquivo ZIP.
-    """
-    zip_path = OUTPUT_DIR / ZIP_FILENAME
+            for writer in writers:
+                writer.writeheader()
+
+            for row in sorted_rows(data, work_dir=OUTPUT_DIR) if sort_by_operator else data:
+                for writer in writers:
+                    writer.writerow(row)
+    except BaseException:
+        if csv_temp_path.exists():
+            csv_temp_path.unlink()
+        raise
 
-    with zipfile.ZipFile(zip_path, mode="w", compression=zipfile.ZIP_DEFLATED) as zip_file:
-        zip_file.write(
-            filename=csv_path,
-            arcname=csv_path.name
-        )
+    if csv_path is not None:
+        os.replace(csv_temp_path, csv_path)
+        if sort_by_operator:
+            write_index(csv_path)
+        else:
+            # CSV regravado fora de ordem: um índice antigo não vale mais
+            remove_index(csv_path)
 
-    return zip_path
+    return zip_path, csv_path
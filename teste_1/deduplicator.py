@@ -0,0 +1,198 @@
+from typing import Callable, Dict, Optional, Tuple
+import hashlib
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+
+
+# Quantidade de impressões digitais mantidas no conjunto exato em memória;
+# acima disso a deduplicação passa para filtro de Bloom + confirmação em disco
+DEFAULT_EXACT_LIMIT = 1_000_000
+
+# Dimensionamento do filtro de Bloom (capacidade e taxa de falso positivo).
+# Passar da capacidade só aumenta as consultas ao disco, nunca o resultado.
+BLOOM_CAPACITY = 20_000_000
+BLOOM_ERROR_RATE = 0.01
+
+# Impressões novas acumuladas antes de gravar no SQLite
+DISK_BATCH_SIZE = 10_000
+
+BASE_WORK_DIR = "data/tmp"
+
+Fingerprint = Tuple[object, ...]
+
+
+def fingerprint_digest(fingerprint: Fingerprint) -> bytes:
+    """
+    Resume a impressão digital da linha em 16 bytes (blake2b).
+    """
+    text = "\x1f".join(str(part) for part in fingerprint)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class BloomFilter:
+    """
+    Filtro de Bloom de tamanho fixo sobre um bytearray.
+
+    As k posições saem do próprio digest (hashing duplo: h1 + i * h2),
+    sem recalcular hash por posição.
+    """
+
+    def __init__(self, capacity: int = BLOOM_CAPACITY, error_rate: float = BLOOM_ERROR_RATE) -> None:
+        self.size_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.size_bits + 7) // 8)
+
+    def positions(self, digest: bytes):
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size_bits
+
+    def add(self, digest: bytes) -> None:
+        for position in self.positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, digest: bytes) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(digest))
+
+
+class RowDeduplicator:
+    """
+    Descarta linhas repetidas entre arquivos (mesmo trimestre republicado
+    em vários ZIPs, ou a mesma planilha em CSV e XLSX).
+
+    Cada impressão guarda o arquivo da primeira ocorrência: só é descartada
+    a repetição vinda de outro arquivo. Linhas iguais dentro do mesmo
+    arquivo são mantidas (o arquivo pode ter lançamentos repetidos de fato).
+
+    - Até `exact_limit` impressões: dicionário exato em memória
+      (impressão -> arquivo).
+    - Acima disso: filtro de Bloom em memória (tamanho fixo) e as
+      impressões num SQLite temporário. Só um "talvez já vi" do Bloom
+      consulta o disco, então o resultado continua exato.
+
+    Pode ser usado por várias threads (trimestres em paralelo): cada
+    chamada é protegida por lock.
+    """
+
+    def __init__(self, exact_limit: int = DEFAULT_EXACT_LIMIT, work_dir: str = BASE_WORK_DIR) -> None:
+        self.exact_limit = exact_limit
+        self.work_dir = work_dir
+        # Arquivos de origem numerados (o número é o que fica em cada impressão)
+        self.source_ids: Dict[str, int] = {}
+        self.exact: Optional[Dict[bytes, int]] = {}
+        self.bloom: Optional[BloomFilter] = None
+        self.connection: Optional[sqlite3.Connection] = None
+        self.temp_dir: Optional[tempfile.TemporaryDirectory] = None
+        self.pending: Dict[bytes, int] = {}
+        self.duplicates_by_source: Dict[str, int] = {}
+        self.checked = 0
+        self.disk_lookups = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "RowDeduplicator":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        self.close()
+
+    @property
+    def mode(self) -> str:
+        return "exato (memória)" if self.bloom is None else "Bloom + confirmação em disco"
+
+    @property
+    def dropped(self) -> int:
+        return sum(self.duplicates_by_source.values())
+
+    def is_duplicate(self, fingerprint: Fingerprint, source: str) -> bool:
+        """
+        True se a impressão digital já apareceu em outro arquivo
+        (a linha deve ser descartada).
+        """
+        digest = fingerprint_digest(fingerprint)
+
+        with self._lock:
+            self.checked += 1
+            source_id = self.source_ids.setdefault(source, len(self.source_ids))
+
+            if self.bloom is None:
+                first_source = self.exact.setdefault(digest, source_id)
+                if first_source == source_id and len(self.exact) > self.exact_limit:
+                    self._switch_to_disk()
+            else:
+                first_source = self._first_source_on_disk(digest, source_id)
+
+            duplicate = first_source != source_id
+            if duplicate:
+                self.duplicates_by_source[source] = self.duplicates_by_source.get(source, 0) + 1
+
+            return duplicate
+
+    def checker(self, source: str) -> Callable[[Fingerprint], bool]:
+        """
+        Função de verificação presa a um arquivo de origem (para o relatório).
+        """
+        return lambda fingerprint: self.is_duplicate(fingerprint, source)
+
+    def _switch_to_disk(self) -> None:
+        os.makedirs(self.work_dir, exist_ok=True)
+        self.temp_dir = tempfile.TemporaryDirectory(prefix="dedup_", dir=self.work_dir)
+
+        self.connection = sqlite3.connect(
+            os.path.join(self.temp_dir.name, "impressoes.sqlite"),
+            check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.execute(
+            "CREATE TABLE impressoes (digest BLOB PRIMARY KEY, origem INTEGER NOT NULL) WITHOUT ROWID"
+        )
+
+        self.bloom = BloomFilter()
+        for digest in self.exact:
+            self.bloom.add(digest)
+
+        self.connection.executemany("INSERT INTO impressoes VALUES (?, ?)", self.exact.items())
+        self.connection.commit()
+        self.exact = None
+
+    def _first_source_on_disk(self, digest: bytes, source_id: int) -> int:
+        """
+        Arquivo da primeira ocorrência da impressão; se ela é nova,
+        registra source_id e o devolve.
+        """
+        if digest in self.bloom:
+            if digest in self.pending:
+                return self.pending[digest]
+
+            self.disk_lookups += 1
+            found = self.connection.execute(
+                "SELECT origem FROM impressoes WHERE digest = ?", (digest,)
+            ).fetchone()
+            if found:
+                return found[0]
+
+        self.bloom.add(digest)
+        self.pending[digest] = source_id
+        if len(self.pending) >= DISK_BATCH_SIZE:
+            self._flush_pending()
+        return source_id
+
+    def _flush_pending(self) -> None:
+        self.connection.executemany("INSERT INTO impressoes VALUES (?, ?)", self.pending.items())
+        self.connection.commit()
+        self.pending.clear()
+
+    def close(self) -> None:
+        """
+        Libera o SQLite temporário (se a deduplicação chegou a usar o disco).
+        """
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        if self.temp_dir is not None:
+            self.temp_dir.cleanup()
+            self.temp_dir = None
@@ -3,9 +3,14 @@ import os
 import re
 import requests
 
+from dataset import QuarterWindow
 from utils import list_links
 
-BASE_URL = "https://dadosabertos.ans.gov.br/FTP/PDA/demonstracoes_contabeis/"
+# ANS_BASE_URL permite apontar para um espelho local (testes / watcher)
+BASE_URL = os.environ.get(
+    "ANS_BASE_URL",
+    "https://dadosabertos.ans.gov.br/FTP/PDA/demonstracoes_contabeis/"
+)
 BASE_DOWNLOAD_DIR = "data/raw/zips"
 
 
@@ -54,24 +59,44 @@ def get_zip_files_for_year(year: int) -> Dict[Tuple[int, int], List[str]]:
     return result
 
 
-def get_last_three_trimesters_with_zips() -> Dict[Tuple[int, int], List[str]]:
+def get_trimesters_with_zips(
+    window: QuarterWindow = None
+) -> Dict[Tuple[int, int], List[str]]:
     """
-    Retorna os ZIPs dos 3 trimestres mais recentes disponíveis.
+    Retorna os ZIPs de todos os trimestres disponíveis dentro da janela
+    (None = todos), do mais recente para o mais antigo.
+
+    Só as pastas dos anos que podem conter a janela são listadas.
     """
     years = get_available_years()
     all_trimesters: Dict[Tuple[int, int], List[str]] = {}
 
     for year in years:
+        if window and not window[0][0] <= year <= window[1][0]:
+            continue
+
         year_data = get_zip_files_for_year(year)
         all_trimesters.update(year_data)
 
     sorted_trimesters = sorted(
-        all_trimesters.keys(),
+        (
+            key for key in all_trimesters
+            if window is None or window[0] <= key <= window[1]
+        ),
         key=lambda item: (item[0], item[1]),
         reverse=True
     )
 
-    last_three = sorted_trimesters[:3]
+    return {key: all_trimesters[key] for key in sorted_trimesters}
+
+
+def get_last_three_trimesters_with_zips() -> Dict[Tuple[int, int], List[str]]:
+    """
+    Retorna os ZIPs dos 3 trimestres mais recentes disponíveis.
+    """
+    all_trimesters = get_trimesters_with_zips()
+
+    last_three = list(all_trimesters.keys())[:3]
 
     return {key: all_trimesters[key] for key in last_three}
 
@@ -83,36 +108,60 @@ def ensure_directory(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
 
-def download_zip_files(
-    trimesters: Dict[Tuple[int, int], List[str]]
+def download_quarter_zips(
+    year: int,
+    quarter: int,
+    urls: List[str],
+    refresh: bool = False
 ) -> List[Tuple[int, int, str]]:
     """
-    Faz o download dos ZIPs informados.
+    Faz o download dos ZIPs de um trimestre.
+
+    O arquivo é gravado com sufixo .part e só é renomeado no final,
+    para que um download interrompido não fique no cache como ZIP válido.
+    Com refresh=True baixa de novo mesmo o que já está no cache
+    (ZIP republicado pela ANS com o mesmo nome).
     """
     downloaded_files: List[Tuple[int, int, str]] = []
 
-    ensure_directory(BASE_DOWNLOAD_DIR)
+    quarter_dir = os.path.join(BASE_DOWNLOAD_DIR, f"{year}_{quarter}T")
+    ensure_directory(quarter_dir)
 
-    for (year, quarter), urls in trimesters.items():
-        quarter_dir = os.path.join(BASE_DOWNLOAD_DIR, f"{year}_{quarter}T")
-        ensure_directory(quarter_dir)
+    for url in urls:
+        filename = os.path.basename(url)
+        local_path = os.path.join(quarter_dir, filename)
 
-        for url in urls:
-            filename = os.path.basename(url)
-            local_path = os.path.join(quarter_dir, filename)
+        if os.path.exists(local_path) and not refresh:
+            downloaded_files.append((year, quarter, local_path))
+            continue
 
-            if os.path.exists(local_path):
-                downloaded_files.append((year, quarter, local_path))
-                continue
+        partial_path = f"{local_path}.part"
 
-            response = requests.get(url, stream=True, timeout=30)
-            response.raise_for_status()
+        response = requests.get(url, stream=True, timeout=30)
+        response.raise_for_status()
 
-            with open(local_path, "wb") as file:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        file.write(chunk)
+        with open(partial_path, "wb") as file:
+            for chunk in response.iter_content(chunk_size=8192):
+                if chunk:
+                    file.write(chunk)
 
-            downloaded_files.append((year, quarter, local_path))
+        os.replace(partial_path, local_path)
+        downloaded_files.append((year, quarter, local_path))
+
+    return downloaded_files
+
+
+def download_zip_files(
+    trimesters: Dict[Tuple[int, int], List[str]]
+) -> List[Tuple[int, int, str]]:
+    """
+    Faz o download dos ZIPs informados.
+    """
+    downloaded_files: List[Tuple[int, int, str]] = []
+
+    ensure_directory(BASE_DOWNLOAD_DIR)
+
+    for (year, quarter), urls in trimesters.items():
+        downloaded_files.extend(download_quarter_zips(year, quarter, urls))
 
     return downloaded_files
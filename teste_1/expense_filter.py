@@ -1,7 +1,108 @@
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
+import json
 
 TARGET_DESCRIPTION = "DESPESAS COM EVENTOS / SINISTROS"
 
+# Valor da coluna "Conta" para a conta do enunciado
+EXPENSE_ACCOUNT = "EVENTOS_SINISTROS"
+
+# Catálogo padrão: só a conta do enunciado. As linhas são as mesmas da
+# extração original, mas o consolidado sempre tem a coluna extra "Conta".
+# Outras contas entram por arquivo JSON (--contas), no mesmo formato:
+# [{"conta": "NOME", "descricoes": ["..."], "prefixos": ["46"]}]
+DEFAULT_ACCOUNTS: List[Dict[str, object]] = [
+    {
+        "conta": EXPENSE_ACCOUNT,
+        "descricoes": [TARGET_DESCRIPTION],
+        "prefixos": [],
+    }
+]
+
+
+def normalize_description(text: str) -> str:
+    """
+    Normaliza a descrição da conta para comparação.
+    """
+    return (text or "").strip().upper()
+
+
+def normalize_account_code(code: str) -> str:
+    """
+    Mantém só os dígitos do CD_CONTA_CONTABIL (ex: '4.1.1' -> '411').
+    """
+    return "".join(char for char in (code or "") if char.isdigit())
+
+
+class AccountIndex:
+    """
+    Índice de busca das contas alvo, montado uma vez:
+    - descrição normalizada -> conta (dict)
+    - prefixo do CD_CONTA_CONTABIL -> conta (dict por prefixo)
+
+    A busca por linha custa um acesso ao dict de descrições e, no máximo,
+    um acesso por tamanho distinto de prefixo — não cresce com a
+    quantidade de contas do catálogo.
+    """
+
+    def __init__(self, accounts: List[Dict[str, object]]) -> None:
+        self.by_description: Dict[str, str] = {}
+        self.by_prefix: Dict[str, str] = {}
+        self.accounts: List[str] = []
+
+        for account in accounts:
+            name = str(account.get("conta", "")).strip()
+            if not name:
+                raise ValueError(f"Conta sem nome no catálogo: {account}")
+
+            self.accounts.append(name)
+
+            for description in account.get("descricoes", []) or []:
+                # Em caso de repetição, vale a primeira conta do catálogo
+                self.by_description.setdefault(normalize_description(str(description)), name)
+
+            for prefix in account.get("prefixos", []) or []:
+                self.by_prefix.setdefault(normalize_account_code(str(prefix)), name)
+
+        self.prefix_lengths = sorted({len(prefix) for prefix in self.by_prefix if prefix}, reverse=True)
+
+    def match(self, description: str, code: str) -> Optional[str]:
+        """
+        Conta da linha: primeiro pela descrição; senão, pelo maior prefixo
+        do código contábil que estiver no catálogo.
+        """
+        account = self.by_description.get(normalize_description(description))
+        if account is not None:
+            return account
+
+        if self.prefix_lengths:
+            digits = normalize_account_code(code)
+            for length in self.prefix_lengths:
+                if len(digits) >= length:
+                    account = self.by_prefix.get(digits[:length])
+                    if account is not None:
+                        return account
+
+        return None
+
+
+def load_account_catalog(path: Optional[str] = None) -> List[Dict[str, object]]:
+    """
+    Lê o catálogo de contas (JSON). Sem arquivo, usa DEFAULT_ACCOUNTS.
+    """
+    if not path:
+        return DEFAULT_ACCOUNTS
+
+    with open(path, mode="r", encoding="utf-8") as file:
+        accounts = json.load(file)
+
+    if not isinstance(accounts, list) or not accounts:
+        raise ValueError(f"Catálogo de contas inválido (esperado uma lista não vazia): {path}")
+
+    return accounts
+
+
+DEFAULT_INDEX = AccountIndex(DEFAULT_ACCOUNTS)
+
 
 def parse_monetary_value(raw_value: str) -> Optional[float]:
     """
@@ -28,21 +129,30 @@ def parse_monetary_value(raw_value: str) -> Optional[float]:
 def filter_expense_rows(
     rows: List[Dict[str, str]],
     year: int,
-    quarter: int
+    quarter: int,
+    index: Optional[AccountIndex] = None,
+    is_duplicate: Optional[Callable[[Tuple[object, ...]], bool]] = None
 ) -> List[Dict[str, object]]:
     """
-    Filtra apenas registros de 'Despesas com Eventos / Sinistros'
-    e extrai os campos para consolidação.
+    Filtra, numa única passada, os registros das contas do catálogo
+    (padrão: 'Despesas com Eventos / Sinistros') e extrai os campos
+    para consolidação, com a conta na coluna "Conta".
+
+    Com `is_duplicate` (ver deduplicator.py), linhas cuja impressão digital
+    (REG_ANS, conta, CD_CONTA_CONTABIL, ano, trimestre, valor) já apareceu
+    em outro arquivo são descartadas; repetições dentro do mesmo arquivo
+    são mantidas.
 
     IMPORTANTE:
     Os dados contábeis têm REG_ANS (chave), não têm CNPJ/RazaoSocial.
     """
+    index = index or DEFAULT_INDEX
     filtered: List[Dict[str, object]] = []
 
     for row in rows:
-        description = row.get("DESCRICAO", "").strip().upper()
+        account = index.match(row.get("DESCRICAO", ""), row.get("CD_CONTA_CONTABIL", ""))
 
-        if description != TARGET_DESCRIPTION:
+        if account is None:
             continue
 
         value = parse_monetary_value(row.get("VL_SALDO_FINAL", ""))
@@ -50,13 +160,28 @@ def filter_expense_rows(
         if value is None:
             continue
 
+        reg_ans = row.get("REG_ANS", "").strip()
+
+        if is_duplicate is not None:
+            fingerprint = (
+                reg_ans,
+                account,
+                normalize_account_code(row.get("CD_CONTA_CONTABIL", "")),
+                year,
+                quarter,
+                repr(value)
+            )
+            if is_duplicate(fingerprint):
+                continue
+
         filtered.append({
-            "REG_ANS": row.get("REG_ANS", "").strip(),
+            "REG_ANS": reg_ans,
             "CNPJ": "",
             "RazaoSocial": "",
             "Ano": year,
             "Trimestre": quarter,
-            "ValorDespesas": value
+            "ValorDespesas": value,
+            "Conta": account
         })
 
     return filtered
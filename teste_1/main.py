@@ -1,76 +1,212 @@
-from typing import Dict, List
+from typing import Dict, Iterator
+import argparse
+import time
 
 from downloader import (
     get_last_three_trimesters_with_zips,
-    download_zip_files,
+    get_trimesters_with_zips,
 )
-from extractor import extract_all_zips
-from file_reader import read_file
-from expense_filter import filter_expense_rows
-from consolidator import write_csv, zip_result
+from backfill import DEFAULT_JOBS, download_only, quarter_label, run_backfill
+from archive import CODECS, CompressionSettings
+from arrow_io import FORMATS, TableFormat
+from consolidator import DATASET_DIR, write_zip
+from dataset import DatasetWriter, parse_quarter_window
+from expense_filter import AccountIndex, load_account_catalog
+from deduplicator import DEFAULT_EXACT_LIMIT, RowDeduplicator
+from offset_index import index_path_for
 
 
-def main() -> None:
+def parse_args() -> argparse.Namespace:
     """
-    - Descoberta dos últimos 3 trimestres
-    - Download dos ZIPs
-    - Extração dos arquivos
-    - Leitura automática (CSV / TXT / XLSX)
-    - Filtro de despesas com eventos / sinistros
-    - Consolidação em CSV
-    - Compactação em ZIP
+    Opções de linha de comando do Teste 1.
     """
+    parser = argparse.ArgumentParser(description="Teste 1 — Integração com API Pública (ANS)")
+    parser.add_argument(
+        "--trimestres",
+        default=None,
+        help=(
+            "Janela de trimestres: 'all' (todos desde o início da série), "
+            "intervalo '2019T1:2023T4', aberto '2019T1:' ou um único '2023T2'. "
+            "Padrão: os 3 trimestres mais recentes."
+        ),
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help=f"Trimestres processados ao mesmo tempo (padrão: {DEFAULT_JOBS}).",
+    )
+    parser.add_argument(
+        "--contas",
+        default=None,
+        help=(
+            "Catálogo JSON das contas a extrair (descrições e/ou prefixos de "
+            "CD_CONTA_CONTABIL). Padrão: só 'Despesas com Eventos / Sinistros'."
+        ),
+    )
+    parser.add_argument(
+        "--dedup-limite",
+        type=int,
+        default=DEFAULT_EXACT_LIMIT,
+        help=(
+            "Linhas distintas mantidas no conjunto exato da deduplicação; acima disso "
+            f"usa filtro de Bloom + confirmação em disco (padrão: {DEFAULT_EXACT_LIMIT})."
+        ),
+    )
+    parser.add_argument(
+        "--atualizar",
+        action="store_true",
+        help="Baixa de novo os ZIPs dos trimestres processados, mesmo os que já estão no cache.",
+    )
+    parser.add_argument(
+        "--so-download",
+        action="store_true",
+        help="Só baixa os ZIPs para o cache (data/raw/zips), sem consolidar.",
+    )
+    parser.add_argument(
+        "--csv",
+        action="store_true",
+        help="Também grava o CSV consolidado puro em output/ (por padrão ele só existe dentro do ZIP).",
+    )
+    parser.add_argument(
+        "--ordenar-por-operadora",
+        action="store_true",
+        help=(
+            "Grava o consolidado ordenado por REG_ANS, Ano, Trimestre, com o índice "
+            "output/despesas_eventos_sinistros.csv.idx para consultas por operadora (implica --csv)."
+        ),
+    )
+    parser.add_argument(
+        "--formato",
+        choices=FORMATS,
+        default="csv",
+        help=(
+            "Formato das partições do dataset lidas pelo Teste 2: csv (padrão) ou "
+            "arrow (Arrow IPC, lido mapeado em memória; precisa do pyarrow). "
+            "O ZIP e o --csv continuam em CSV."
+        ),
+    )
+    parser.add_argument(
+        "--codec",
+        choices=list(CODECS),
+        default="deflate",
+        help="Compressão do ZIP final (padrão: deflate).",
+    )
+    parser.add_argument(
+        "--nivel",
+        type=int,
+        default=None,
+        help="Nível de compressão (deflate 0-9, bzip2 1-9; padrão: 6 / 9).",
+    )
+    parser.add_argument(
+        "--threads-compressao",
+        type=int,
+        default=1,
+        help="Threads do deflate em blocos paralelos (padrão: 1, compressão serial).",
+    )
+    return parser.parse_args()
 
 
-    print("🔍 Buscando os últimos 3 trimestres disponíveis...")
-    trimesters_with_zips = get_last_three_trimesters_with_zips()
-    print(f"   ✔ Trimestres encontrados: {list(trimesters_with_zips.keys())}\n")
-
-
-    print("⬇️  Baixando arquivos ZIP...")
-    downloaded_zips = download_zip_files(trimesters_with_zips)
-    print(f"   ✔ Total de ZIPs baixados: {len(downloaded_zips)}\n")
-
-
-    print("📦 Extraindo arquivos ZIP...")
-    extracted_files = extract_all_zips(downloaded_zips)
-    print(f"   ✔ Total de arquivos extraídos: {len(extracted_files)}\n")
-
-
-    print("🧹 Processando arquivos e filtrando despesas com eventos/sinistros...")
-    consolidated_rows: List[Dict[str, object]] = []
-
-    for year, quarter, file_path in extracted_files:
-        print(f"   📄 Lendo arquivo: {file_path}")
-
-        rows = read_file(file_path)
-
-        if not rows:
-            print("      ⚠ Arquivo ignorado (formato não suportado ou vazio)")
-            continue
-
-        filtered_rows = filter_expense_rows(
-            rows=rows,
-            year=year,
-            quarter=quarter
+def main() -> None:
+    """
+    - Descoberta dos trimestres (padrão: últimos 3; ou a janela de --trimestres)
+    - Por trimestre, em paralelo (--jobs):
+      download dos ZIPs, extração, leitura automática (CSV / TXT / XLSX)
+      e filtro das contas do catálogo (padrão: despesas com eventos / sinistros)
+    - Descarte de linhas repetidas entre arquivos (mesmo trimestre em vários
+      ZIPs, ou a mesma planilha em CSV e XLSX), com relatório por arquivo
+    - Consolidação (ordem determinística: trimestre mais recente primeiro)
+      e no dataset particionado output/despesas_eventos_sinistros/ano=/trimestre=
+      (só as partições dos trimestres processados são substituídas)
+    - Consolidação gravada direto no ZIP (streaming; CSV puro só com --csv)
+      ou, com --ordenar-por-operadora, ordenada por REG_ANS e indexada
+
+    Um trimestre com erro (ex: ZIP corrompido) é reportado e não
+    interrompe os demais.
+    """
+    args = parse_args()
+    compression = CompressionSettings(args.codec, args.nivel, args.threads_compressao)
+    account_index = AccountIndex(load_account_catalog(args.contas))
+    table_format = TableFormat(args.formato)
+
+    if args.trimestres:
+        window = parse_quarter_window(args.trimestres)
+        print(f"🔍 Buscando trimestres disponíveis ({args.trimestres})...")
+        trimesters_with_zips = get_trimesters_with_zips(window)
+    else:
+        print("🔍 Buscando os últimos 3 trimestres disponíveis...")
+        trimesters_with_zips = get_last_three_trimesters_with_zips()
+
+    if not trimesters_with_zips:
+        raise RuntimeError("Nenhum trimestre encontrado para a janela informada.")
+
+    newest, oldest = list(trimesters_with_zips.keys())[0], list(trimesters_with_zips.keys())[-1]
+    print(f"   ✔ Trimestres encontrados: {len(trimesters_with_zips)} "
+          f"({quarter_label(*oldest)} a {quarter_label(*newest)})\n")
+
+    if args.so_download:
+        print(f"⬇️  Baixando ZIPs ({max(1, args.jobs)} trimestres em paralelo)...")
+        total = download_only(trimesters_with_zips, jobs=args.jobs, refresh=args.atualizar)
+        print(f"\n✅ Download finalizado: {total} ZIP(s) no cache.\n")
+        return
+
+    print(f"⬇️  Baixando, extraindo e filtrando despesas por trimestre ({max(1, args.jobs)} em paralelo)...")
+    print(f"   ✔ Contas extraídas: {', '.join(account_index.accounts)}")
+
+    consolidated = [0]
+
+    with RowDeduplicator(exact_limit=args.dedup_limite) as deduplicator:
+        rows, failures = run_backfill(
+            trimesters_with_zips,
+            jobs=args.jobs,
+            index=account_index,
+            deduplicator=deduplicator,
+            refresh=args.atualizar
         )
 
-        print(f"      ✔ Registros válidos encontrados: {len(filtered_rows)}")
-        consolidated_rows.extend(filtered_rows)
-
-    print(f"\n   ✔ Total de registros consolidados: {len(consolidated_rows)}\n")
-
-
-    print("📝 Gerando CSV consolidado...")
-    csv_path = write_csv(consolidated_rows)
-    print(f"   ✔ CSV gerado em: {csv_path}\n")
-
-
-    print("🗜️  Compactando arquivo final...")
-    zip_path = zip_result(csv_path)
-    print(f"   ✔ Arquivo ZIP gerado em: {zip_path}\n")
-
-    print("✅ Pipeline finalizado com sucesso!\n")
+        print(f"📝 Gerando ZIP consolidado ({compression.describe()}) e dataset particionado...")
+        started = time.perf_counter()
+        with DatasetWriter(DATASET_DIR, file_format=table_format.name) as dataset:
+            def consolidate(items: Iterator[Dict[str, object]]) -> Iterator[Dict[str, object]]:
+                for item in items:
+                    consolidated[0] += 1
+                    dataset.add(item)
+                    yield item
+
+            zip_path, csv_path = write_zip(
+                consolidate(rows),
+                compression,
+                keep_csv=args.csv or args.ordenar_por_operadora,
+                sort_by_operator=args.ordenar_por_operadora
+            )
+
+    print(f"\n   ✔ Total de registros consolidados: {consolidated[0]}")
+    print(f"   ✔ ZIP gerado em: {zip_path} ({zip_path.stat().st_size / 1024:.1f} KB, "
+          f"{compression.describe()}, {time.perf_counter() - started:.1f}s)")
+    if csv_path is not None:
+        print(f"   ✔ CSV gerado em: {csv_path}")
+    if args.ordenar_por_operadora and csv_path is not None:
+        print(f"   ✔ Ordenado por REG_ANS, Ano, Trimestre; índice: {index_path_for(csv_path)}")
+    print(f"   ✔ Partições atualizadas ({table_format.describe()}): {len(dataset.counts)} -> {DATASET_DIR}")
+    print(f"   ✔ Duplicatas descartadas: {deduplicator.dropped} de {deduplicator.checked} "
+          f"linhas ({deduplicator.mode})\n")
+
+    if deduplicator.duplicates_by_source:
+        print("🧹 Linhas repetidas descartadas por arquivo:")
+        for source, count in sorted(deduplicator.duplicates_by_source.items()):
+            print(f"   - {source}: {count}")
+        print()
+
+    if failures:
+        print(f"⚠️  Trimestres com falha ({len(failures)}) — não entraram no consolidado:")
+        for year, quarter, error in sorted(failures):
+            print(f"   ✖ {year}/{quarter}T: {error}")
+        print()
+
+    if failures:
+        print("⚠️  Pipeline finalizado com falhas em alguns trimestres (rode de novo para reprocessá-los).\n")
+    else:
+        print("✅ Pipeline finalizado com sucesso!\n")
 
 
 if __name__ == "__main__":
@@ -1,9 +1,38 @@
 from __future__ import annotations
 
 import csv
+import hashlib
+import json
+import os
 import statistics
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from arrow_io import arrow_batch_count, is_arrow, iter_arrow_rows, iter_rows, resolve_table, table_exists
+from sketches import (
+    SketchState,
+    hll_hash,
+    merge_sketch_states,
+    new_sketch_state,
+    retract_sketch_quarters,
+    sketch_for,
+    sketch_state_from_payload,
+    sketch_state_to_payload,
+    summarize_sketch_groups,
+)
+from spill import (
+    SPILL_PARTITIONS,
+    MemoryBudget,
+    append_records,
+    external_sort,
+    read_records,
+    spill_directory,
+)
 
 
 def project_root() -> Path:
@@ -19,10 +48,32 @@ ROOT_DIR = project_root()
 OUTPUT_DIR = ROOT_DIR / "teste_2" / "output"
 
 CSV_INPUT = OUTPUT_DIR / "despesas_validadas.csv"
+
+# Versão nova e anterior das linhas trocadas por um diff do CADOP (ver
+# enricher.run_cadop_update); CSV_INPUT continua completo
+CSV_DELTA = OUTPUT_DIR / "despesas_validadas_alteradas.csv"
+CSV_PREVIOUS = OUTPUT_DIR / "despesas_validadas_anteriores.csv"
 CSV_OUTPUT = OUTPUT_DIR / "despesas_agregadas.csv"
 
+# Estado persistido da agregação incremental (somas/contagens e sketches por grupo e trimestre)
+STATE_FILE = OUTPUT_DIR / "estado_agregacao.json"
+# Versão 2: sketches alimentados com o total de cada operadora por trimestre
+STATE_VERSION = 2
+
 DELIMITER = ";"
 
+# O consolidado do Teste 1 pode trazer várias contas (coluna "Conta");
+# os relatórios agregam só despesas com eventos / sinistros.
+# Arquivos antigos, sem a coluna, continuam valendo por inteiro.
+EXPENSE_ACCOUNT = "EVENTOS_SINISTROS"
+
+# Tipos do estado de agregação:
+# QuarterState[(Ano, Trimestre)] = [soma_em_centavos, qtd_linhas]
+# AggregationState[conjunto][chave_do_grupo] = QuarterState
+QuarterState = Dict[Tuple[str, str], List[int]]
+GroupState = Dict[Tuple[str, ...], QuarterState]
+AggregationState = Dict[Tuple[str, ...], GroupState]
+
 
 def ensure_output_dir() -> None:
     """
@@ -58,88 +109,1318 @@ def parse_positive_float(value: str) -> Optional[float]:
     return number if number > 0 else None
 
 
-def aggregate() -> None:
+def parse_cents(value: str) -> Optional[int]:
     """
-    Agrupa por (RazaoSocial, UF) e calcula:
-    - Total de despesas
-    - Média por trimestre (baseada no total por trimestre)
-    - Desvio padrão entre trimestres
+    Mesma regra de parse_positive_float, mas devolve centavos inteiros.
+
+    Somar inteiros é exato, então o resultado não depende da ordem
+    das somas (necessário para juntar estados parciais de vários processos).
     """
-    ensure_output_dir()
+    raw = safe_str(value)
+    if not raw:
+        return None
 
-    if not CSV_INPUT.exists():
-        raise FileNotFoundError(
-            f"Arquivo não encontrado: {CSV_INPUT}. Rode antes: python teste_2/validator.py"
-        )
+    normalized = raw.replace(".", "").replace(",", ".")
+    try:
+        number = Decimal(normalized)
+    except InvalidOperation:
+        return None
 
-    # Estrutura:
-    # groups[(RazaoSocial, UF)][(Ano, Trimestre)] = soma_do_trimestre
-    groups: Dict[Tuple[str, str], Dict[Tuple[str, str], float]] = {}
+    if not number.is_finite() or number <= 0:
+        return None
 
-    with CSV_INPUT.open(mode="r", encoding="utf-8", newline="") as fin:
-        reader = csv.DictReader(fin, delimiter=DELIMITER)
-        if not reader.fieldnames:
-            raise ValueError("CSV de entrada não possui cabeçalho.")
+    cents = int((number * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+    return cents if cents > 0 else None
 
-        for row in reader:
-            razao = safe_str(row.get("RazaoSocial", ""))
-            uf = safe_str(row.get("UF", "Desconhecido")) or "Desconhecido"
-            ano = safe_str(row.get("Ano", ""))
-            trimestre = safe_str(row.get("Trimestre", ""))
 
-            if not razao or not ano or not trimestre:
-                continue
+# Conjuntos de agrupamento calculados numa única leitura do CSV.
+# O primeiro conjunto é o principal e continua gerando despesas_agregadas.csv.
+PRIMARY_GROUPING: Tuple[str, ...] = ("RazaoSocial", "UF")
+
+METRIC_FIELDS = [
+    "TotalDespesas",
+    "MediaDespesasPorTrimestre",
+    "DesvioPadraoDespesas",
+    "QtdTrimestres",
+]
+
+
+def rollup(*columns: str) -> List[Tuple[str, ...]]:
+    """
+    Equivalente ao ROLLUP do SQL:
+    rollup("UF", "Modalidade") -> [("UF", "Modalidade"), ("UF",), ()]
+    """
+    return [tuple(columns[:size]) for size in range(len(columns), -1, -1)]
+
+
+def unique_grouping_sets(grouping_sets: List[Tuple[str, ...]]) -> List[Tuple[str, ...]]:
+    """
+    Remove conjuntos repetidos mantendo a ordem original.
+    """
+    unique: List[Tuple[str, ...]] = []
+    for grouping in grouping_sets:
+        if tuple(grouping) not in unique:
+            unique.append(tuple(grouping))
+    return unique
+
+
+GROUPING_SETS: List[Tuple[str, ...]] = unique_grouping_sets([
+    PRIMARY_GROUPING,
+    *rollup("UF", "Modalidade"),
+    ("Modalidade",),
+    ("REG_ANS",),
+    ("REG_ANS", "RazaoSocial"),
+    ("Ano", "Trimestre"),
+])
+
+
+# Distribuição dos valores por grupo (sketches de memória limitada,
+# calculados na mesma leitura): quantis e operadoras distintas
+SKETCH_SETS: List[Tuple[str, ...]] = [("UF",), ("Modalidade",)]
+
+# Cada valor que entra num sketch é o total de uma operadora no trimestre:
+# a mesma leitura soma também por (<conjunto>, REG_ANS) e esses totais
+# alimentam os sketches no final (ver feed_sketches)
+SKETCH_OPERATOR_COLUMN = "REG_ANS"
+
+SKETCH_QUANTILES: List[Tuple[str, float]] = [
+    ("MedianaDespesas", 0.5),
+    ("P95Despesas", 0.95),
+]
+
+SKETCH_FIELDS = ["QtdOperadoraTrimestre", *(field for field, _ in SKETCH_QUANTILES), "OperadorasDistintas"]
+
 
-            valor = parse_positive_float(row.get("ValorDespesas", ""))
-            if valor is None:
+# Crescimento entre o primeiro e o último trimestre de cada grupo e variação
+# trimestre a trimestre, calculados a partir dos totais por trimestre que a
+# agregação já tem (sem banco). Cada conjunto precisa estar em GROUPING_SETS.
+# O ranking guarda só os GROWTH_TOP_K maiores crescimentos (como a Query 1
+# do Teste 3, que usa o primeiro período com total > 0 como base).
+GROWTH_SETS: List[Tuple[str, ...]] = [("REG_ANS", "RazaoSocial"), ("UF",)]
+GROWTH_TOP_K = 5
+
+GROWTH_FIELDS = [
+    "PrimeiroPeriodo",
+    "UltimoPeriodo",
+    "TotalPrimeiroPeriodo",
+    "TotalUltimoPeriodo",
+    "CrescimentoPercentual",
+    "VariacaoUltimoTrimestre",
+    "VariacaoUltimoTrimestrePercentual",
+    "QtdTrimestres",
+]
+QOQ_FIELDS = ["Ano", "Trimestre", "TotalDespesas", "VariacaoAbsoluta", "VariacaoPercentual"]
+
+# Chave interna das linhas de resultado com os totais por trimestre
+# (ano, trimestre, centavos) em ordem; não vai para os CSVs agregados
+QUARTERS_FIELD = "_trimestres"
+
+
+def output_path_for(grouping: Tuple[str, ...]) -> Path:
+    """
+    Define o CSV de saída de cada conjunto de agrupamento.
+    O conjunto principal mantém o nome original (despesas_agregadas.csv).
+    """
+    if tuple(grouping) == PRIMARY_GROUPING:
+        return CSV_OUTPUT
+
+    if not grouping:
+        return OUTPUT_DIR / "despesas_agregadas_total.csv"
+
+    suffix = "_".join(column.lower() for column in grouping)
+    return OUTPUT_DIR / f"despesas_agregadas_por_{suffix}.csv"
+
+
+def sketch_output_path_for(grouping: Tuple[str, ...]) -> Path:
+    """
+    CSV de saída dos sketches de um conjunto (ex: despesas_distribuicao_por_uf.csv).
+    """
+    suffix = "_".join(column.lower() for column in grouping) or "total"
+    return OUTPUT_DIR / f"despesas_distribuicao_por_{suffix}.csv"
+
+
+def growth_output_paths_for(grouping: Tuple[str, ...], top_k: int) -> Tuple[Path, Path, Path]:
+    """
+    CSVs de crescimento de um conjunto: (crescimento por grupo, variação
+    trimestral, ranking dos top_k maiores crescimentos).
+    """
+    suffix = "_".join(column.lower() for column in grouping) or "total"
+    return (
+        OUTPUT_DIR / f"despesas_crescimento_por_{suffix}.csv",
+        OUTPUT_DIR / f"despesas_variacao_trimestral_por_{suffix}.csv",
+        OUTPUT_DIR / f"despesas_crescimento_top{top_k}_por_{suffix}.csv",
+    )
+
+
+def dimension_value(row: Dict[str, str], column: str) -> str:
+    """
+    Lê o valor de uma dimensão do agrupamento.
+    Valores vazios viram "Desconhecido" (mesma regra do enriquecimento).
+    """
+    return safe_str(row.get(column, "")) or "Desconhecido"
+
+
+def sketch_total_set(grouping: Tuple[str, ...]) -> Tuple[str, ...]:
+    """
+    Conjunto auxiliar com o total de cada operadora por trimestre
+    dentro dos grupos de um conjunto de sketches (ex: UF -> (UF, REG_ANS)).
+    """
+    return tuple(grouping) + (SKETCH_OPERATOR_COLUMN,)
+
+
+def with_sketch_totals(
+    grouping_sets: List[Tuple[str, ...]],
+    sketches: Optional[SketchState] = None,
+) -> List[Tuple[str, ...]]:
+    """
+    Conjuntos a somar na leitura: os pedidos mais os auxiliares dos sketches.
+    """
+    if sketches is None:
+        return list(grouping_sets)
+    return unique_grouping_sets(list(grouping_sets) + [sketch_total_set(grouping) for grouping in sketches])
+
+
+def drop_extra_sets(state: AggregationState, grouping_sets: List[Tuple[str, ...]]) -> AggregationState:
+    """
+    Remove do estado os conjuntos que não foram pedidos (auxiliares dos sketches).
+    """
+    for grouping in [grouping for grouping in state if grouping not in grouping_sets]:
+        del state[grouping]
+    return state
+
+
+def feed_sketches(sketches: SketchState, totals: AggregationState) -> None:
+    """
+    Coloca nos sketches o total de cada operadora por trimestre, lido dos
+    conjuntos auxiliares (sketch_total_set) presentes em `totals`.
+
+    Grupos e trimestres entram sempre na mesma ordem (ordenados): como os
+    totais são somas exatas em centavos, os sketches saem iguais em
+    qualquer engine e na agregação paralela.
+    """
+    for grouping in sketches:
+        groups = totals.get(sketch_total_set(grouping))
+        if not groups:
+            continue
+
+        for group_key in sorted(groups):
+            reg_ans_hash = hll_hash(group_key[-1])
+            quarter_map = groups[group_key]
+            for quarter_key in sorted(quarter_map):
+                sketch_for(sketches, grouping, group_key[:-1], quarter_key).add(quarter_map[quarter_key][0], reg_ans_hash)
+
+
+def new_state(grouping_sets: List[Tuple[str, ...]]) -> AggregationState:
+    """
+    Cria um estado de agregação vazio para os conjuntos informados.
+    """
+    return {grouping: {} for grouping in grouping_sets}
+
+
+def is_expense_row(row: Dict[str, str]) -> bool:
+    """
+    True se a linha é da conta de eventos / sinistros (ou não informa a conta).
+    """
+    account = safe_str(row.get("Conta", ""))
+    return not account or account == EXPENSE_ACCOUNT
+
+
+def row_measure(row: Dict[str, str]) -> Optional[Tuple[Tuple[str, str], int]]:
+    """
+    (trimestre, valor em centavos) de uma linha do CSV validado, ou None
+    se ela não entra na agregação: outras contas, ou sem razão social,
+    ano, trimestre ou valor positivo.
+    """
+    if not is_expense_row(row):
+        return None
+
+    razao = safe_str(row.get("RazaoSocial", ""))
+    ano = safe_str(row.get("Ano", ""))
+    trimestre = safe_str(row.get("Trimestre", ""))
+
+    if not razao or not ano or not trimestre:
+        return None
+
+    cents = parse_cents(row.get("ValorDespesas", ""))
+    if cents is None:
+        return None
+
+    return (ano, trimestre), cents
+
+
+def accumulate_row(state: AggregationState, row: Dict[str, str]) -> None:
+    """
+    Soma uma linha do CSV validado em todos os conjuntos do estado.
+    Linhas ignoradas seguem as regras de row_measure.
+    """
+    measure = row_measure(row)
+    if measure is None:
+        return
+
+    quarter_key, cents = measure
+
+    for grouping, groups in state.items():
+        group_key = tuple(dimension_value(row, column) for column in grouping)
+
+        quarter_map = groups.setdefault(group_key, {})
+        quarter_state = quarter_map.setdefault(quarter_key, [0, 0])
+        quarter_state[0] += cents
+        quarter_state[1] += 1
+
+
+def merge_states(target: AggregationState, other: AggregationState) -> AggregationState:
+    """
+    Junta um estado parcial em outro (soma centavos e contagens).
+    A operação é associativa e comutativa: a ordem dos parciais não importa.
+    """
+    for grouping, groups in other.items():
+        target_groups = target.setdefault(grouping, {})
+
+        for group_key, quarter_map in groups.items():
+            target_quarters = target_groups.setdefault(group_key, {})
+
+            for quarter_key, (cents, count) in quarter_map.items():
+                quarter_state = target_quarters.setdefault(quarter_key, [0, 0])
+                quarter_state[0] += cents
+                quarter_state[1] += count
+
+    return target
+
+
+def subtract_states(target: AggregationState, other: AggregationState) -> AggregationState:
+    """
+    Retira um estado parcial de outro (inverso do merge_states).
+    Trimestres que ficam sem linhas e grupos sem trimestres são removidos.
+    """
+    for grouping, groups in other.items():
+        target_groups = target.get(grouping, {})
+
+        for group_key, quarter_map in groups.items():
+            target_quarters = target_groups.get(group_key)
+            if target_quarters is None:
                 continue
 
-            group_key = (razao, uf)
-            quarter_key = (ano, trimestre)
+            for quarter_key, (cents, count) in quarter_map.items():
+                quarter_state = target_quarters.get(quarter_key)
+                if quarter_state is None:
+                    continue
+
+                quarter_state[0] -= cents
+                quarter_state[1] -= count
+                if quarter_state[1] <= 0:
+                    del target_quarters[quarter_key]
+
+            if not target_quarters:
+                del target_groups[group_key]
+
+    return target
+
+
+def summarize_group(quarter_cents: List[int]) -> Dict[str, object]:
+    """
+    Calcula as métricas de um grupo a partir dos totais por trimestre (centavos).
+    """
+    quarter_values = [cents / 100 for cents in quarter_cents]
+
+    total = sum(quarter_cents) / 100
+    media = statistics.mean(quarter_values) if quarter_values else 0.0
+
+    if len(quarter_values) >= 2:
+        desvio = statistics.pstdev(quarter_values)
+    else:
+        desvio = 0.0
+
+    return {
+        "TotalDespesas": round(total, 2),
+        "MediaDespesasPorTrimestre": round(media, 2),
+        "DesvioPadraoDespesas": round(desvio, 2),
+        "QtdTrimestres": len(quarter_values),
+    }
 
-            groups.setdefault(group_key, {})
-            groups[group_key][quarter_key] = groups[group_key].get(quarter_key, 0.0) + valor
 
+def summarize_groups(grouping: Tuple[str, ...], groups: GroupState) -> List[Dict[str, object]]:
+    """
+    Transforma o estado de um conjunto em linhas de resultado (sem ordenar).
+    Cada linha leva também os totais por trimestre em ordem (QUARTERS_FIELD),
+    usados pelo GrowthReport.
+    """
     results: List[Dict[str, object]] = []
 
-    for (razao, uf), quarter_map in groups.items():
-        quarter_values = list(quarter_map.values())
+    for group_key, quarter_map in groups.items():
+        result: Dict[str, object] = dict(zip(grouping, group_key))
+        result.update(summarize_group([cents for cents, _ in quarter_map.values()]))
+        result[QUARTERS_FIELD] = sorted(
+            (int(ano), int(trimestre), cents) for (ano, trimestre), (cents, _) in quarter_map.items()
+        )
+        results.append(result)
+
+    return results
 
-        total = sum(quarter_values)
-        media = statistics.mean(quarter_values) if quarter_values else 0.0
 
-        if len(quarter_values) >= 2:
-            desvio = statistics.pstdev(quarter_values)
-        else:
-            desvio = 0.0
-
-        results.append({
-            "RazaoSocial": razao,
-            "UF": uf,
-            "TotalDespesas": round(total, 2),
-            "MediaDespesasPorTrimestre": round(media, 2),
-            "DesvioPadraoDespesas": round(desvio, 2),
-            "QtdTrimestres": len(quarter_values),
-        })
-
-    # Ordena pelo total (maior -> menor)
-    results.sort(key=lambda item: float(item["TotalDespesas"]), reverse=True)
-
-    fieldnames = [
-        "RazaoSocial",
-        "UF",
-        "TotalDespesas",
-        "MediaDespesasPorTrimestre",
-        "DesvioPadraoDespesas",
-        "QtdTrimestres",
-    ]
+def percent_change(before_cents: int, after_cents: int) -> object:
+    """
+    Variação percentual (2 casas); vazio se a base não for positiva
+    (mesma regra do NULLIF / first_total > 0 da Query 1).
+    """
+    if before_cents <= 0:
+        return ""
+    return round((after_cents - before_cents) / before_cents * 100, 2)
+
+
+def growth_metrics(quarters: List[Tuple[int, int, int]]) -> Dict[str, object]:
+    """
+    Métricas de crescimento a partir dos totais por trimestre em ordem:
+    primeiro e último período, crescimento percentual entre eles e a
+    variação do último trimestre em relação ao anterior.
+    """
+    first_year, first_quarter, first_cents = quarters[0]
+    last_year, last_quarter, last_cents = quarters[-1]
+
+    metrics: Dict[str, object] = {
+        "PrimeiroPeriodo": f"{first_year}T{first_quarter}",
+        "UltimoPeriodo": f"{last_year}T{last_quarter}",
+        "TotalPrimeiroPeriodo": round(first_cents / 100, 2),
+        "TotalUltimoPeriodo": round(last_cents / 100, 2),
+        "CrescimentoPercentual": percent_change(first_cents, last_cents),
+        "VariacaoUltimoTrimestre": "",
+        "VariacaoUltimoTrimestrePercentual": "",
+        "QtdTrimestres": len(quarters),
+    }
+
+    if len(quarters) >= 2:
+        previous_cents = quarters[-2][2]
+        metrics["VariacaoUltimoTrimestre"] = round((last_cents - previous_cents) / 100, 2)
+        metrics["VariacaoUltimoTrimestrePercentual"] = percent_change(previous_cents, last_cents)
+
+    return metrics
+
+
+class GrowthReport:
+    """
+    Crescimento de um conjunto, calculado enquanto as linhas de resultado
+    passam pelo write_grouping (nenhuma lista extra com todos os grupos):
+    - despesas_crescimento_por_<conjunto>.csv: primeiro/último período,
+      crescimento % e variação do último trimestre, por grupo;
+    - despesas_variacao_trimestral_por_<conjunto>.csv: total e variação
+      de cada trimestre em relação ao anterior;
+    - despesas_crescimento_top<K>_por_<conjunto>.csv: os K maiores
+      crescimentos. Só os melhores candidatos ficam em memória (no
+      máximo 2 * K; a lista é podada quando passa disso).
+    """
+
+    def __init__(self, grouping: Tuple[str, ...], top_k: int = GROWTH_TOP_K) -> None:
+        self.grouping = grouping
+        self.top_k = max(1, top_k)
+        self.growth_path, self.qoq_path, self.ranking_path = growth_output_paths_for(grouping, self.top_k)
+        self.count = 0
+        self.candidates: List[Dict[str, object]] = []
+
+        self.growth_file = self.growth_path.open(mode="w", encoding="utf-8", newline="")
+        self.qoq_file = self.qoq_path.open(mode="w", encoding="utf-8", newline="")
+        self.growth_writer = csv.DictWriter(self.growth_file, fieldnames=list(grouping) + GROWTH_FIELDS, delimiter=DELIMITER)
+        self.growth_writer.writeheader()
+        self.qoq_writer = csv.DictWriter(self.qoq_file, fieldnames=list(grouping) + QOQ_FIELDS, delimiter=DELIMITER)
+        self.qoq_writer.writeheader()
+
+    def rank_key(self, row: Dict[str, object]) -> Tuple[object, ...]:
+        return (-float(row["CrescimentoPercentual"]),) + tuple(str(row[column]) for column in self.grouping)
+
+    def add(self, result: Dict[str, object]) -> None:
+        quarters = result[QUARTERS_FIELD]
+        group = {column: result[column] for column in self.grouping}
+
+        row = dict(group)
+        row.update(growth_metrics(quarters))
+        self.growth_writer.writerow(row)
+        self.count += 1
 
-    with CSV_OUTPUT.open(mode="w", encoding="utf-8", newline="") as fout:
-        writer = csv.DictWriter(fout, fieldnames=fieldnames, delimiter=DELIMITER)
+        previous_cents: Optional[int] = None
+        for ano, trimestre, cents in quarters:
+            qoq = dict(group)
+            qoq.update({
+                "Ano": ano,
+                "Trimestre": trimestre,
+                "TotalDespesas": round(cents / 100, 2),
+                "VariacaoAbsoluta": "" if previous_cents is None else round((cents - previous_cents) / 100, 2),
+                "VariacaoPercentual": "" if previous_cents is None else percent_change(previous_cents, cents),
+            })
+            self.qoq_writer.writerow(qoq)
+            previous_cents = cents
+
+        if row["CrescimentoPercentual"] != "":
+            self.candidates.append(row)
+            if len(self.candidates) >= 2 * self.top_k:
+                self.candidates = sorted(self.candidates, key=self.rank_key)[:self.top_k]
+
+    def close(self) -> List[Dict[str, object]]:
+        """
+        Fecha os arquivos e grava o ranking. Retorna o ranking.
+        """
+        self.growth_file.close()
+        self.qoq_file.close()
+
+        ranking = sorted(self.candidates, key=self.rank_key)[:self.top_k]
+        with self.ranking_path.open(mode="w", encoding="utf-8", newline="") as fout:
+            writer = csv.DictWriter(fout, fieldnames=["Posicao"] + list(self.grouping) + GROWTH_FIELDS, delimiter=DELIMITER)
+            writer.writeheader()
+            for position, row in enumerate(ranking, start=1):
+                writer.writerow({"Posicao": position, **row})
+
+        return ranking
+
+
+def result_sort_key(grouping: Tuple[str, ...]):
+    """
+    Ordenação final: total (maior -> menor) e, em caso de empate,
+    as colunas do agrupamento. Assim a ordem não depende de quem
+    processou cada grupo (serial ou paralelo).
+    """
+    def key(item: Dict[str, object]) -> Tuple[object, ...]:
+        return (-float(item["TotalDespesas"]),) + tuple(str(item[column]) for column in grouping)
+
+    return key
+
+
+def write_grouping(
+    grouping: Tuple[str, ...],
+    results: Iterable[Dict[str, object]],
+    budget: Optional[MemoryBudget] = None,
+    work_dir: Optional[Path] = None,
+    growth: Optional[GrowthReport] = None,
+) -> Tuple[Path, int]:
+    """
+    Gera o CSV de um conjunto de agrupamento, ordenado pelo total (maior -> menor).
+
+    Com orçamento de memória (budget + work_dir) a ordenação é externa
+    (runs em disco + merge). Com `growth`, cada linha também alimenta o
+    relatório de crescimento na mesma passada.
+    Retorna (arquivo gerado, quantidade de grupos).
+    """
+    sort_key = result_sort_key(grouping)
+    if budget is not None and work_dir is not None:
+        ordered: Iterable[Dict[str, object]] = external_sort(
+            results, sort_key, budget, work_dir, prefix=f"ordem_{output_path_for(grouping).stem}"
+        )
+    else:
+        ordered = sorted(results, key=sort_key)
+
+    output_path = output_path_for(grouping)
+    fieldnames = list(grouping) + METRIC_FIELDS
+    count = 0
+
+    with output_path.open(mode="w", encoding="utf-8", newline="") as fout:
+        writer = csv.DictWriter(fout, fieldnames=fieldnames, delimiter=DELIMITER, extrasaction="ignore")
+        writer.writeheader()
+        for result in ordered:
+            writer.writerow(result)
+            if growth is not None:
+                growth.add(result)
+            count += 1
+
+    return output_path, count
+
+
+def write_sketches(grouping: Tuple[str, ...], sketches: SketchState) -> Tuple[Path, int]:
+    """
+    Gera o CSV de distribuição de um conjunto, ordenado pela mediana
+    (maior -> menor) e pelas colunas do agrupamento.
+    """
+    groups = sketches.get(grouping, {})
+    results = summarize_sketch_groups(grouping, groups, SKETCH_QUANTILES)
+    median_field = SKETCH_QUANTILES[0][0]
+    results.sort(key=lambda item: (-float(item[median_field] or 0),) + tuple(str(item[column]) for column in grouping))
+
+    output_path = sketch_output_path_for(grouping)
+    with output_path.open(mode="w", encoding="utf-8", newline="") as fout:
+        writer = csv.DictWriter(fout, fieldnames=list(grouping) + SKETCH_FIELDS, delimiter=DELIMITER)
         writer.writeheader()
         writer.writerows(results)
 
-    print("✅ Agregação concluída!")
-    print(f"   ✔ Grupos (RazaoSocial + UF): {len(results)}")
-    print(f"   ✔ CSV gerado: {CSV_OUTPUT}")
+    stale = sorted(
+        " / ".join(group_key)
+        for group_key, quarter_map in groups.items()
+        if any(sketch.stale for sketch in quarter_map.values())
+    )
+    if stale:
+        print(f"   ⚠ Distribuição aproximada (linhas trocadas pelo diff do CADOP) em: {', '.join(stale)}")
+
+    return output_path, len(results)
+
+
+def read_header(csv_path: Path) -> Tuple[List[str], int]:
+    """
+    Lê o cabeçalho do CSV e retorna (colunas, offset do primeiro registro).
+    """
+    with csv_path.open(mode="rb") as fin:
+        header_line = fin.readline()
+
+    fieldnames = next(csv.reader([header_line.decode("utf-8")], delimiter=DELIMITER), [])
+    if not fieldnames:
+        raise ValueError("CSV de entrada não possui cabeçalho.")
+
+    return fieldnames, len(header_line)
+
+
+def split_byte_ranges(csv_path: Path, parts: int) -> List[Tuple[int, int]]:
+    """
+    Divide o corpo do CSV em faixas de bytes alinhadas em quebras de linha.
+
+    Assume que os campos não contêm quebras de linha (o CSV validado
+    é gerado pelo próprio pipeline com DictWriter).
+    """
+    _, data_start = read_header(csv_path)
+    file_size = csv_path.stat().st_size
+
+    step = max(1, (file_size - data_start) // max(1, parts))
+    boundaries = [data_start]
+
+    with csv_path.open(mode="rb") as fin:
+        position = data_start + step
+        while position < file_size:
+            fin.seek(position)
+            fin.readline()
+            aligned = fin.tell()
+            if aligned >= file_size:
+                break
+            if aligned > boundaries[-1]:
+                boundaries.append(aligned)
+            position = aligned + step
+
+    boundaries.append(file_size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def split_batch_ranges(arrow_path: Path, parts: int) -> List[Tuple[int, int]]:
+    """
+    Divide um arquivo Arrow em faixas contíguas de record batches.
+    """
+    batches = arrow_batch_count(arrow_path)
+    step = max(1, -(-batches // max(1, parts)))
+    return [(start, min(start + step, batches)) for start in range(0, batches, step)]
+
+
+def split_ranges(path: Path, parts: int) -> List[Tuple[int, int]]:
+    """
+    Faixas da leitura paralela: bytes do CSV ou record batches do Arrow.
+    """
+    return split_batch_ranges(path, parts) if is_arrow(path) else split_byte_ranges(path, parts)
+
+
+def iter_rows_in_range(csv_path: Path, start: int, end: int) -> Iterator[Dict[str, str]]:
+    """
+    Lê apenas as linhas entre os offsets [start, end) do CSV
+    (ou os record batches [start, end) de um arquivo Arrow).
+    """
+    if is_arrow(csv_path):
+        yield from iter_arrow_rows(csv_path, start, end)
+        return
+
+    fieldnames, _ = read_header(csv_path)
+
+    with csv_path.open(mode="rb") as fin:
+        fin.seek(start)
+        chunk = fin.read(end - start).decode("utf-8")
+
+    yield from csv.DictReader(chunk.splitlines(), fieldnames=fieldnames, delimiter=DELIMITER)
+
+
+def partition_of(grouping: Tuple[str, ...], group_key: Tuple[str, ...], partitions: int) -> int:
+    """
+    Partição (hash estável entre processos) de um grupo.
+    """
+    text = "\x1f".join(grouping + ("\x1e",) + group_key)
+    return zlib.crc32(text.encode("utf-8")) % partitions
+
+
+def partial_state_for_range(
+    task: Tuple[str, int, int, List[Tuple[str, ...]], int]
+) -> List[AggregationState]:
+    """
+    Etapa "map" (roda em um processo do pool):
+    agrega uma faixa do CSV e separa o estado parcial por partição de hash.
+    """
+    csv_path, start, end, grouping_sets, partitions = task
+
+    state = new_state(grouping_sets)
+    for row in iter_rows_in_range(Path(csv_path), start, end):
+        accumulate_row(state, row)
+
+    partitioned = [new_state(grouping_sets) for _ in range(partitions)]
+    for grouping, groups in state.items():
+        for group_key, quarter_map in groups.items():
+            partitioned[partition_of(grouping, group_key, partitions)][grouping][group_key] = quarter_map
+
+    return partitioned
+
+
+def summarize_partition(
+    task: Tuple[List[AggregationState], List[Tuple[str, ...]], List[Tuple[str, ...]]]
+) -> Tuple[Dict[Tuple[str, ...], List[Dict[str, object]]], AggregationState]:
+    """
+    Etapa "reduce" (roda em um processo do pool):
+    junta os parciais de uma partição e calcula as métricas dos seus grupos.
+    Os conjuntos de total_sets (totais por operadora dos sketches) voltam
+    somados, sem métricas.
+    """
+    partials, grouping_sets, total_sets = task
+
+    merged = new_state(unique_grouping_sets(grouping_sets + total_sets))
+    for partial in partials:
+        merge_states(merged, partial)
+
+    results = {
+        grouping: summarize_groups(grouping, merged[grouping])
+        for grouping in grouping_sets
+    }
+    return results, {grouping: merged[grouping] for grouping in total_sets}
+
+
+def build_state(
+    grouping_sets: List[Tuple[str, ...]],
+    csv_path: Optional[Path] = None,
+    sketches: Optional[SketchState] = None,
+) -> AggregationState:
+    """
+    Lê o CSV validado inteiro (serial) e devolve o estado de agregação.
+    Se `sketches` for informado, ele é preenchido com os totais por
+    operadora e trimestre somados na mesma leitura.
+    """
+    state = new_state(with_sketch_totals(grouping_sets, sketches))
+
+    for row in iter_rows(resolve_table(csv_path or CSV_INPUT), require_header=True):
+        accumulate_row(state, row)
+
+    if sketches is not None:
+        feed_sketches(sketches, state)
+
+    return drop_extra_sets(state, grouping_sets)
+
+
+def build_state_with_engine(
+    grouping_sets: List[Tuple[str, ...]],
+    engine: str = "dict",
+    csv_path: Optional[Path] = None,
+    sketches: Optional[SketchState] = None,
+) -> AggregationState:
+    """
+    Monta o estado de agregação com o engine escolhido:
+    - "dict": leitura linha a linha em dicionários (padrão, sem dependências);
+    - "numpy": representação colunar (ver columnar.py).
+    """
+    if engine == "numpy":
+        from columnar import build_state_columnar
+
+        return build_state_columnar(grouping_sets, resolve_table(csv_path or CSV_INPUT), sketches=sketches)
+
+    if engine != "dict":
+        raise ValueError(f"Engine de agregação desconhecido: {engine}")
+
+    return build_state(grouping_sets, csv_path, sketches)
+
+
+def aggregate_parallel(
+    grouping_sets: List[Tuple[str, ...]],
+    workers: int,
+    sketches: Optional[SketchState] = None,
+) -> Dict[Tuple[str, ...], List[Dict[str, object]]]:
+    """
+    Agregação paralela em duas etapas num pool de processos:
+    1) cada processo agrega uma faixa de bytes do CSV (ou de record batches
+       do Arrow) e separa os grupos por hash em `workers` partições;
+    2) cada partição é reduzida (merge dos parciais + métricas) em paralelo.
+
+    Como as somas são em centavos inteiros, o resultado é idêntico ao serial.
+    Os totais por operadora dos sketches são reduzidos junto com os grupos
+    e entram em `sketches` no final, como na execução serial.
+    """
+    input_path = resolve_table(CSV_INPUT)
+    ranges = split_ranges(input_path, workers)
+    partitions = workers
+    total_sets = [sketch_total_set(grouping) for grouping in sketches] if sketches is not None else []
+    pass_sets = unique_grouping_sets(grouping_sets + total_sets)
+
+    map_tasks = [
+        (str(input_path), start, end, pass_sets, partitions)
+        for start, end in ranges
+    ]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        partials = list(pool.map(partial_state_for_range, map_tasks))
+
+        reduce_tasks = [
+            ([partial[index] for partial in partials], grouping_sets, total_sets)
+            for index in range(partitions)
+        ]
+        reduced = list(pool.map(summarize_partition, reduce_tasks))
+
+    results: Dict[Tuple[str, ...], List[Dict[str, object]]] = {
+        grouping: [] for grouping in grouping_sets
+    }
+    totals = new_state(total_sets)
+    for partition_results, partition_totals in reduced:
+        for grouping, rows in partition_results.items():
+            results[grouping].extend(rows)
+        merge_states(totals, partition_totals)
+
+    if sketches is not None:
+        feed_sketches(sketches, totals)
+
+    return results
+
+
+def spill_path(work_dir: Path, grouping_index: int, partition: int) -> Path:
+    """
+    Arquivo de spill de uma partição de um conjunto de agrupamento.
+    """
+    return work_dir / f"estado_{grouping_index:02d}_p{partition:03d}.pkl"
+
+
+def spill_state(
+    state: AggregationState,
+    grouping_sets: List[Tuple[str, ...]],
+    work_dir: Path,
+    partitions: int,
+) -> None:
+    """
+    Grava o estado parcial em disco, separado por hash do grupo
+    (mesmo partition_of da agregação paralela).
+    """
+    for grouping_index, grouping in enumerate(grouping_sets):
+        buckets: List[GroupState] = [{} for _ in range(partitions)]
+        for group_key, quarter_map in state[grouping].items():
+            buckets[partition_of(grouping, group_key, partitions)][group_key] = quarter_map
+
+        for partition, bucket in enumerate(buckets):
+            if bucket:
+                append_records(spill_path(work_dir, grouping_index, partition), [bucket])
+
+
+def iter_spilled_groups(
+    grouping_index: int,
+    grouping: Tuple[str, ...],
+    work_dir: Path,
+    partitions: int,
+    remove: bool = True,
+) -> Iterator[GroupState]:
+    """
+    Junta, partição por partição, os parciais gravados de um conjunto.
+    Só uma partição fica em memória por vez; com remove=True os arquivos
+    são apagados depois de lidos.
+    """
+    for partition in range(partitions):
+        path = spill_path(work_dir, grouping_index, partition)
+        merged: AggregationState = {grouping: {}}
+
+        for bucket in read_records(path):
+            merge_states(merged, {grouping: bucket})
+
+        yield merged[grouping]
+
+        if remove and path.exists():
+            path.unlink()
+
+
+def iter_spilled_results(
+    grouping_index: int,
+    grouping: Tuple[str, ...],
+    work_dir: Path,
+    partitions: int,
+) -> Iterator[Dict[str, object]]:
+    """
+    Linhas de resultado de um conjunto gravado em spill (ver iter_spilled_groups).
+    """
+    for groups in iter_spilled_groups(grouping_index, grouping, work_dir, partitions):
+        yield from summarize_groups(grouping, groups)
+
+
+def aggregate_with_memory_limit(
+    grouping_sets: List[Tuple[str, ...]],
+    budget: MemoryBudget,
+    work_dir: Path,
+    csv_path: Optional[Path] = None,
+    partitions: int = SPILL_PARTITIONS,
+    sketches: Optional[SketchState] = None,
+) -> Dict[Tuple[str, ...], Iterable[Dict[str, object]]]:
+    """
+    Agregação com limite de memória: lê o CSV serialmente e, sempre que o
+    RSS passa do limite, grava o estado parcial em arquivos particionados
+    por hash e recomeça com um estado vazio. No final cada partição é
+    reduzida separadamente (somas em centavos: resultado idêntico).
+
+    Se o limite nunca for atingido, é a agregação serial normal.
+    Os sketches têm tamanho limitado e ficam sempre em memória; os totais
+    por operadora que os alimentam vão para o spill como os demais grupos
+    e entram nos sketches partição por partição (depois do spill, a ordem
+    de entrada muda e os quantis podem diferir da execução em memória
+    dentro do erro do sketch).
+    """
+    pass_sets = with_sketch_totals(grouping_sets, sketches)
+    state = new_state(pass_sets)
+    spilled = False
+
+    for row in iter_rows(resolve_table(csv_path or CSV_INPUT), require_header=True):
+        accumulate_row(state, row)
+
+        if budget.over_limit():
+            spill_state(state, pass_sets, work_dir, partitions)
+            budget.spills += 1
+            state = new_state(pass_sets)
+            spilled = True
+
+    # Arquivos com menos linhas que o intervalo de verificação nunca
+    # chegam a medir o RSS no laço: mede no fim da leitura
+    if not spilled and budget.over_limit(force=True):
+        budget.spills += 1
+        spilled = True
+
+    if not spilled:
+        if sketches is not None:
+            feed_sketches(sketches, state)
+        return {
+            grouping: summarize_groups(grouping, state[grouping])
+            for grouping in grouping_sets
+        }
+
+    spill_state(state, pass_sets, work_dir, partitions)
+    del state
+
+    if sketches is not None:
+        for grouping in sketches:
+            total_set = sketch_total_set(grouping)
+            spilled_groups = iter_spilled_groups(
+                pass_sets.index(total_set), total_set, work_dir, partitions, remove=total_set not in grouping_sets
+            )
+            for groups in spilled_groups:
+                feed_sketches(sketches, {total_set: groups})
+
+    return {
+        grouping: iter_spilled_results(pass_sets.index(grouping), grouping, work_dir, partitions)
+        for grouping in grouping_sets
+    }
+
+
+def quarters_in_state(state: AggregationState) -> List[Tuple[str, str]]:
+    """
+    Lista os trimestres (Ano, Trimestre) presentes em um estado.
+    """
+    quarters = {
+        quarter_key
+        for groups in state.values()
+        for quarter_map in groups.values()
+        for quarter_key in quarter_map
+    }
+    return sorted(quarters)
+
+
+def retract_quarters(state: AggregationState, quarters: List[Tuple[str, str]]) -> int:
+    """
+    Remove do estado a contribuição dos trimestres informados
+    (usado quando a ANS republica um trimestre).
+
+    Grupos que ficam sem nenhum trimestre são removidos.
+    Retorna a quantidade de grupos afetados.
+    """
+    to_remove = set(quarters)
+    affected = 0
+
+    for groups in state.values():
+        empty_groups: List[Tuple[str, ...]] = []
+
+        for group_key, quarter_map in groups.items():
+            removed = [quarter_key for quarter_key in quarter_map if quarter_key in to_remove]
+            if not removed:
+                continue
+
+            affected += 1
+            for quarter_key in removed:
+                del quarter_map[quarter_key]
+
+            if not quarter_map:
+                empty_groups.append(group_key)
+
+        for group_key in empty_groups:
+            del groups[group_key]
+
+    return affected
+
+
+def save_state(
+    state: AggregationState,
+    state_path: Optional[Path] = None,
+    sketches: Optional[SketchState] = None,
+    applied_delta: Optional[str] = None,
+) -> Path:
+    """
+    Grava o estado de agregação (e os sketches, se informados) em JSON
+    (escrita atômica via arquivo temporário). applied_delta é a assinatura
+    do último diff do CADOP aplicado (ver apply_row_delta).
+    """
+    state_path = state_path or STATE_FILE
+
+    payload = {
+        "versao": STATE_VERSION,
+        "conjuntos": [
+            {
+                "colunas": list(grouping),
+                "grupos": [
+                    [
+                        list(group_key),
+                        {f"{ano}-{trimestre}": values for (ano, trimestre), values in quarter_map.items()},
+                    ]
+                    for group_key, quarter_map in groups.items()
+                ],
+            }
+            for grouping, groups in state.items()
+        ],
+    }
+    if sketches is not None:
+        payload["sketches"] = sketch_state_to_payload(sketches)
+    if applied_delta is not None:
+        payload["diff_aplicado"] = applied_delta
+
+    tmp_path = state_path.with_suffix(".tmp")
+    with tmp_path.open(mode="w", encoding="utf-8") as fout:
+        json.dump(payload, fout, ensure_ascii=False)
+    os.replace(tmp_path, state_path)
+
+    return state_path
+
+
+def read_state_payload(state_path: Optional[Path] = None) -> Optional[Dict[str, object]]:
+    """
+    Lê o JSON do estado salvo. Retorna None se não existir
+    ou se for de uma versão diferente.
+    """
+    state_path = state_path or STATE_FILE
+    if not state_path.exists():
+        return None
+
+    with state_path.open(mode="r", encoding="utf-8") as fin:
+        payload = json.load(fin)
+
+    if payload.get("versao") != STATE_VERSION:
+        return None
+
+    return payload
+
+
+def load_state(state_path: Optional[Path] = None) -> Optional[AggregationState]:
+    """
+    Lê o estado de agregação salvo. Retorna None se não existir
+    ou se for de uma versão diferente.
+    """
+    payload = read_state_payload(state_path)
+    if payload is None:
+        return None
+
+    state: AggregationState = {}
+    for entry in payload.get("conjuntos", []):
+        groups: GroupState = {}
+        for group_key, quarter_map in entry["grupos"]:
+            groups[tuple(group_key)] = {
+                tuple(quarter.split("-", 1)): [int(cents), int(count)]
+                for quarter, (cents, count) in quarter_map.items()
+            }
+        state[tuple(entry["colunas"])] = groups
+
+    return state
+
+
+def load_sketches(state_path: Optional[Path] = None) -> Optional[SketchState]:
+    """
+    Lê os sketches salvos junto com o estado. Retorna None se o estado
+    não existir ou tiver sido gravado antes dos sketches.
+    """
+    payload = read_state_payload(state_path)
+    if payload is None or "sketches" not in payload:
+        return None
+
+    return sketch_state_from_payload(payload["sketches"])
+
+
+def apply_to_state(
+    grouping_sets: List[Tuple[str, ...]],
+    csv_path: Optional[Path] = None,
+    state_path: Optional[Path] = None,
+    engine: str = "dict",
+    sketch_sets: Optional[List[Tuple[str, ...]]] = None,
+) -> Tuple[AggregationState, SketchState]:
+    """
+    Aplica as linhas validadas de csv_path ao estado persistido:
+    - os trimestres presentes no CSV têm a contribuição antiga retirada
+      (republicação substitui o trimestre inteiro);
+    - as novas somas são adicionadas somente nos grupos afetados.
+
+    Os sketches são guardados por trimestre, então seguem a mesma regra
+    (os do trimestre republicado são descartados e os novos entram no merge).
+
+    Sem estado salvo (ou com conjuntos diferentes), o estado começa vazio.
+    Retorna (estado de agregação, sketches).
+    """
+    sketch_sets = sketch_sets if sketch_sets is not None else SKETCH_SETS
+
+    state = load_state(state_path)
+    if state is None or list(state.keys()) != grouping_sets:
+        if state is not None:
+            print("   ⚠ Estado salvo com outros conjuntos de agrupamento: o estado recomeça só com este lote.")
+        state = new_state(grouping_sets)
+
+    sketches = load_sketches(state_path)
+    if sketches is None or list(sketches.keys()) != sketch_sets:
+        if any(state.values()):
+            print("   ⚠ Estado salvo sem sketches compatíveis: a distribuição cobre só os trimestres deste lote.")
+        sketches = new_sketch_state(sketch_sets)
+
+    delta_sketches = new_sketch_state(sketch_sets)
+    delta = build_state_with_engine(grouping_sets, engine, csv_path, delta_sketches)
+    quarters = quarters_in_state(delta)
+
+    retracted = retract_quarters(state, quarters)
+    merge_states(state, delta)
+
+    retract_sketch_quarters(sketches, quarters)
+    merge_sketch_states(sketches, delta_sketches)
+
+    saved_path = save_state(state, state_path, sketches)
+
+    labels = ", ".join(f"{ano}/{trimestre}T" for ano, trimestre in quarters) or "nenhum"
+    updated = sum(len(groups) for groups in delta.values())
+    print(f"   ✔ Trimestres aplicados ao estado: {labels}")
+    print(f"   ✔ Grupos com contribuição retirada: {retracted} | grupos atualizados: {updated}")
+    print(f"   ✔ Estado salvo em: {saved_path}")
+
+    return state, sketches
+
+
+def sketch_entries(totals: AggregationState, sketch_sets: List[Tuple[str, ...]]) -> Counter:
+    """
+    Valores que um estado leva para os sketches (totais por operadora e
+    trimestre, ver feed_sketches): contagem de
+    (conjunto, grupo, trimestre, centavos, REG_ANS).
+    """
+    entries: Counter = Counter()
+
+    for grouping in sketch_sets:
+        for group_key, quarter_map in totals.get(sketch_total_set(grouping), {}).items():
+            for quarter_key, (cents, _) in quarter_map.items():
+                entries[(grouping, group_key[:-1], quarter_key, cents, group_key[-1])] += 1
+
+    return entries
+
+
+def delta_signature(previous_path: Path, csv_path: Path) -> str:
+    """
+    Assinatura (sha256) do par de arquivos de um diff do CADOP.
+    """
+    digest = hashlib.sha256()
+    for path in (resolve_table(previous_path), resolve_table(csv_path)):
+        digest.update(path.name.encode("utf-8") + b"\0")
+        with path.open(mode="rb") as fin:
+            for chunk in iter(lambda: fin.read(1024 * 1024), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def apply_row_delta(
+    grouping_sets: List[Tuple[str, ...]],
+    previous_path: Optional[Path] = None,
+    csv_path: Optional[Path] = None,
+    state_path: Optional[Path] = None,
+    sketch_sets: Optional[List[Tuple[str, ...]]] = None,
+) -> Tuple[AggregationState, SketchState]:
+    """
+    Aplica ao estado salvo a troca de versão de algumas linhas (diff do
+    CADOP): a contribuição de previous_path é retirada e a de csv_path
+    somada. As somas e contagens ficam exatas sem reler os outros registros.
+
+    A assinatura do diff fica no estado: rodar a agregação de novo com os
+    mesmos arquivos não aplica o diff duas vezes.
+
+    Sketches não aceitam remoção. As linhas de uma operadora trocam todas
+    juntas, então os totais por operadora e trimestre das duas versões são
+    completos: totais que não mudaram (nem de valor nem de grupo) se
+    cancelam e os novos entram no sketch; as células (grupo, trimestre)
+    que perderiam totais ficam marcadas como desatualizadas até o
+    trimestre ser reaplicado.
+    Retorna (estado de agregação, sketches).
+    """
+    previous_path = previous_path or CSV_PREVIOUS
+    csv_path = csv_path or CSV_DELTA
+    sketch_sets = sketch_sets if sketch_sets is not None else SKETCH_SETS
+
+    state = load_state(state_path)
+    if state is None or list(state.keys()) != grouping_sets:
+        raise RuntimeError(
+            "Sem estado de agregação compatível para aplicar o diff do CADOP. "
+            "Rode antes: python teste_2/main.py --incremental"
+        )
+
+    sketches = load_sketches(state_path)
+    if sketches is None or list(sketches.keys()) != sketch_sets:
+        print("   ⚠ Estado salvo sem sketches compatíveis: a distribuição cobre só as linhas deste diff.")
+        sketches = new_sketch_state(sketch_sets)
+
+    signature = delta_signature(previous_path, csv_path)
+    if (read_state_payload(state_path) or {}).get("diff_aplicado") == signature:
+        print("   ✔ Este diff do CADOP já está no estado: nada a trocar.")
+        return state, sketches
+
+    pass_sets = unique_grouping_sets(grouping_sets + [sketch_total_set(grouping) for grouping in sketch_sets])
+    previous = build_state(pass_sets, previous_path)
+    current = build_state(pass_sets, csv_path)
+
+    previous_entries = sketch_entries(previous, sketch_sets)
+    current_entries = sketch_entries(current, sketch_sets)
+    drop_extra_sets(previous, grouping_sets)
+    drop_extra_sets(current, grouping_sets)
+
+    subtract_states(state, previous)
+    merge_states(state, current)
+
+    for grouping, group_key, quarter_key, cents, reg_ans in sorted(current_entries - previous_entries):
+        sketch_for(sketches, grouping, group_key, quarter_key).add(cents, hll_hash(reg_ans))
+
+    stale_quarters = set()
+    for grouping, group_key, quarter_key, _, _ in previous_entries - current_entries:
+        sketch_for(sketches, grouping, group_key, quarter_key).stale = True
+        stale_quarters.add(quarter_key)
+
+    saved_path = save_state(state, state_path, sketches, applied_delta=signature)
+
+    # Toda linha entra uma vez em cada conjunto: o primeiro basta para contar
+    removed = sum(count for quarter_map in next(iter(previous.values()), {}).values() for _, count in quarter_map.values())
+    added = sum(count for quarter_map in next(iter(current.values()), {}).values() for _, count in quarter_map.values())
+    updated = sum(len(groups) for groups in previous.values()) + sum(len(groups) for groups in current.values())
+    print(f"   ✔ Linhas retiradas (versão anterior): {removed} | linhas somadas (versão nova): {added}")
+    print(f"   ✔ Grupos atualizados: {updated}")
+    if stale_quarters:
+        first, last = min(stale_quarters), max(stale_quarters)
+        print(f"   ⚠ Sketches com valores a retirar em {len(stale_quarters)} trimestre(s): para recalcular a "
+              f"distribuição, reaplique com --incremental --trimestres {first[0]}T{first[1]}:{last[0]}T{last[1]}")
+    print(f"   ✔ Estado salvo em: {saved_path}")
+
+    return state, sketches
+
+
+def aggregate(
+    grouping_sets: Optional[List[Tuple[str, ...]]] = None,
+    workers: int = 1,
+    incremental: bool = False,
+    engine: str = "dict",
+    memory_limit: Optional[int] = None,
+    sketch_sets: Optional[List[Tuple[str, ...]]] = None,
+    growth_sets: Optional[List[Tuple[str, ...]]] = None,
+    growth_top_k: int = GROWTH_TOP_K,
+) -> None:
+    """
+    Agrupa por cada conjunto de GROUPING_SETS (padrão: (RazaoSocial, UF),
+    ROLLUP de (UF, Modalidade), Modalidade, REG_ANS, (REG_ANS, RazaoSocial)
+    e (Ano, Trimestre))
+    e calcula para cada grupo:
+    - Total de despesas
+    - Média por trimestre (baseada no total por trimestre)
+    - Desvio padrão entre trimestres
+
+    Todos os conjuntos são calculados numa única leitura do CSV validado,
+    e cada um é gravado no seu próprio arquivo.
+
+    Na mesma leitura, para cada conjunto de SKETCH_SETS (padrão: UF e
+    Modalidade), sketches de memória limitada estimam a mediana e o p95
+    do total de cada operadora por trimestre e a quantidade de operadoras
+    distintas
+    (despesas_distribuicao_por_<conjunto>.csv; ver sketches.py).
+
+    Para cada conjunto de GROWTH_SETS que também está em grouping_sets
+    (padrão: (REG_ANS, RazaoSocial) e UF), o crescimento entre o primeiro e
+    o último trimestre, a variação trimestre a trimestre e o ranking dos
+    `growth_top_k` maiores crescimentos saem na mesma gravação (GrowthReport).
+
+    Com workers > 1 a leitura é dividida entre processos (ver aggregate_parallel).
+
+    Com incremental=True o CSV validado é tratado como um lote de trimestres
+    novos/republicados: ele atualiza o estado salvo em STATE_FILE e os CSVs
+    são regenerados a partir do estado (custo proporcional ao número de grupos).
+
+    Se houver CSV_DELTA e CSV_PREVIOUS (diff do CADOP, ver
+    enricher.run_cadop_update), o modo incremental troca a versão anterior
+    das linhas pela nova (apply_row_delta) em vez de substituir trimestres.
+    Fora do modo incremental o CSV validado (completo) é agregado inteiro.
+
+    engine="numpy" usa o engine colunar (resultado idêntico ao engine "dict",
+    inclusive a distribuição dos sketches).
+
+    memory_limit (bytes) ativa o modo com limite de memória: agrupamento com
+    spill particionado em disco e ordenação externa (ver
+    aggregate_with_memory_limit). Esse modo é serial, com o engine "dict".
+    """
+    ensure_output_dir()
+
+    if not table_exists(CSV_INPUT):
+        raise FileNotFoundError(
+            f"Arquivo não encontrado: {CSV_INPUT}. Rode antes: python teste_2/validator.py"
+        )
+
+    grouping_sets = unique_grouping_sets(grouping_sets or GROUPING_SETS)
+    sketch_sets = unique_grouping_sets(sketch_sets if sketch_sets is not None else SKETCH_SETS)
+    sketches = new_sketch_state(sketch_sets)
+    growth_sets = [
+        grouping
+        for grouping in unique_grouping_sets(growth_sets if growth_sets is not None else GROWTH_SETS)
+        if grouping in grouping_sets
+    ]
+    workers = max(1, workers)
+    budget = MemoryBudget(memory_limit) if memory_limit is not None else None
+
+    with spill_directory(OUTPUT_DIR) if budget is not None else nullcontext() as spill_dir:
+        work_dir = Path(spill_dir) if spill_dir is not None else None
+
+        if incremental and table_exists(CSV_DELTA) and table_exists(CSV_PREVIOUS):
+            state, sketches = apply_row_delta(grouping_sets, sketch_sets=sketch_sets)
+            results = {
+                grouping: summarize_groups(grouping, state[grouping])
+                for grouping in grouping_sets
+            }
+        elif incremental:
+            state, sketches = apply_to_state(grouping_sets, engine=engine, sketch_sets=sketch_sets)
+            results = {
+                grouping: summarize_groups(grouping, state[grouping])
+                for grouping in grouping_sets
+            }
+        elif budget is not None and work_dir is not None:
+            results = aggregate_with_memory_limit(grouping_sets, budget, work_dir, sketches=sketches)
+        elif workers > 1 and engine == "dict":
+            results = aggregate_parallel(grouping_sets, workers, sketches)
+        else:
+            state = build_state_with_engine(grouping_sets, engine, sketches=sketches)
+            results = {
+                grouping: summarize_groups(grouping, state[grouping])
+                for grouping in grouping_sets
+            }
+
+        print("✅ Agregação concluída!")
+        if budget is not None:
+            if not incremental and (engine != "dict" or workers > 1):
+                print("   ⚠ Limite de memória ativo: agregação serial com engine 'dict'.")
+        elif engine != "dict":
+            print(f"   ✔ Engine: {engine}")
+        elif workers > 1 and not incremental:
+            print(f"   ✔ Processos utilizados: {workers}")
+
+        for grouping in grouping_sets:
+            growth = GrowthReport(grouping, growth_top_k) if grouping in growth_sets else None
+            output_path, count = write_grouping(grouping, results[grouping], budget, work_dir, growth)
+            label = " + ".join(grouping) if grouping else "total geral"
+            print(f"   ✔ Grupos ({label}): {count} -> {output_path}")
+
+            if growth is not None:
+                ranking = growth.close()
+                print(f"   ✔ Crescimento ({label}): {growth.count} grupos -> {growth.growth_path}")
+                print(f"   ✔ Variação trimestral ({label}) -> {growth.qoq_path}")
+                print(f"   ✔ Top {growth.top_k} crescimento ({label}): {len(ranking)} grupos -> {growth.ranking_path}")
+
+        for grouping in sketch_sets:
+            output_path, count = write_sketches(grouping, sketches)
+            print(f"   ✔ Distribuição ({' + '.join(grouping)}): {count} grupos -> {output_path}")
 
+        if budget is not None:
+            print(f"   ✔ Memória: {budget.describe()}")
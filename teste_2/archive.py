@@ -0,0 +1,248 @@
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+import os
+import shutil
+import sys
+import time
+import zipfile
+import zlib
+from pathlib import Path
+
+# Escrita de arquivos ZIP em streaming, com codec/nível configuráveis
+# e compressão deflate em blocos paralelos.
+#
+# Este arquivo é copiado sem alterações em teste_1 e teste_2
+# (mesma estratégia do utils.py e do dataset.py).
+
+CODECS: Dict[str, int] = {
+    "deflate": zipfile.ZIP_DEFLATED,
+    "bzip2": zipfile.ZIP_BZIP2,
+    "lzma": zipfile.ZIP_LZMA,
+}
+
+DEFAULT_CODEC = "deflate"
+
+# Nível padrão de cada codec (o lzma do zipfile não tem nível)
+DEFAULT_LEVELS: Dict[str, Optional[int]] = {"deflate": 6, "bzip2": 9, "lzma": None}
+
+# Tamanho dos blocos comprimidos em paralelo (deflate)
+PARALLEL_BLOCK_SIZE = 1024 * 1024
+
+# Janela do deflate: cada bloco usa os últimos 32 KB do anterior como
+# dicionário, então a taxa de compressão fica praticamente igual à serial
+DEFLATE_WINDOW = 32 * 1024
+
+# Buffer de cópia de arquivos para dentro do ZIP
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class CompressionSettings:
+    """
+    Codec, nível e quantidade de threads usados num membro do ZIP.
+    threads > 1 só vale para deflate (bzip2 e lzma rodam em uma thread).
+    """
+
+    def __init__(self, codec: str = DEFAULT_CODEC, level: Optional[int] = None, threads: int = 1) -> None:
+        if codec not in CODECS:
+            raise ValueError(f"Codec inválido: {codec!r} (use: {', '.join(CODECS)})")
+
+        self.codec = codec
+        # O lzma do zipfile não aceita nível: o valor informado é ignorado
+        self.level = DEFAULT_LEVELS[codec] if level is None or codec == "lzma" else level
+        self.threads = max(1, threads) if codec == "deflate" else 1
+
+        if codec == "deflate" and not 0 <= self.level <= 9:
+            raise ValueError("Nível do deflate deve estar entre 0 e 9.")
+        if codec == "bzip2" and not 1 <= self.level <= 9:
+            raise ValueError("Nível do bzip2 deve estar entre 1 e 9.")
+
+    def describe(self) -> str:
+        level = f" nível {self.level}" if self.level is not None else ""
+        threads = f", {self.threads} threads" if self.threads > 1 else ""
+        return f"{self.codec}{level}{threads}"
+
+
+def compress_block(data: bytes, dictionary: bytes, level: int, last: bool) -> bytes:
+    """
+    Comprime um bloco como deflate "cru" (sem cabeçalho zlib).
+
+    Blocos intermediários terminam com Z_SYNC_FLUSH (fecham num limite de
+    byte, sem marcar fim de stream), então a concatenação de todos é um
+    único stream deflate válido. O zlib libera o GIL durante a compressão.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary) \
+        if dictionary else zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class ParallelDeflater:
+    """
+    Compressor deflate com a mesma interface do zlib.compressobj
+    (compress / flush), que divide a entrada em blocos e os comprime num
+    pool de threads, devolvendo a saída na ordem original.
+
+    No máximo 2 * threads blocos ficam pendentes em memória.
+    """
+
+    def __init__(self, level: int, threads: int, block_size: int = PARALLEL_BLOCK_SIZE) -> None:
+        self.level = level
+        self.block_size = block_size
+        self.max_pending = 2 * threads
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.pending: "deque[Future]" = deque()
+        self.buffer = bytearray()
+        self.dictionary = b""
+
+    def _submit(self, data: bytes, last: bool) -> None:
+        self.pending.append(self.executor.submit(compress_block, data, self.dictionary, self.level, last))
+        self.dictionary = data[-DEFLATE_WINDOW:]
+
+    def _collect(self, wait_all: bool) -> bytes:
+        output: List[bytes] = []
+        while self.pending and (wait_all or self.pending[0].done() or len(self.pending) > self.max_pending):
+            output.append(self.pending.popleft().result())
+        return b"".join(output)
+
+    def compress(self, data: bytes) -> bytes:
+        self.buffer += data
+
+        while len(self.buffer) >= self.block_size:
+            block = bytes(self.buffer[:self.block_size])
+            del self.buffer[:self.block_size]
+            self._submit(block, last=False)
+
+        return self._collect(wait_all=False)
+
+    def flush(self) -> bytes:
+        self._submit(bytes(self.buffer), last=True)
+        self.buffer = bytearray()
+
+        try:
+            return self._collect(wait_all=True)
+        finally:
+            self.executor.shutdown(wait=True)
+
+
+@contextmanager
+def zip_archive(zip_path: Path) -> Iterator[zipfile.ZipFile]:
+    """
+    Abre um ZIP para escrita num arquivo temporário e só o publica
+    (os.replace) se tudo der certo — nunca fica um ZIP pela metade.
+    """
+    zip_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = zip_path.with_name(f".{zip_path.name}.{os.getpid()}.tmp")
+
+    try:
+        with zipfile.ZipFile(temp_path, mode="w") as zip_file:
+            yield zip_file
+        os.replace(temp_path, zip_path)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+
+
+@contextmanager
+def open_member(
+    zip_file: zipfile.ZipFile,
+    arcname: str,
+    settings: Optional[CompressionSettings] = None
+) -> Iterator[BinaryIO]:
+    """
+    Abre um membro do ZIP para escrita em streaming (nada passa por
+    arquivo intermediário no disco).
+
+    Com deflate e threads > 1, o compressor do membro é trocado pelo
+    ParallelDeflater; o zipfile continua cuidando de CRC, tamanhos e
+    cabeçalhos (ZIP64 quando necessário).
+    """
+    settings = settings or CompressionSettings()
+
+    info = zipfile.ZipInfo(arcname, date_time=time.localtime(time.time())[:6])
+    info.compress_type = CODECS[settings.codec]
+    info.external_attr = 0o644 << 16
+    if settings.level is not None:
+        # Python 3.13+ expõe compress_level; versões anteriores, _compresslevel
+        if hasattr(info, "compress_level"):
+            info.compress_level = settings.level
+        else:
+            info._compresslevel = settings.level
+
+    with zip_file.open(info, mode="w", force_zip64=True) as member:
+        if settings.threads > 1 and hasattr(member, "_compressor"):
+            member._compressor = ParallelDeflater(settings.level, settings.threads)
+        yield member
+
+
+def add_file(
+    zip_file: zipfile.ZipFile,
+    path: Path,
+    arcname: Optional[str] = None,
+    settings: Optional[CompressionSettings] = None
+) -> None:
+    """
+    Copia um arquivo do disco para dentro do ZIP em blocos.
+    """
+    with path.open("rb") as source, open_member(zip_file, arcname or path.name, settings) as member:
+        shutil.copyfileobj(source, member, COPY_BUFFER_SIZE)
+
+
+def benchmark(
+    source: Path,
+    settings_list: List[CompressionSettings]
+) -> List[Tuple[CompressionSettings, float, int]]:
+    """
+    Comprime `source` com cada configuração e mede (tempo, tamanho do ZIP).
+    Os ZIPs de teste são gravados ao lado do arquivo e apagados no final.
+    """
+    results: List[Tuple[CompressionSettings, float, int]] = []
+    target = source.with_name(f".{source.name}.benchmark.zip")
+
+    try:
+        for settings in settings_list:
+            started = time.perf_counter()
+            with zip_archive(target) as zip_file:
+                add_file(zip_file, source, settings=settings)
+            results.append((settings, time.perf_counter() - started, target.stat().st_size))
+    finally:
+        if target.exists():
+            target.unlink()
+
+    return results
+
+
+def default_benchmark_settings() -> List[CompressionSettings]:
+    threads = min(8, os.cpu_count() or 1)
+    settings = [
+        CompressionSettings("deflate", 1),
+        CompressionSettings("deflate", 6),
+        CompressionSettings("deflate", 9),
+    ]
+    if threads > 1:
+        settings += [
+            CompressionSettings("deflate", 1, threads),
+            CompressionSettings("deflate", 6, threads),
+            CompressionSettings("deflate", 9, threads),
+        ]
+    settings += [CompressionSettings("bzip2", 9), CompressionSettings("lzma")]
+    return settings
+
+
+def print_benchmark(source: Path, results: List[Tuple[CompressionSettings, float, int]]) -> None:
+    original = source.stat().st_size
+    print(f"📦 {source} ({original / 1024 ** 2:.1f} MB)")
+    print(f"{'Configuração':<28}{'Tempo':>9}{'Tamanho':>12}{'Taxa':>8}")
+    print("-" * 57)
+    for settings, seconds, size in results:
+        print(f"{settings.describe():<28}{seconds:>8.2f}s{size / 1024 ** 2:>10.2f}MB{size / max(1, original):>8.1%}")
+
+
+if __name__ == "__main__":
+    # Uso: python archive.py <arquivo> — compara codecs, níveis e threads
+    if len(sys.argv) != 2:
+        sys.exit("Uso: python archive.py <arquivo>")
+
+    source_path = Path(sys.argv[1])
+    print_benchmark(source_path, benchmark(source_path, default_benchmark_settings()))
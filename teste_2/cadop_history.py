@@ -0,0 +1,377 @@
+from __future__ import annotations
+
+import sqlite3
+import sys
+from datetime import date, datetime
+from itertools import groupby
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Histórico do cadastro de operadoras (CADOP) para o join por data.
+#
+# Cada CSV baixado (ativas ou canceladas) vira um snapshot num SQLite.
+# A partir dos snapshots são montadas as vigências de cada operadora:
+# intervalos [inicio, fim) com CNPJ, razão social, modalidade e UF.
+# Um trimestre (REG_ANS, Ano, Trimestre) é resolvido pela vigência em
+# curso no fim do trimestre, com uma busca na chave (registro, inicio):
+# O(log) no B-tree, sem carregar os snapshots em dicionários.
+
+ORIGIN_ACTIVE = "ativas"
+ORIGIN_CANCELED = "canceladas"
+
+HISTORY_SCHEMA_VERSION = 1
+
+# Resultados de lookup guardados em memória (por REG_ANS e trimestre);
+# acima disso o cache é esvaziado
+LOOKUP_CACHE_SIZE = 100_000
+
+# Registros gravados por executemany
+INSERT_BATCH_ROWS = 5_000
+
+# Um registro do CADOP: (REGISTRO_OPERADORA, cadastro, data de registro,
+# data de descredenciamento), com as datas como vieram no CSV
+HistoryRecord = Tuple[str, Dict[str, str], str, str]
+
+SCHEMA = f"""
+PRAGMA user_version = {HISTORY_SCHEMA_VERSION};
+
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    origem TEXT NOT NULL,
+    arquivo TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    data_referencia TEXT NOT NULL,
+    registros INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS registros (
+    registro TEXT NOT NULL,
+    snapshot_id INTEGER NOT NULL,
+    cnpj TEXT NOT NULL,
+    razao_social TEXT NOT NULL,
+    modalidade TEXT NOT NULL,
+    uf TEXT NOT NULL,
+    data_registro TEXT NOT NULL,
+    data_descredenciamento TEXT NOT NULL,
+    PRIMARY KEY (registro, snapshot_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS vigencias (
+    registro TEXT NOT NULL,
+    inicio TEXT NOT NULL,
+    fim TEXT,
+    cnpj TEXT NOT NULL,
+    razao_social TEXT NOT NULL,
+    modalidade TEXT NOT NULL,
+    uf TEXT NOT NULL,
+    PRIMARY KEY (registro, inicio)
+) WITHOUT ROWID;
+"""
+
+LOOKUP_SQL = """
+SELECT cnpj, razao_social, modalidade, uf
+FROM vigencias
+WHERE registro = ? AND inicio <= ? AND (fim IS NULL OR fim > ?)
+ORDER BY inicio DESC
+LIMIT 1
+"""
+
+
+def parse_date(text: str) -> str:
+    """
+    Data do CADOP em ISO (AAAA-MM-DD). Aceita AAAA-MM-DD (com ou sem hora)
+    e DD/MM/AAAA; retorna '' se vazia ou inválida.
+    """
+    text = (text or "").strip()
+    for pattern, size in (("%Y-%m-%d", 10), ("%d/%m/%Y", 10)):
+        try:
+            return datetime.strptime(text[:size], pattern).date().isoformat()
+        except ValueError:
+            continue
+    return ""
+
+
+def quarter_bounds(ano: str, trimestre: str) -> Optional[Tuple[str, str]]:
+    """
+    Primeiro e último dia de um trimestre (ISO), ou None se inválido.
+    """
+    try:
+        year, quarter = int(str(ano).strip()), int(str(trimestre).strip())
+    except ValueError:
+        return None
+    if not 1 <= quarter <= 4:
+        return None
+
+    first_month = 3 * quarter - 2
+    start = date(year, first_month, 1)
+    end = date(year + 1, 1, 1) if quarter == 4 else date(year, first_month + 3, 1)
+    return start.isoformat(), date.fromordinal(end.toordinal() - 1).isoformat()
+
+
+def build_versions(
+    observations: List[Tuple[str, int, Tuple[str, str, str, str], str, str]],
+    active_positions: Dict[int, int],
+    active_dates: List[str],
+) -> List[List[object]]:
+    """
+    Vigências de uma operadora a partir das observações dela nos snapshots
+    (origem, snapshot_id, atributos, data de registro, descredenciamento),
+    em ordem cronológica. Cada vigência é [inicio, fim, atributos]:
+    - a primeira começa na data de registro (ou '' = desde sempre);
+    - uma mudança de atributos fecha a vigência na data do snapshot;
+    - sumir do CADOP de ativas fecha a vigência na data do snapshot em que
+      sumiu; a lista de canceladas corrige para a data do descredenciamento;
+    - uma operadora que só aparece nas canceladas ganha uma vigência do
+      registro ao descredenciamento.
+    """
+    versions: List[List[object]] = []
+    last_position: Optional[int] = None
+    canceled: Optional[Tuple[Tuple[str, str, str, str], str, str]] = None
+
+    for origin, snapshot_id, attributes, registered, deregistered in observations:
+        if origin != ORIGIN_ACTIVE:
+            canceled = (attributes, registered, deregistered)
+            continue
+
+        position = active_positions[snapshot_id]
+        snapshot_date = active_dates[position]
+
+        if versions and last_position == position - 1:
+            if versions[-1][2] == attributes:
+                last_position = position
+                continue
+            versions[-1][1] = snapshot_date
+            start = snapshot_date
+        elif versions:
+            # Voltou ao CADOP depois de ter saído
+            versions[-1][1] = versions[-1][1] or active_dates[last_position + 1]
+            start = registered if registered > str(versions[-1][1]) else snapshot_date
+        else:
+            start = registered
+
+        if versions and versions[-1][0] == start:
+            # Duas versões no mesmo dia: vale a mais recente
+            versions[-1][1:] = [None, attributes]
+        else:
+            versions.append([start, None, attributes])
+        last_position = position
+
+    if versions and last_position is not None and last_position < len(active_dates) - 1:
+        versions[-1][1] = versions[-1][1] or active_dates[last_position + 1]
+
+    if canceled is not None:
+        attributes, registered, deregistered = canceled
+        if not versions:
+            versions.append([registered, deregistered or None, attributes])
+        elif versions[-1][1] is not None:
+            if deregistered and deregistered > str(versions[-1][0]):
+                versions[-1][1] = deregistered
+        elif deregistered and registered < deregistered and (not versions[0][0] or deregistered <= str(versions[0][0])):
+            # Cancelada e registrada de novo com o mesmo número
+            versions[0][0] = max(str(versions[0][0]), deregistered)
+            versions.insert(0, [registered, deregistered, attributes])
+
+    return versions
+
+
+class CadopHistory:
+    """
+    Snapshots do CADOP e vigências por operadora num SQLite.
+
+    lookup(REG_ANS, Ano, Trimestre) devolve o cadastro (mesmo formato do
+    load_cadop_map) em vigor naquele trimestre, ou None.
+    """
+
+    def __init__(self, db_path: Path) -> None:
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, HISTORY_SCHEMA_VERSION):
+            self.conn.close()
+            raise RuntimeError(f"Histórico do CADOP com versão {version}: apague {self.db_path} e baixe de novo.")
+        self.conn.executescript(SCHEMA)
+
+        self.cache: Dict[Tuple[str, str, str], Optional[Dict[str, str]]] = {}
+        self.lookups = 0
+        self.queries = 0
+
+    def __enter__(self) -> "CadopHistory":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def latest_snapshot(self, origin: str) -> Optional[Tuple[int, str, str]]:
+        """
+        (id, sha256, data de referência) do snapshot mais recente da origem.
+        """
+        return self.conn.execute(
+            "SELECT id, sha256, data_referencia FROM snapshots WHERE origem = ? "
+            "ORDER BY data_referencia DESC, id DESC LIMIT 1",
+            (origin,),
+        ).fetchone()
+
+    def add_snapshot(
+        self,
+        origin: str,
+        filename: str,
+        sha256: str,
+        reference_date: str,
+        records: Iterable[HistoryRecord],
+    ) -> bool:
+        """
+        Registra um CSV baixado e remonta as vigências. O mesmo arquivo
+        (sha256 igual ao do último snapshot da origem) não é registrado de
+        novo. Retorna True se o snapshot foi adicionado.
+
+        Snapshots precisam chegar em ordem cronológica por origem.
+        """
+        latest = self.latest_snapshot(origin)
+        if latest is not None and latest[1] == sha256:
+            return False
+        if latest is not None and reference_date < latest[2]:
+            raise ValueError(
+                f"Snapshot do CADOP ({origin}) de {reference_date} é anterior ao último registrado ({latest[2]})."
+            )
+
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO snapshots (origem, arquivo, sha256, data_referencia, registros) VALUES (?, ?, ?, ?, 0)",
+                (origin, filename, sha256, reference_date),
+            )
+            snapshot_id = cursor.lastrowid
+
+            batch: List[Tuple[object, ...]] = []
+            for registro, cadastro, registered, deregistered in records:
+                batch.append((
+                    registro, snapshot_id,
+                    cadastro["CNPJ"], cadastro["RazaoSocial"], cadastro["Modalidade"], cadastro["UF"],
+                    parse_date(registered), parse_date(deregistered),
+                ))
+                if len(batch) >= INSERT_BATCH_ROWS:
+                    self._insert_records(batch)
+                    batch = []
+            self._insert_records(batch)
+
+            self.conn.execute(
+                "UPDATE snapshots SET registros = (SELECT COUNT(*) FROM registros WHERE snapshot_id = ?) WHERE id = ?",
+                (snapshot_id, snapshot_id),
+            )
+
+        self.rebuild_versions()
+        return True
+
+    def _insert_records(self, batch: List[Tuple[object, ...]]) -> None:
+        # REGISTRO_OPERADORA duplicado no CSV: mantém o primeiro (mesma regra do load_cadop_map)
+        self.conn.executemany("INSERT OR IGNORE INTO registros VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+
+    def rebuild_versions(self) -> int:
+        """
+        Remonta a tabela de vigências a partir de todos os snapshots,
+        uma operadora por vez. Retorna a quantidade de vigências.
+        """
+        active = self.conn.execute(
+            "SELECT id, data_referencia FROM snapshots WHERE origem = ? ORDER BY data_referencia, id",
+            (ORIGIN_ACTIVE,),
+        ).fetchall()
+        active_positions = {snapshot_id: position for position, (snapshot_id, _) in enumerate(active)}
+        active_dates = [reference_date for _, reference_date in active]
+
+        observations = self.conn.execute(
+            "SELECT r.registro, s.origem, s.id, r.cnpj, r.razao_social, r.modalidade, r.uf, "
+            "r.data_registro, r.data_descredenciamento "
+            "FROM registros r JOIN snapshots s ON s.id = r.snapshot_id "
+            "ORDER BY r.registro, s.data_referencia, s.id"
+        )
+
+        count = 0
+        with self.conn:
+            self.conn.execute("DELETE FROM vigencias")
+            batch: List[Tuple[object, ...]] = []
+
+            for registro, rows in groupby(observations, key=lambda row: row[0]):
+                history = [(row[1], row[2], tuple(row[3:7]), row[7], row[8]) for row in rows]
+                for start, end, attributes in build_versions(history, active_positions, active_dates):
+                    batch.append((registro, start, end, *attributes))
+
+                if len(batch) >= INSERT_BATCH_ROWS:
+                    self.conn.executemany("INSERT INTO vigencias VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+                    count += len(batch)
+                    batch = []
+
+            self.conn.executemany("INSERT INTO vigencias VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+            count += len(batch)
+
+        self.cache.clear()
+        return count
+
+    def counts(self) -> Tuple[int, int, int]:
+        """
+        (snapshots, operadoras, vigências) do histórico.
+        """
+        snapshots = self.conn.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0]
+        operators, versions = self.conn.execute("SELECT COUNT(DISTINCT registro), COUNT(*) FROM vigencias").fetchone()
+        return snapshots, operators, versions
+
+    def versions(self, registro: str) -> List[Dict[str, str]]:
+        """
+        Vigências de uma operadora, em ordem (para conferência).
+        """
+        rows = self.conn.execute(
+            "SELECT inicio, fim, cnpj, razao_social, modalidade, uf FROM vigencias WHERE registro = ? ORDER BY inicio",
+            (registro.strip(),),
+        )
+        fields = ["Inicio", "Fim", "CNPJ", "RazaoSocial", "Modalidade", "UF"]
+        return [dict(zip(fields, (value or "" for value in row))) for row in rows]
+
+    def lookup(self, registro: str, ano: str, trimestre: str) -> Optional[Dict[str, str]]:
+        """
+        Cadastro em vigor no trimestre: a vigência que cobre algum dia do
+        trimestre e começou por último (a que vale no fim do trimestre).
+        """
+        self.lookups += 1
+        key = (registro, ano, trimestre)
+        if key in self.cache:
+            return self.cache[key]
+
+        bounds = quarter_bounds(ano, trimestre)
+        found = None
+        if registro and bounds is not None:
+            self.queries += 1
+            found = self.conn.execute(LOOKUP_SQL, (registro, bounds[1], bounds[0])).fetchone()
+
+        cadastro = None
+        if found is not None:
+            cnpj, razao, modalidade, uf = found
+            cadastro = {"CNPJ": cnpj, "RazaoSocial": razao, "Modalidade": modalidade, "UF": uf, "RegistroANS": registro}
+
+        if len(self.cache) >= LOOKUP_CACHE_SIZE:
+            self.cache.clear()
+        self.cache[key] = cadastro
+        return cadastro
+
+
+if __name__ == "__main__":
+    # Uso: python cadop_history.py <historico.sqlite> REG_ANS [ANO TRIMESTRE]
+    # Mostra as vigências da operadora (ou o cadastro em vigor no trimestre).
+    if len(sys.argv) not in (3, 5):
+        sys.exit("Uso: python cadop_history.py <historico.sqlite> REG_ANS [ANO TRIMESTRE]")
+
+    db_path = Path(sys.argv[1])
+    if not db_path.exists():
+        sys.exit(f"❌ Histórico não encontrado: {db_path}")
+
+    with CadopHistory(db_path) as opened:
+        if len(sys.argv) == 5:
+            print(opened.lookup(sys.argv[2], sys.argv[3], sys.argv[4]) or "sem cadastro em vigor")
+        else:
+            for version in opened.versions(sys.argv[2]):
+                print(f"{version['Inicio'] or '...':>10} -> {version['Fim'] or '...':<10} "
+                      f"{version['RazaoSocial']} | {version['Modalidade']} | {version['UF']}")
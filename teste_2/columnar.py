@@ -0,0 +1,403 @@
+from __future__ import annotations
+
+import csv
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy é opcional: só é necessário para o engine colunar
+    np = None
+
+from aggregator import (
+    DELIMITER,
+    AggregationState,
+    dimension_value,
+    drop_extra_sets,
+    feed_sketches,
+    is_expense_row,
+    new_state,
+    parse_cents,
+    safe_str,
+    with_sketch_totals,
+)
+from arrow_io import is_arrow, is_text_type, read_arrow_table, text_value
+from sketches import SketchState
+
+# Colunas de texto codificadas em dicionário (valor -> código inteiro)
+STRING_COLUMNS = ["REG_ANS", "RazaoSocial", "UF", "Modalidade"]
+
+# Colunas numéricas (int16)
+PERIOD_COLUMNS = ["Ano", "Trimestre"]
+PERIOD_RADIX = 100_000
+
+# Maior espaço de chaves (produto das cardinalidades) que cabe na chave
+# combinada em int64; acima disso o agrupamento usa a matriz de códigos
+MAX_COMBINED_KEYS = 2 ** 63
+
+
+def require_numpy() -> None:
+    """
+    Falha com mensagem clara quando numpy não está instalado.
+    """
+    if np is None:
+        raise RuntimeError(
+            "O engine colunar precisa do numpy. Instale com: pip install numpy "
+            "(ou use o engine padrão: --engine dict)."
+        )
+
+
+def is_plain_int(text: str) -> bool:
+    """
+    True se o texto é um inteiro sem zeros à esquerda (volta igual após int -> str).
+    """
+    return text.isdigit() and text == str(int(text))
+
+
+class ColumnarExpenses:
+    """
+    Representação colunar (em memória) do CSV validado:
+    - REG_ANS, RazaoSocial, UF e Modalidade codificados em dicionário (int32);
+    - Ano e Trimestre em int16;
+    - ValorDespesas em centavos (int64).
+
+    Só entram as linhas que a agregação considera válidas
+    (mesmas regras de aggregator.accumulate_row).
+    """
+
+    def __init__(
+        self,
+        codes: Dict[str, "np.ndarray"],
+        dictionaries: Dict[str, List[str]],
+        ano: "np.ndarray",
+        trimestre: "np.ndarray",
+        cents: "np.ndarray",
+    ) -> None:
+        self.codes = codes
+        self.dictionaries = dictionaries
+        self.ano = ano
+        self.trimestre = trimestre
+        self.cents = cents
+
+    def __len__(self) -> int:
+        return int(self.cents.shape[0])
+
+    @classmethod
+    def from_csv(cls, csv_path: Path) -> "ColumnarExpenses":
+        """
+        Lê o CSV uma vez e monta as colunas.
+        """
+        require_numpy()
+
+        lookups: Dict[str, Dict[str, int]] = {column: {} for column in STRING_COLUMNS}
+        code_lists: Dict[str, List[int]] = {column: [] for column in STRING_COLUMNS}
+        anos: List[int] = []
+        trimestres: List[int] = []
+        cents_list: List[int] = []
+
+        with csv_path.open(mode="r", encoding="utf-8", newline="") as fin:
+            reader = csv.DictReader(fin, delimiter=DELIMITER)
+            if not reader.fieldnames:
+                raise ValueError("CSV de entrada não possui cabeçalho.")
+
+            for row in reader:
+                if not is_expense_row(row):
+                    continue
+
+                razao = safe_str(row.get("RazaoSocial", ""))
+                ano = safe_str(row.get("Ano", ""))
+                trimestre = safe_str(row.get("Trimestre", ""))
+
+                if not razao or not ano or not trimestre:
+                    continue
+
+                cents = parse_cents(row.get("ValorDespesas", ""))
+                if cents is None:
+                    continue
+
+                if not is_plain_int(ano) or not is_plain_int(trimestre):
+                    raise ValueError(
+                        f"Ano/Trimestre fora do formato numérico ({ano!r}/{trimestre!r}); "
+                        "use o engine padrão (dict)."
+                    )
+
+                for column in STRING_COLUMNS:
+                    value = dimension_value(row, column)
+                    lookup = lookups[column]
+                    code = lookup.get(value)
+                    if code is None:
+                        code = len(lookup)
+                        lookup[value] = code
+                    code_lists[column].append(code)
+
+                anos.append(int(ano))
+                trimestres.append(int(trimestre))
+                cents_list.append(cents)
+
+        codes = {column: np.asarray(values, dtype=np.int32) for column, values in code_lists.items()}
+        dictionaries = {column: list(lookup.keys()) for column, lookup in lookups.items()}
+
+        return cls(
+            codes=codes,
+            dictionaries=dictionaries,
+            ano=np.asarray(anos, dtype=np.int16),
+            trimestre=np.asarray(trimestres, dtype=np.int16),
+            cents=np.asarray(cents_list, dtype=np.int64),
+        )
+
+    @classmethod
+    def from_arrow(cls, arrow_path: Path) -> "ColumnarExpenses":
+        """
+        Monta as colunas a partir do arquivo Arrow mapeado em memória, sem
+        criar um dicionário por linha: o pyarrow codifica cada coluna em
+        dicionário, as regras de from_csv (conta, campos vazios, centavos,
+        "Desconhecido") rodam uma vez por valor distinto e chegam às linhas
+        por indexação no numpy. Mesmas linhas e mesmos códigos (ordem de
+        primeira aparição) de from_csv.
+
+        Ano e Trimestre inteiros (arrow_io.TYPED_COLUMNS) vão direto para o
+        numpy. ValorDespesas (float64) passa por parse_cents uma vez por
+        valor distinto, sobre o mesmo texto do CSV, para os centavos saírem
+        iguais aos do engine dict. Arquivos com essas colunas em texto
+        (gravados antes dos tipos) também são aceitos.
+        """
+        require_numpy()
+        table = read_arrow_table(arrow_path)
+
+        def encode(column: str) -> Tuple["np.ndarray", List[str]]:
+            # (índice do valor em cada linha, valores distintos); coluna ausente = ""
+            if column not in table.column_names:
+                return np.zeros(table.num_rows, dtype=np.int32), [""]
+
+            data = table.column(column)
+            chunks = data.dictionary_encode().unify_dictionaries().chunks
+            if not chunks:
+                return np.zeros(0, dtype=np.int32), [""]
+
+            values = [text_value(value) for value in chunks[0].dictionary.to_pylist()]
+            # Nulo (ex: número vazio) vira um valor a mais, com o texto "" do CSV
+            if data.null_count:
+                chunks = [chunk.indices.fill_null(len(values)) for chunk in chunks]
+                values.append("")
+            else:
+                chunks = [chunk.indices for chunk in chunks]
+
+            indices = np.concatenate([chunk.to_numpy(zero_copy_only=False) for chunk in chunks])
+            return indices, values
+
+        def per_value(values: List[str], rule, dtype) -> "np.ndarray":
+            return np.asarray([rule(value) for value in values], dtype=dtype)
+
+        encoded = {column: encode(column) for column in STRING_COLUMNS}
+        conta_index, conta_values = encode("Conta")
+        ano_index, ano_values = encode("Ano")
+        trimestre_index, trimestre_values = encode("Trimestre")
+        valor_index, valor_values = encode("ValorDespesas")
+        razao_index, razao_values = encoded["RazaoSocial"]
+
+        parsed_cents = [parse_cents(value) for value in valor_values]
+
+        keep = per_value(conta_values, lambda value: is_expense_row({"Conta": value}), bool)[conta_index]
+        keep &= per_value(razao_values, lambda value: bool(safe_str(value)), bool)[razao_index]
+        keep &= per_value(ano_values, lambda value: bool(safe_str(value)), bool)[ano_index]
+        keep &= per_value(trimestre_values, lambda value: bool(safe_str(value)), bool)[trimestre_index]
+        keep &= np.asarray([cents is not None for cents in parsed_cents], dtype=bool)[valor_index]
+
+        ano_plain = per_value(ano_values, lambda value: is_plain_int(safe_str(value)), bool)
+        trimestre_plain = per_value(trimestre_values, lambda value: is_plain_int(safe_str(value)), bool)
+        invalid = keep & ~(ano_plain[ano_index] & trimestre_plain[trimestre_index])
+        if invalid.any():
+            row = int(np.argmax(invalid))
+            ano = safe_str(ano_values[ano_index[row]])
+            trimestre = safe_str(trimestre_values[trimestre_index[row]])
+            raise ValueError(
+                f"Ano/Trimestre fora do formato numérico ({ano!r}/{trimestre!r}); "
+                "use o engine padrão (dict)."
+            )
+
+        kept = np.nonzero(keep)[0]
+        codes: Dict[str, "np.ndarray"] = {}
+        dictionaries: Dict[str, List[str]] = {}
+
+        for column in STRING_COLUMNS:
+            indices, values = encoded[column]
+
+            # Valores diferentes no arquivo podem virar o mesmo rótulo (" SP" / "SP")
+            labels: Dict[str, int] = {}
+            value_labels = per_value(
+                values, lambda value: labels.setdefault(dimension_value({column: value}, column), len(labels)), np.int64
+            )
+            row_labels = value_labels[indices[kept]]
+
+            # Códigos na ordem de primeira aparição, como em from_csv
+            uniques, first_rows = np.unique(row_labels, return_index=True)
+            order = uniques[np.argsort(first_rows, kind="stable")]
+            remap = np.zeros(len(labels), dtype=np.int32)
+            remap[order] = np.arange(len(order), dtype=np.int32)
+
+            label_text = list(labels.keys())
+            codes[column] = remap[row_labels]
+            dictionaries[column] = [label_text[int(label)] for label in order]
+
+        def period(column: str, values: List[str], indices: "np.ndarray") -> "np.ndarray":
+            if column in table.column_names and not is_text_type(table.schema.field(column).type):
+                # Coluna inteira: as linhas mantidas nunca são nulas
+                return table.column(column).fill_null(0).to_numpy()[kept].astype(np.int16)
+
+            numbers = per_value(values, lambda value: int(value) if is_plain_int(safe_str(value)) else 0, np.int64)
+            return numbers[indices[kept]].astype(np.int16)
+
+        return cls(
+            codes=codes,
+            dictionaries=dictionaries,
+            ano=period("Ano", ano_values, ano_index),
+            trimestre=period("Trimestre", trimestre_values, trimestre_index),
+            cents=np.asarray([cents or 0 for cents in parsed_cents], dtype=np.int64)[valor_index[kept]],
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "ColumnarExpenses":
+        """
+        Monta as colunas no formato do arquivo (CSV ou Arrow).
+        """
+        return cls.from_arrow(path) if is_arrow(path) else cls.from_csv(path)
+
+    def column_codes(self, column: str) -> Tuple["np.ndarray", List[str]]:
+        """
+        Retorna (códigos por linha, valor textual de cada código) de uma coluna.
+        Ano/Trimestre são recodificados com np.unique.
+        """
+        if column in self.codes:
+            return self.codes[column], self.dictionaries[column]
+
+        if column in PERIOD_COLUMNS:
+            values = self.ano if column == "Ano" else self.trimestre
+            uniques, inverse = np.unique(values, return_inverse=True)
+            return inverse.astype(np.int64), [str(int(value)) for value in uniques]
+
+        raise ValueError(
+            f"Coluna {column!r} não existe no modelo colunar; use o engine padrão (dict)."
+        )
+
+    def group_cells(
+        self, grouping: Tuple[str, ...]
+    ) -> Tuple[List[Tuple[str, ...]], List[Tuple[str, str]], "np.ndarray"]:
+        """
+        Numera as células (grupo, trimestre).
+
+        Retorna (chaves dos grupos, trimestres, célula de cada linha), com
+        célula = índice_do_grupo * qtd_trimestres + índice_do_trimestre.
+        """
+        period = self.ano.astype(np.int64) * PERIOD_RADIX + self.trimestre.astype(np.int64)
+        period_values, quarter_index = np.unique(period, return_inverse=True)
+        quarters = [
+            (str(int(value) // PERIOD_RADIX), str(int(value) % PERIOD_RADIX))
+            for value in period_values
+        ]
+
+        codes_by_column: List["np.ndarray"] = []
+        decoders: List[Tuple[int, List[str]]] = []
+        key_space = 1
+        for column in grouping:
+            codes, labels = self.column_codes(column)
+            cardinality = max(1, len(labels))
+            codes_by_column.append(codes.astype(np.int64))
+            decoders.append((cardinality, labels))
+            key_space *= cardinality
+
+        columns_codes: List["np.ndarray"] = []
+        if key_space <= MAX_COMBINED_KEYS:
+            # Chave combinada do grupo (mixed radix sobre os códigos de cada coluna)
+            combined = np.zeros(len(self), dtype=np.int64)
+            for codes, (cardinality, _) in zip(codes_by_column, decoders):
+                combined = combined * cardinality + codes
+
+            group_values, group_index = np.unique(combined, return_inverse=True)
+            group_count = int(group_values.shape[0])
+
+            # Decodifica a chave combinada de volta para os códigos de cada coluna
+            remaining = group_values.copy()
+            for cardinality, _ in reversed(decoders):
+                columns_codes.append(remaining % cardinality)
+                remaining = remaining // cardinality
+            columns_codes.reverse()
+        else:
+            # A chave combinada estouraria o int64: grupos = linhas distintas
+            # da matriz de códigos (mais lento, mas sem colisão)
+            group_rows, group_index = np.unique(
+                np.column_stack(codes_by_column), axis=0, return_inverse=True
+            )
+            group_index = group_index.reshape(-1)
+            group_count = int(group_rows.shape[0])
+            columns_codes = [group_rows[:, position] for position in range(len(decoders))]
+
+        keys = [
+            tuple(labels[int(codes[index])] for codes, (_, labels) in zip(columns_codes, decoders))
+            for index in range(group_count)
+        ]
+
+        cell = group_index.astype(np.int64) * len(quarters) + quarter_index
+        return keys, quarters, cell
+
+    def group_sums(
+        self, grouping: Tuple[str, ...]
+    ) -> Tuple[List[Tuple[str, ...]], List[Tuple[str, str]], "np.ndarray", "np.ndarray"]:
+        """
+        Soma centavos e conta linhas por (grupo, trimestre).
+
+        Retorna (chaves dos grupos, trimestres, somas[grupo, trimestre],
+        contagens[grupo, trimestre]).
+        """
+        keys, quarters, cell = self.group_cells(grouping)
+        group_count = len(keys)
+        quarter_count = len(quarters)
+
+        sums = np.zeros(group_count * quarter_count, dtype=np.int64)
+        np.add.at(sums, cell, self.cents)
+        counts = np.bincount(cell, minlength=group_count * quarter_count)
+
+        return (
+            keys,
+            quarters,
+            sums.reshape(group_count, quarter_count),
+            counts.reshape(group_count, quarter_count),
+        )
+
+
+def build_state_columnar(
+    grouping_sets: List[Tuple[str, ...]],
+    csv_path: Path,
+    table: Optional[ColumnarExpenses] = None,
+    sketches: Optional[SketchState] = None,
+) -> AggregationState:
+    """
+    Mesmo resultado de aggregator.build_state, calculado pelo engine colunar.
+
+    As somas por linha ficam no numpy; o estado devolvido (por grupo e
+    trimestre) é pequeno e segue para o mesmo cálculo de métricas do
+    engine padrão, por isso o CSV final é idêntico. Os totais por operadora
+    e trimestre dos sketches saem do mesmo group_sums e entram pelo mesmo
+    feed_sketches, então a distribuição também é idêntica.
+    """
+    table = table or ColumnarExpenses.load(csv_path)
+    pass_sets = with_sketch_totals(grouping_sets, sketches)
+    state = new_state(pass_sets)
+
+    if len(table) == 0:
+        return drop_extra_sets(state, grouping_sets)
+
+    for grouping in pass_sets:
+        keys, quarters, sums, counts = table.group_sums(grouping)
+        groups = state[grouping]
+
+        for group_position, group_key in enumerate(keys):
+            present = np.nonzero(counts[group_position])[0]
+            groups[group_key] = {
+                quarters[int(quarter)]: [int(sums[group_position, quarter]), int(counts[group_position, quarter])]
+                for quarter in present
+            }
+
+    if sketches is not None:
+        feed_sketches(sketches, state)
+
+    return drop_extra_sets(state, grouping_sets)
@@ -1,13 +1,44 @@
 from __future__ import annotations
 
 import csv
+import hashlib
+import heapq
+import json
+import os
+import time
+import zlib
+from collections import defaultdict, deque
+from datetime import date
 from decimal import Decimal, InvalidOperation
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Deque, Dict, Iterator, List, Optional, Set, Tuple
 from urllib.parse import urljoin
 
 import requests
 
+from arrow_io import (
+    TableFormat,
+    arrow_row_count,
+    is_arrow,
+    iter_matching_arrow_rows,
+    iter_rows,
+    move_table,
+    read_fieldnames,
+    remove_table,
+    resolve_table,
+    table_exists,
+)
+from cadop_history import ORIGIN_ACTIVE, ORIGIN_CANCELED, CadopHistory, HistoryRecord
+from dataset import DATASET_DIRNAME, QuarterWindow, list_partitions, read_dataset
+from offset_index import index_path_for, remove_index, sort_key, sorted_rows, write_index
+from spill import (
+    SPILL_PARTITIONS,
+    MemoryBudget,
+    MemoryLimitExceeded,
+    PartitionedWriter,
+    read_records,
+    spill_directory,
+)
 from utils import list_links
 
 
@@ -24,16 +55,45 @@ ROOT_DIR = project_root()
 # Entrada do Teste 1 (agora com REG_ANS preenchido)
 CSV_INPUT = ROOT_DIR / "teste_1" / "output" / "despesas_eventos_sinistros.csv"
 
+# Mesma entrada, particionada por ano/trimestre (usada quando existir)
+DATASET_INPUT = ROOT_DIR / "teste_1" / "output" / DATASET_DIRNAME
+
 # Saídas do Teste 2
 OUTPUT_DIR = ROOT_DIR / "teste_2" / "output"
 CSV_ENRICHED = OUTPUT_DIR / "despesas_enriquecidas.csv"
 CSV_NO_MATCH = OUTPUT_DIR / "reg_ans_sem_match.csv"
 
+# Cadastro aplicado no último enriquecimento completo (base do diff do CADOP)
+CADOP_SNAPSHOT = OUTPUT_DIR / "cadop_aplicado.json"
+CADOP_SNAPSHOT_VERSION = 1
+
+# Linhas reenriquecidas por um diff do CADOP: versão nova e anterior
+# (a agregação incremental retira a anterior e soma a nova; o
+# CSV_ENRICHED continua completo, com as linhas novas no lugar)
+CSV_ENRICHED_DELTA = OUTPUT_DIR / "despesas_enriquecidas_alteradas.csv"
+CSV_ENRICHED_PREVIOUS = OUTPUT_DIR / "despesas_enriquecidas_anteriores.csv"
+
+# Arquivo enriquecido sendo regravado pelo diff (publicado no final)
+CSV_ENRICHED_PATCH = OUTPUT_DIR / "despesas_enriquecidas_atualizando.csv"
+
 # Download do CADOP
 DATA_DIR = ROOT_DIR / "teste_2" / "data" / "cadop"
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-CADOP_BASE_URL = "https://dadosabertos.ans.gov.br/FTP/PDA/operadoras_de_plano_de_saude_ativas/"
+# ANS_CADOP_BASE_URL permite apontar para um espelho local (testes / watcher)
+CADOP_BASE_URL = os.environ.get(
+    "ANS_CADOP_BASE_URL",
+    "https://dadosabertos.ans.gov.br/FTP/PDA/operadoras_de_plano_de_saude_ativas/"
+)
+CADOP_CANCELED_BASE_URL = os.environ.get(
+    "ANS_CADOP_CANCELADAS_BASE_URL",
+    "https://dadosabertos.ans.gov.br/FTP/PDA/operadoras_de_plano_de_saude_canceladas/"
+)
+
+# Histórico dos CADOPs baixados (ativas e canceladas), base do join por
+# data (--cadop-historico; ver cadop_history.py). Fica fora de DATA_DIR:
+# é atualizado pelo enriquecimento, e DATA_DIR é entrada dele no runner
+CADOP_HISTORY_DB = DATA_DIR.parent / "cadop_historico.sqlite"
 
 
 def ensure_dirs() -> None:
@@ -64,37 +124,50 @@ def normalize_header(text: str) -> str:
     return (text or "").strip().upper()
 
 
-def download_latest_cadop_csv() -> Path:
+def download_latest_cadop_csv(refresh: bool = False, base_url: str = CADOP_BASE_URL) -> Path:
     """
-    Baixa o CSV mais recente na pasta de operadoras ativas.
+    Baixa o CSV mais recente na pasta de operadoras ativas
+    (ou em `base_url`, ex: a de operadoras canceladas).
+    Com refresh=True baixa de novo mesmo se já estiver no cache
+    (a ANS atualiza o arquivo mantendo o nome).
     """
     ensure_dirs()
 
-    links = list_links(CADOP_BASE_URL)
+    links = list_links(base_url)
     csv_links = sorted([link for link in links if link.lower().endswith(".csv")])
 
     if not csv_links:
-        raise RuntimeError("Nenhum CSV encontrado na pasta de operadoras ativas (CADOP).")
+        raise RuntimeError(f"Nenhum CSV encontrado na pasta do CADOP: {base_url}")
 
     filename = csv_links[-1]
-    url = urljoin(CADOP_BASE_URL, filename)
+    url = urljoin(base_url, filename)
     local_path = DATA_DIR / filename
 
-    if local_path.exists():
+    if local_path.exists() and not refresh:
         return local_path
 
     print(f"⬇️  Baixando CADOP: {filename}")
     response = requests.get(url, stream=True, timeout=60)
     response.raise_for_status()
 
-    with local_path.open("wb") as f:
+    # Grava em .part e troca no final: o cache nunca fica com arquivo pela metade
+    partial_path = local_path.with_name(local_path.name + ".part")
+    with partial_path.open("wb") as f:
         for chunk in response.iter_content(chunk_size=8192):
             if chunk:
                 f.write(chunk)
 
+    os.replace(partial_path, local_path)
     return local_path
 
 
+def download_canceled_cadop_csv(refresh: bool = False) -> Path:
+    """
+    Baixa o CSV de operadoras canceladas (com a data de descredenciamento).
+    """
+    return download_latest_cadop_csv(refresh, CADOP_CANCELED_BASE_URL)
+
+
 def parse_cnpj(raw: str) -> str:
     """
     Converte CNPJ do CADOP para 14 dígitos.
@@ -120,15 +193,30 @@ def parse_cnpj(raw: str) -> str:
         return digits.zfill(14) if digits else ""
 
 
-def load_cadop_map(cadop_csv: Path) -> Dict[str, Dict[str, str]]:
+def iter_cadop_records(cadop_csv: Path) -> Iterator[Tuple[str, Dict[str, str]]]:
     """
-    Carrega o cadastro em memória, criando um mapa:
-    REGISTRO_OPERADORA -> {CNPJ, RazaoSocial, Modalidade, UF}
+    Lê o CADOP em streaming e devolve (REGISTRO_OPERADORA, cadastro)
+    na ordem do arquivo (inclusive registros duplicados).
+    """
+    for registro, cadastro, _ in iter_cadop_rows(cadop_csv):
+        yield registro, cadastro
 
-    Se houver REGISTRO_OPERADORA duplicado, mantém o primeiro (simples).
+
+def iter_cadop_history_records(cadop_csv: Path) -> Iterator[HistoryRecord]:
+    """
+    Registros do CADOP para o histórico: (REGISTRO_OPERADORA, cadastro,
+    Data_Registro_ANS, Data_Descredenciamento), datas como vieram no CSV.
+    """
+    for registro, cadastro, row in iter_cadop_rows(cadop_csv):
+        yield registro, cadastro, row.get("DATA_REGISTRO_ANS", ""), row.get("DATA_DESCREDENCIAMENTO", "")
+
+
+def iter_cadop_rows(cadop_csv: Path) -> Iterator[Tuple[str, Dict[str, str], Dict[str, str]]]:
+    """
+    (REGISTRO_OPERADORA, cadastro, linha com cabeçalhos normalizados)
+    de cada linha do CADOP com registro preenchido.
     """
     delimiter = detect_delimiter(cadop_csv)
-    cadop_map: Dict[str, Dict[str, str]] = {}
 
     with cadop_csv.open(mode="r", encoding="latin-1", newline="") as f:
         reader = csv.DictReader(f, delimiter=delimiter)
@@ -146,121 +234,709 @@ def load_cadop_map(cadop_csv: Path) -> Dict[str, Dict[str, str]]:
             if not registro:
                 continue
 
-            # Mantém o primeiro registro (trade-off simples)
-            if registro in cadop_map:
-                continue
-
             cnpj = parse_cnpj(row.get("CNPJ", ""))
             razao = row.get("RAZAO_SOCIAL", "").strip()
             modalidade = row.get("MODALIDADE", "").strip()
             uf = row.get("UF", "").strip()
 
-            cadop_map[registro] = {
+            yield registro, {
                 "CNPJ": cnpj,
                 "RazaoSocial": razao,
                 "Modalidade": modalidade,
                 "UF": uf,
                 "RegistroANS": registro,
-            }
+            }, row
+
+
+def load_cadop_map(cadop_csv: Path, budget: Optional[MemoryBudget] = None) -> Dict[str, Dict[str, str]]:
+    """
+    Carrega o cadastro em memória, criando um mapa:
+    REGISTRO_OPERADORA -> {CNPJ, RazaoSocial, Modalidade, UF}
+
+    Se houver REGISTRO_OPERADORA duplicado, mantém o primeiro (simples).
+    Com orçamento de memória, levanta MemoryLimitExceeded se o RSS já
+    estiver acima do limite antes da carga, passar dele durante a carga
+    ou ao final dela (o cadastro tem menos linhas que o intervalo de
+    verificação do MemoryBudget, então início e fim sempre são medidos).
+    """
+    if budget is not None and budget.over_limit(force=True):
+        raise MemoryLimitExceeded("Memória acima do limite antes de carregar o cadastro")
+
+    cadop_map: Dict[str, Dict[str, str]] = {}
+
+    for registro, cadastro in iter_cadop_records(cadop_csv):
+        # Mantém o primeiro registro (trade-off simples)
+        if registro not in cadop_map:
+            cadop_map[registro] = cadastro
+
+        if budget is not None and budget.over_limit():
+            raise MemoryLimitExceeded(f"Cadastro passou do limite de memória ({len(cadop_map)} registros)")
+
+    if budget is not None and budget.over_limit(force=True):
+        raise MemoryLimitExceeded(f"Cadastro passou do limite de memória ({len(cadop_map)} registros)")
 
     return cadop_map
 
 
-def enrich_consolidated(cadop_map: Dict[str, Dict[str, str]]) -> None:
+def file_sha256(file_path: Path) -> str:
     """
-    Faz join:
-    REG_ANS (despesas do Teste 1) -> REGISTRO_OPERADORA (CADOP)
+    sha256 do arquivo (lido em blocos).
+    """
+    digest = hashlib.sha256()
+    with file_path.open("rb") as fin:
+        for chunk in iter(lambda: fin.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-    Adiciona:
-    RegistroANS, Modalidade, UF
-    e também preenche CNPJ e RazaoSocial quando possível.
+
+def record_cadop_snapshot(cadop_csv: Path, origin: str = ORIGIN_ACTIVE) -> bool:
     """
-    if not CSV_INPUT.exists():
-        raise FileNotFoundError(f"CSV do Teste 1 não encontrado: {CSV_INPUT}")
+    Guarda o CADOP baixado no histórico (CADOP_HISTORY_DB). A data de
+    referência é a do download (mtime do arquivo no cache); um arquivo
+    igual ao último snapshot da origem não é guardado de novo.
+    Retorna True se virou um snapshot novo.
+    """
+    reference_date = date.fromtimestamp(cadop_csv.stat().st_mtime).isoformat()
 
-    no_match_rows: List[Dict[str, str]] = []
+    with CadopHistory(CADOP_HISTORY_DB) as history:
+        added = history.add_snapshot(
+            origin, cadop_csv.name, file_sha256(cadop_csv), reference_date, iter_cadop_history_records(cadop_csv)
+        )
 
-    with CSV_INPUT.open(mode="r", encoding="utf-8", newline="") as fin:
-        reader = csv.DictReader(fin, delimiter=";")
-        if not reader.fieldnames:
-            raise ValueError("CSV de entrada não possui cabeçalho.")
+    if added:
+        print(f"   ✔ Histórico do CADOP: snapshot de {origin} ({reference_date}) guardado em {CADOP_HISTORY_DB}")
+    return added
 
-        input_fields = list(reader.fieldnames)
 
-        # Garante que as colunas existam no output
-        extra_fields = ["RegistroANS", "Modalidade", "UF"]
-        output_fields = input_fields[:]
+def enriched_fields(input_fields: List[str]) -> List[str]:
+    """
+    Colunas do CSV enriquecido: as do Teste 1 + RegistroANS, Modalidade, UF.
+    """
+    output_fields = input_fields[:]
 
-        for col in extra_fields:
-            if col not in output_fields:
-                output_fields.append(col)
+    for col in ["RegistroANS", "Modalidade", "UF"]:
+        if col not in output_fields:
+            output_fields.append(col)
 
-        with CSV_ENRICHED.open(mode="w", encoding="utf-8", newline="") as fout:
-            writer = csv.DictWriter(fout, fieldnames=output_fields, delimiter=";")
-            writer.writeheader()
+    return output_fields
 
-            match_count = 0
-            no_match_count = 0
 
-            for row in reader:
-                reg_ans = (row.get("REG_ANS", "") or "").strip()
-                cadastro = cadop_map.get(reg_ans)
+def enrich_row(row: Dict[str, str], cadastro: Optional[Dict[str, str]]) -> Optional[Dict[str, str]]:
+    """
+    Preenche a linha com os dados do cadastro (no próprio dicionário).
+    Retorna o registro do relatório de "sem match", ou None se houve match.
+    """
+    if cadastro:
+        # Preenche CNPJ e RazaoSocial se estiverem vazios
+        if not (row.get("CNPJ", "") or "").strip():
+            row["CNPJ"] = cadastro["CNPJ"]
+        if not (row.get("RazaoSocial", "") or "").strip():
+            row["RazaoSocial"] = cadastro["RazaoSocial"]
+
+        row["RegistroANS"] = cadastro["RegistroANS"] or "Desconhecido"
+        row["Modalidade"] = cadastro["Modalidade"] or "Desconhecido"
+        row["UF"] = cadastro["UF"] or "Desconhecido"
+        return None
+
+    row["RegistroANS"] = "Desconhecido"
+    row["Modalidade"] = "Desconhecido"
+    row["UF"] = "Desconhecido"
+
+    return {
+        "REG_ANS": (row.get("REG_ANS", "") or "").strip(),
+        "Ano": (row.get("Ano", "") or "").strip(),
+        "Trimestre": (row.get("Trimestre", "") or "").strip(),
+    }
+
+
+def write_enriched(
+    input_fields: List[str],
+    enriched: Iterator[Tuple[Dict[str, str], Optional[Dict[str, str]]]],
+    sort_by_operator: bool = False,
+    table_format: Optional[TableFormat] = None,
+) -> int:
+    """
+    Grava o CSV enriquecido e o relatório de sem match a partir de
+    pares (linha, registro_sem_match), na ordem recebida.
 
-                if cadastro:
-                    # Preenche CNPJ e RazaoSocial se estiverem vazios
-                    if not (row.get("CNPJ", "") or "").strip():
-                        row["CNPJ"] = cadastro["CNPJ"]
-                    if not (row.get("RazaoSocial", "") or "").strip():
-                        row["RazaoSocial"] = cadastro["RazaoSocial"]
-
-                    row["RegistroANS"] = cadastro["RegistroANS"] or "Desconhecido"
-                    row["Modalidade"] = cadastro["Modalidade"] or "Desconhecido"
-                    row["UF"] = cadastro["UF"] or "Desconhecido"
-                    match_count += 1
-                else:
-                    row["RegistroANS"] = "Desconhecido"
-                    row["Modalidade"] = "Desconhecido"
-                    row["UF"] = "Desconhecido"
-                    no_match_count += 1
-
-                    no_match_rows.append({
-                        "REG_ANS": reg_ans,
-                        "Ano": (row.get("Ano", "") or "").strip(),
-                        "Trimestre": (row.get("Trimestre", "") or "").strip(),
-                    })
+    Com sort_by_operator=True o CSV sai ordenado por (REG_ANS, Ano,
+    Trimestre) e ganha o índice <csv>.idx (ver offset_index.py); o
+    relatório de sem match mantém a ordem recebida.
+
+    table_format escolhe o formato da tabela lida pela validação (padrão:
+    CSV; ver arrow_io.py). O índice é sobre o CSV, então com
+    sort_by_operator o CSV é gravado também no formato arrow.
+    Retorna a quantidade de linhas gravadas.
+    """
+    table_format = table_format or TableFormat()
+    match_count = 0
+    no_match_count = 0
+    no_match_file = None
+    no_match_writer = None
+
+    def rows() -> Iterator[Dict[str, str]]:
+        nonlocal match_count, no_match_count, no_match_file, no_match_writer
+
+        for row, no_match in enriched:
+            if no_match is None:
+                match_count += 1
+            else:
+                no_match_count += 1
+
+                # Relatório simples de registros sem match (só é criado se houver algum)
+                if no_match_writer is None:
+                    no_match_file = CSV_NO_MATCH.open(mode="w", encoding="utf-8", newline="")
+                    no_match_writer = csv.DictWriter(
+                        no_match_file, fieldnames=["REG_ANS", "Ano", "Trimestre"], delimiter=";"
+                    )
+                    no_match_writer.writeheader()
+                no_match_writer.writerow(no_match)
+
+            yield row
 
+    try:
+        with table_format.writer(CSV_ENRICHED, enriched_fields(input_fields), force_csv=sort_by_operator) as writer:
+            for row in sorted_rows(rows(), work_dir=OUTPUT_DIR) if sort_by_operator else rows():
                 writer.writerow(row)
+    finally:
+        if no_match_file is not None:
+            no_match_file.close()
+
+    if no_match_count == 0 and CSV_NO_MATCH.exists():
+        # Relatório de uma execução anterior: o join de agora não deixou nenhum sem match
+        CSV_NO_MATCH.unlink()
 
-    # Relatório simples de registros sem match
-    if no_match_rows:
-        with CSV_NO_MATCH.open(mode="w", encoding="utf-8", newline="") as f:
-            writer = csv.DictWriter(f, fieldnames=["REG_ANS", "Ano", "Trimestre"], delimiter=";")
-            writer.writeheader()
-            writer.writerows(no_match_rows)
+    if sort_by_operator:
+        write_index(CSV_ENRICHED)
+    else:
+        remove_index(CSV_ENRICHED)
 
     print("✅ Enriquecimento concluído!")
     print(f"   ✔ Linhas com match: {match_count}")
     print(f"   ✔ Linhas sem match: {no_match_count}")
-    print(f"   ✔ CSV gerado: {CSV_ENRICHED}")
-    if no_match_rows:
+    print(f"   ✔ Arquivo gerado ({table_format.describe()}): {writer.path}")
+    if sort_by_operator:
+        print(f"   ✔ Ordenado por REG_ANS, Ano, Trimestre; índice: {index_path_for(CSV_ENRICHED)}")
+    if no_match_count:
         print(f"   ⚠ Relatório sem match: {CSV_NO_MATCH}")
 
+    return match_count + no_match_count
+
+
+def read_input_header(window: QuarterWindow = None) -> List[str]:
+    """
+    Colunas da entrada do Teste 1 (dataset particionado, se existir, ou CSV).
+    """
+    partitions = list_partitions(DATASET_INPUT, window)
+    if partitions:
+        source = partitions[0][2]
+    elif window is not None and list_partitions(DATASET_INPUT):
+        raise ValueError(f"Nenhuma partição do Teste 1 na janela {window}.")
+    elif CSV_INPUT.exists():
+        source = CSV_INPUT
+    else:
+        raise FileNotFoundError(
+            f"Saída do Teste 1 não encontrada: {DATASET_INPUT} (ou {CSV_INPUT}, com --csv)"
+        )
+
+    fieldnames = read_fieldnames(source)
+    if not fieldnames:
+        raise ValueError("CSV de entrada não possui cabeçalho.")
+    return fieldnames
+
+
+def iter_input_rows(window: QuarterWindow = None) -> Iterator[Dict[str, str]]:
+    """
+    Linhas do Teste 1, em streaming.
+
+    Se o dataset particionado existir, lê só as partições da janela
+    (None = todas); senão, lê o CSV consolidado.
+    """
+    if list_partitions(DATASET_INPUT):
+        yield from read_dataset(DATASET_INPUT, window)
+        return
+
+    with CSV_INPUT.open(mode="r", encoding="utf-8", newline="") as fin:
+        yield from csv.DictReader(fin, delimiter=";")
+
+
+def enrich_consolidated(
+    cadop_map: Dict[str, Dict[str, str]],
+    window: QuarterWindow = None,
+    sort_by_operator: bool = False,
+    history: Optional[CadopHistory] = None,
+    table_format: Optional[TableFormat] = None,
+) -> int:
+    """
+    Faz join:
+    REG_ANS (despesas do Teste 1) -> REGISTRO_OPERADORA (CADOP)
+
+    Adiciona:
+    RegistroANS, Modalidade, UF
+    e também preenche CNPJ e RazaoSocial quando possível.
+
+    Com `history` o join é por data: cada (REG_ANS, Ano, Trimestre) usa o
+    cadastro em vigor no trimestre (ver cadop_history.py) e cadop_map é
+    ignorado.
+
+    `window` seleciona trimestres do dataset particionado do Teste 1;
+    sort_by_operator grava o CSV ordenado e indexado e table_format escolhe
+    o formato da saída (ver write_enriched).
+    Retorna a quantidade de linhas enriquecidas.
+    """
+    input_fields = read_input_header(window)
+
+    def enriched() -> Iterator[Tuple[Dict[str, str], Optional[Dict[str, str]]]]:
+        for row in iter_input_rows(window):
+            reg_ans = (row.get("REG_ANS", "") or "").strip()
+            if history is not None:
+                ano = (row.get("Ano", "") or "").strip()
+                trimestre = (row.get("Trimestre", "") or "").strip()
+                cadastro = history.lookup(reg_ans, ano, trimestre)
+            else:
+                cadastro = cadop_map.get(reg_ans)
+            yield row, enrich_row(row, cadastro)
+
+    return write_enriched(input_fields, enriched(), sort_by_operator, table_format)
+
+
+def reg_ans_partition(reg_ans: str, partitions: int) -> int:
+    """
+    Partição (hash estável) de um REG_ANS.
+    """
+    return zlib.crc32(reg_ans.encode("utf-8")) % partitions
+
+
+def enrich_consolidated_partitioned(
+    cadop_csv: Path,
+    budget: MemoryBudget,
+    work_dir: Path,
+    partitions: int = SPILL_PARTITIONS,
+    window: QuarterWindow = None,
+    sort_by_operator: bool = False,
+    table_format: Optional[TableFormat] = None,
+) -> None:
+    """
+    Mesmo join de enrich_consolidated, sem carregar o cadastro inteiro
+    (hash join particionado em disco):
+    1) CADOP e despesas são separados por hash do REG_ANS em arquivos;
+    2) cada partição faz o join só com o seu pedaço do cadastro;
+    3) as partições são intercaladas pelo número da linha original,
+       mantendo a ordem (e o conteúdo) do CSV enriquecido.
+    """
+    input_fields = read_input_header(window)
+
+    cadop_writer = PartitionedWriter(work_dir, "cadop", partitions, budget)
+    for registro, cadastro in iter_cadop_records(cadop_csv):
+        cadop_writer.add(reg_ans_partition(registro, partitions), (registro, cadastro))
+    cadop_paths = cadop_writer.close()
+
+    input_writer = PartitionedWriter(work_dir, "despesas", partitions, budget)
+    for line_number, row in enumerate(iter_input_rows(window)):
+        reg_ans = (row.get("REG_ANS", "") or "").strip()
+        input_writer.add(reg_ans_partition(reg_ans, partitions), (line_number, row))
+    input_paths = input_writer.close()
 
-def run_enrichment() -> None:
+    joined_writer = PartitionedWriter(work_dir, "join", partitions, budget)
+    for partition, (cadop_path, input_path) in enumerate(zip(cadop_paths, input_paths)):
+        cadop_part: Dict[str, Dict[str, str]] = {}
+        for registro, cadastro in read_records(cadop_path):
+            # Mantém o primeiro registro (mesma regra de load_cadop_map)
+            cadop_part.setdefault(registro, cadastro)
+
+        for line_number, row in read_records(input_path):
+            reg_ans = (row.get("REG_ANS", "") or "").strip()
+            no_match = enrich_row(row, cadop_part.get(reg_ans))
+            joined_writer.add(partition, (line_number, row, no_match))
+
+        joined_writer.flush()
+        del cadop_part
+
+    joined_paths = joined_writer.close()
+
+    merged = heapq.merge(*(read_records(path) for path in joined_paths), key=lambda record: record[0])
+    write_enriched(input_fields, ((row, no_match) for _, row, no_match in merged), sort_by_operator, table_format)
+
+
+def save_cadop_snapshot(cadop_map: Dict[str, Dict[str, str]], rows: int, seconds: float) -> Path:
+    """
+    Grava o cadastro aplicado (e o tamanho/tempo do enriquecimento completo,
+    usados no relatório do diff) em JSON, com escrita atômica.
     """
-    - baixa o CADOP
+    payload = {
+        "versao": CADOP_SNAPSHOT_VERSION,
+        "linhas": rows,
+        "segundos": round(seconds, 3),
+        "cadastros": cadop_map,
+    }
+
+    tmp_path = CADOP_SNAPSHOT.with_suffix(".tmp")
+    with tmp_path.open(mode="w", encoding="utf-8") as fout:
+        json.dump(payload, fout, ensure_ascii=False)
+    os.replace(tmp_path, CADOP_SNAPSHOT)
+
+    return CADOP_SNAPSHOT
+
+
+def load_cadop_snapshot() -> Optional[Dict[str, object]]:
+    """
+    Lê o cadastro aplicado. Retorna None se não existir
+    ou se for de uma versão diferente.
+    """
+    if not CADOP_SNAPSHOT.exists():
+        return None
+
+    with CADOP_SNAPSHOT.open(mode="r", encoding="utf-8") as fin:
+        payload = json.load(fin)
+
+    if payload.get("versao") != CADOP_SNAPSHOT_VERSION:
+        return None
+
+    return payload
+
+
+def discard_cadop_snapshot(reason: str) -> None:
+    """
+    Apaga o cadastro aplicado quando ele deixa de descrever o que está
+    nas saídas (o próximo diff vira um enriquecimento completo).
+    """
+    if CADOP_SNAPSHOT.exists():
+        CADOP_SNAPSHOT.unlink()
+        print(f"   ⚠ {reason}: o próximo --alteracoes-cadop fará o enriquecimento completo.")
+
+
+def diff_cadop(
+    previous: Dict[str, Dict[str, str]],
+    current: Dict[str, Dict[str, str]],
+) -> Dict[str, str]:
+    """
+    Compara dois cadastros por REGISTRO_OPERADORA.
+    Retorna {registro: "novo" | "alterado" | "removido"}; registros com
+    os mesmos CNPJ, razão social, modalidade e UF ficam de fora.
+    """
+    changes: Dict[str, str] = {}
+
+    for registro, cadastro in current.items():
+        old = previous.get(registro)
+        if old is None:
+            changes[registro] = "novo"
+        elif old != cadastro:
+            changes[registro] = "alterado"
+
+    for registro in previous:
+        if registro not in current:
+            changes[registro] = "removido"
+
+    return changes
+
+
+def iter_rows_for_reg_ans(registros: Set[str], scanned: List[int]) -> Iterator[Dict[str, str]]:
+    """
+    Linhas do Teste 1 (dataset particionado, se existir, ou CSV) cujo
+    REG_ANS está em `registros`.
+
+    O REG_ANS é a primeira coluna: as outras linhas são descartadas só com
+    um split do início da linha, sem passar pelo csv. Em partições Arrow o
+    filtro roda no pyarrow sobre a coluna REG_ANS. `scanned[0]` recebe
+    a quantidade de linhas lidas.
+    """
+    partitions = list_partitions(DATASET_INPUT)
+    sources = [part_path for _, _, part_path in partitions] if partitions else [CSV_INPUT]
+
+    for source in sources:
+        if is_arrow(source):
+            scanned[0] += arrow_row_count(source)
+            yield from iter_matching_arrow_rows(source, "REG_ANS", registros)
+            continue
+
+        with source.open(mode="r", encoding="utf-8", newline="") as fin:
+            header = next(csv.reader([fin.readline()], delimiter=";"), [])
+            if "REG_ANS" not in header:
+                raise ValueError(f"Coluna REG_ANS não encontrada em {source}.")
+            first_column = header.index("REG_ANS") == 0
+
+            for line in fin:
+                scanned[0] += 1
+                if first_column and line.split(";", 1)[0].strip().strip('"') not in registros:
+                    continue
+
+                values = next(csv.reader([line], delimiter=";"), [])
+                row = dict(zip(header, values))
+                if (row.get("REG_ANS", "") or "").strip() in registros:
+                    yield row
+
+
+def patch_no_match_report(registros: Set[str], no_match_rows: List[Dict[str, str]]) -> None:
+    """
+    Atualiza o relatório de sem match sem reescrever o resto: tira as
+    linhas dos registros do diff e acrescenta as que continuam sem match.
+    """
+    kept: List[Dict[str, str]] = []
+    if CSV_NO_MATCH.exists():
+        with CSV_NO_MATCH.open(mode="r", encoding="utf-8", newline="") as fin:
+            kept = [row for row in csv.DictReader(fin, delimiter=";") if row.get("REG_ANS", "") not in registros]
+
+    rows = kept + no_match_rows
+    if not rows:
+        # Mesma regra do write_enriched: o relatório só existe se houver algum
+        if CSV_NO_MATCH.exists():
+            CSV_NO_MATCH.unlink()
+        return
+
+    tmp_path = CSV_NO_MATCH.with_suffix(".tmp")
+    with tmp_path.open(mode="w", encoding="utf-8", newline="") as fout:
+        writer = csv.DictWriter(fout, fieldnames=["REG_ANS", "Ano", "Trimestre"], delimiter=";")
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp_path, CSV_NO_MATCH)
+
+
+def patch_enriched(
+    replacements: Dict[str, Deque[Dict[str, str]]],
+    output_fields: List[str],
+    table_format: TableFormat,
+) -> Tuple[int, bool]:
+    """
+    Regrava o arquivo enriquecido completo trocando só as linhas dos REG_ANS
+    de `replacements` pela versão nova (mesmo resultado de um
+    enriquecimento completo com o cadastro novo):
+    - arquivo ordenado e indexado: intercala as linhas novas, ordenadas,
+      com as que ficam (merge pela mesma chave) e regrava o índice;
+    - senão: cada linha antiga de um REG_ANS do diff dá lugar à próxima
+      linha nova dele, na ordem do Teste 1; as que sobrarem vão para o fim.
+    Retorna (linhas gravadas, se o arquivo é ordenado).
+    """
+    sort_by_operator = index_path_for(CSV_ENRICHED).exists()
+    source = resolve_table(CSV_ENRICHED)
+    written = 0
+
+    def kept_rows() -> Iterator[Dict[str, str]]:
+        for row in iter_rows(source):
+            if (row.get("REG_ANS", "") or "").strip() not in replacements:
+                yield row
+
+    with table_format.writer(CSV_ENRICHED_PATCH, output_fields, force_csv=sort_by_operator) as writer:
+        if sort_by_operator:
+            new_rows = sorted((row for rows in replacements.values() for row in rows), key=sort_key)
+            for row in heapq.merge(kept_rows(), new_rows, key=sort_key):
+                writer.writerow(row)
+                written += 1
+        else:
+            for row in iter_rows(source):
+                pending = replacements.get((row.get("REG_ANS", "") or "").strip())
+                if pending is None:
+                    writer.writerow(row)
+                    written += 1
+                elif pending:
+                    writer.writerow(pending.popleft())
+                    written += 1
+
+            for pending in replacements.values():
+                writer.writerows(pending)
+                written += len(pending)
+
+    move_table(CSV_ENRICHED_PATCH, CSV_ENRICHED)
+    if sort_by_operator:
+        write_index(CSV_ENRICHED)
+    return written, sort_by_operator
+
+
+def run_enrichment(
+    memory_limit: Optional[int] = None,
+    window: QuarterWindow = None,
+    refresh_cadop: bool = False,
+    sort_by_operator: bool = False,
+    as_of: bool = False,
+    table_format: Optional[TableFormat] = None,
+) -> None:
+    """
+    - baixa o CADOP (com refresh_cadop, mesmo se já estiver no cache)
+      e guarda o snapshot no histórico (CADOP_HISTORY_DB)
     - cria mapa por REGISTRO_OPERADORA
     - enriquece o consolidado usando REG_ANS
+      (com `window`, só os trimestres da janela no dataset particionado)
+
+    Com as_of=True baixa também a lista de operadoras canceladas e o join
+    é por data: cada trimestre usa o cadastro em vigor naquela data,
+    consultado no histórico (em disco, então vale para qualquer limite de
+    memória). Operadoras canceladas ou que mudaram de UF/modalidade
+    depois do trimestre deixam de cair no sem match ou de levar o
+    cadastro atual para trimestres antigos.
+
+    Com memory_limit (bytes), se o cadastro não couber no limite o join
+    passa a ser particionado em disco (mesmo resultado).
+
+    Com sort_by_operator o CSV enriquecido sai ordenado por (REG_ANS, Ano,
+    Trimestre), com índice para consultas por operadora. table_format
+    escolhe o formato do arquivo enriquecido (csv ou arrow).
+
+    Sem janela, o cadastro usado é gravado em CADOP_SNAPSHOT (base do
+    run_cadop_update; o join por data não grava e descarta o snapshot).
     """
     ensure_dirs()
+    started = time.perf_counter()
+
+    # Enriquecimento normal: não há lote de diff a aplicar
+    remove_table(CSV_ENRICHED_DELTA)
+    remove_table(CSV_ENRICHED_PREVIOUS)
 
     print("🔍 Baixando e lendo cadastro (CADOP)...")
-    cadop_csv = download_latest_cadop_csv()
+    cadop_csv = download_latest_cadop_csv(refresh_cadop)
+    record_cadop_snapshot(cadop_csv)
+
+    if as_of:
+        record_cadop_snapshot(download_canceled_cadop_csv(refresh_cadop), ORIGIN_CANCELED)
+
+        with CadopHistory(CADOP_HISTORY_DB) as history:
+            snapshots, operators, versions = history.counts()
+            print(f"   ✔ Histórico: {snapshots} snapshots, {operators} operadoras, {versions} vigências")
+
+            print("🔗 Fazendo join por REG_ANS e trimestre (cadastro em vigor na data)...")
+            enrich_consolidated({}, window, sort_by_operator, history=history, table_format=table_format)
+            print(f"   ✔ Consultas ao histórico: {history.queries} ({history.lookups} linhas)")
+
+        discard_cadop_snapshot("Enriquecimento por data (histórico do CADOP)")
+        return
+
+    budget = MemoryBudget(memory_limit) if memory_limit is not None else None
 
     print("📥 Carregando cadastro em memória...")
-    cadop_map = load_cadop_map(cadop_csv)
+    try:
+        cadop_map = load_cadop_map(cadop_csv, budget)
+    except MemoryLimitExceeded as exc:
+        print(f"   ⚠ {exc}: join por REG_ANS com partições em disco")
+        with spill_directory(OUTPUT_DIR) as spill_dir:
+            enrich_consolidated_partitioned(
+                cadop_csv, budget, Path(spill_dir), window=window, sort_by_operator=sort_by_operator,
+                table_format=table_format
+            )
+        print(f"   ✔ Memória: {budget.describe()}")
+        discard_cadop_snapshot("Cadastro não coube no limite de memória")
+        return
+
     print(f"   ✔ Cadastros carregados: {len(cadop_map)}")
 
     print("🔗 Fazendo join por REG_ANS...")
-    enrich_consolidated(cadop_map)
+    rows = enrich_consolidated(cadop_map, window, sort_by_operator, table_format=table_format)
+
+    if window is None:
+        save_cadop_snapshot(cadop_map, rows, time.perf_counter() - started)
+    else:
+        # O diff atualiza o arquivo enriquecido completo: com só uma janela
+        # nele, o próximo --alteracoes-cadop precisa refazer tudo
+        discard_cadop_snapshot("Arquivo enriquecido só com a janela de trimestres")
+
 
+def run_cadop_update(
+    memory_limit: Optional[int] = None,
+    refresh_cadop: bool = False,
+    table_format: Optional[TableFormat] = None,
+) -> bool:
+    """
+    Reaplica só o que mudou no CADOP desde o último enriquecimento completo:
+    - compara o cadastro novo com CADOP_SNAPSHOT por REGISTRO_OPERADORA;
+    - relê do Teste 1 só as linhas desses REG_ANS (inclusive as que estavam
+      no relatório de sem match e agora têm cadastro);
+    - grava a versão nova dessas linhas em CSV_ENRICHED_DELTA e a anterior
+      (enriquecida com o cadastro antigo) em CSV_ENRICHED_PREVIOUS, para a
+      validação e a agregação incremental trocarem uma pela outra;
+    - troca essas linhas no CSV_ENRICHED, que continua completo para quem
+      lê o arquivo (validação, Teste 3, serviço de consulta) — só cópia,
+      sem join das outras linhas (ver patch_enriched);
+    - atualiza o relatório de sem match só para esses registros.
+
+    Sem snapshot, sem arquivo enriquecido ou se o cadastro não couber no
+    limite de memória, faz o enriquecimento completo. Os arquivos saem no
+    formato table_format. Retorna True se o diff foi aplicado.
+    """
+    ensure_dirs()
+    table_format = table_format or TableFormat()
+    started = time.perf_counter()
+
+    snapshot = load_cadop_snapshot()
+    if snapshot is None or not table_exists(CSV_ENRICHED):
+        print("   ⚠ Sem cadastro aplicado anterior: enriquecimento completo.")
+        run_enrichment(memory_limit, refresh_cadop=refresh_cadop, table_format=table_format)
+        return False
+
+    print("🔍 Baixando e lendo cadastro (CADOP)...")
+    cadop_csv = download_latest_cadop_csv(refresh_cadop)
+    record_cadop_snapshot(cadop_csv)
+    budget = MemoryBudget(memory_limit) if memory_limit is not None else None
+
+    try:
+        cadop_map = load_cadop_map(cadop_csv, budget)
+    except MemoryLimitExceeded as exc:
+        print(f"   ⚠ {exc}: enriquecimento completo.")
+        run_enrichment(memory_limit, table_format=table_format)
+        return False
+
+    previous_map: Dict[str, Dict[str, str]] = snapshot["cadastros"]
+    changes = diff_cadop(previous_map, cadop_map)
+    registros = set(changes)
+
+    kinds = ["novo", "alterado", "removido"]
+    counts = {kind: sum(1 for value in changes.values() if value == kind) for kind in kinds}
+    print(f"   ✔ Operadoras no diff: {len(changes)} "
+          f"(novas: {counts['novo']}, alteradas: {counts['alterado']}, removidas: {counts['removido']})")
+
+    print("🔗 Reenriquecendo só as linhas desses REG_ANS...")
+    input_fields = read_input_header()
+    output_fields = enriched_fields(input_fields)
+    scanned = [0]
+    touched = 0
+    newly_matched = 0
+    lost_match = 0
+    no_match_rows: List[Dict[str, str]] = []
+    # Versão nova por REG_ANS (só as linhas do diff), para trocar no arquivo completo
+    replacements: Dict[str, Deque[Dict[str, str]]] = defaultdict(deque)
+
+    with table_format.writer(CSV_ENRICHED_DELTA, output_fields) as writer, \
+            table_format.writer(CSV_ENRICHED_PREVIOUS, output_fields) as previous_writer:
+
+        # Sem alterações não há o que ler: os dois lotes ficam vazios
+        rows = iter_rows_for_reg_ans(registros, scanned) if registros else iter([])
+        for row in rows:
+            reg_ans = (row.get("REG_ANS", "") or "").strip()
+            previous_row = dict(row)
+
+            previous_no_match = enrich_row(previous_row, previous_map.get(reg_ans))
+            no_match = enrich_row(row, cadop_map.get(reg_ans))
+
+            previous_writer.writerow(previous_row)
+            writer.writerow(row)
+            replacements[reg_ans].append(row)
+            touched += 1
+
+            if no_match is not None:
+                no_match_rows.append(no_match)
+                if previous_no_match is None:
+                    lost_match += 1
+            elif previous_no_match is not None:
+                newly_matched += 1
+
+    written, indexed = patch_enriched(replacements, output_fields, table_format) if replacements else (None, False)
+    patch_no_match_report(registros, no_match_rows)
+
+    total = scanned[0] if registros else int(snapshot.get("linhas", 0))
+    save_cadop_snapshot(cadop_map, total, float(snapshot.get("segundos", 0)))
+
+    elapsed = time.perf_counter() - started
+    full_seconds = float(snapshot.get("segundos", 0))
+    share = touched / total if total else 0.0
+
+    print("✅ Diff do CADOP aplicado!")
+    print(f"   ✔ Linhas reenriquecidas: {touched} de {total} ({share:.1%})")
+    print(f"   ✔ Passaram a ter match: {newly_matched} | perderam o match: {lost_match}")
+    print(f"   ✔ Lote novo: {writer.path}")
+    print(f"   ✔ Versão anterior: {previous_writer.path}")
+    if written is not None:
+        print(f"   ✔ Linhas trocadas em {resolve_table(CSV_ENRICHED)} ({written} linhas"
+              f"{', ordenado e indexado' if indexed else ''})")
+    if full_seconds:
+        print(f"   ⏱ {elapsed:.2f}s (enriquecimento completo anterior: {full_seconds:.2f}s, "
+              f"~{max(0.0, full_seconds - elapsed):.2f}s economizados)")
+    else:
+        print(f"   ⏱ {elapsed:.2f}s")
+
+    return True
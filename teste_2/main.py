@@ -1,11 +1,18 @@
 from __future__ import annotations
 
+import argparse
+import time
 from pathlib import Path
+from typing import List
 
-from enricher import run_enrichment
+from enricher import download_canceled_cadop_csv, download_latest_cadop_csv, run_cadop_update, run_enrichment
 from validator import validate_csv
-from aggregator import aggregate
+from aggregator import GROWTH_TOP_K, aggregate, load_state
 from packer import pack_output
+from archive import CODECS, CompressionSettings
+from arrow_io import FORMATS, TableFormat
+from dataset import parse_quarter_window
+from spill import parse_memory_size
 
 
 def project_root() -> Path:
@@ -16,6 +23,166 @@ def project_root() -> Path:
     return Path(__file__).resolve().parents[1]
 
 
+# Etapas que podem ser pedidas em --etapas (ordem de execução).
+# "cadop" só baixa o cadastro; o enriquecimento também baixa se faltar.
+STEPS = ["cadop", "enriquecimento", "validacao", "agregacao", "pacote"]
+DEFAULT_STEPS = ["enriquecimento", "validacao", "agregacao", "pacote"]
+
+
+def parse_steps(text: str) -> List[str]:
+    """
+    Converte 'validacao,agregacao' na lista de etapas (ordem de STEPS).
+    """
+    requested = {step.strip().lower() for step in text.split(",") if step.strip()}
+    unknown = requested - set(STEPS)
+
+    if unknown or not requested:
+        raise argparse.ArgumentTypeError(
+            f"Etapas inválidas: {', '.join(sorted(unknown)) or text!r} (use: {', '.join(STEPS)})"
+        )
+
+    return [step for step in STEPS if step in requested]
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Opções de linha de comando do Teste 2.
+    """
+    parser = argparse.ArgumentParser(description="Teste 2 — Transformação e Validação de Dados")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Quantidade de processos usados na agregação (padrão: 1, serial).",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["dict", "numpy"],
+        default="dict",
+        help="Engine da agregação: 'dict' (padrão) ou 'numpy' (colunar, requer numpy).",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help=(
+            "Aplica os trimestres do CSV validado ao estado salvo da agregação "
+            "(substituindo trimestres republicados) em vez de recalcular tudo."
+        ),
+    )
+    parser.add_argument(
+        "--trimestres",
+        type=parse_quarter_window,
+        default=None,
+        help=(
+            "Trimestres lidos do dataset particionado do Teste 1 "
+            "(ex: 2025T3, 2024T1:2025T2; padrão: todos)."
+        ),
+    )
+    parser.add_argument(
+        "--memory-limit",
+        type=parse_memory_size,
+        default=None,
+        help=(
+            "Limite de memória residente (ex: 512M, 2G). Acima dele o join por REG_ANS "
+            "e a agregação usam partições em disco e a ordenação final é externa."
+        ),
+    )
+    parser.add_argument(
+        "--top-crescimento",
+        type=int,
+        default=GROWTH_TOP_K,
+        help=(
+            "Tamanho do ranking de maior crescimento entre o primeiro e o último trimestre "
+            f"(por operadora e por UF; padrão: {GROWTH_TOP_K})."
+        ),
+    )
+    parser.add_argument(
+        "--atualizar-cadop",
+        action="store_true",
+        help="Baixa de novo o CADOP mesmo se já estiver no cache (arquivo atualizado pela ANS).",
+    )
+    parser.add_argument(
+        "--alteracoes-cadop",
+        action="store_true",
+        help=(
+            "Compara o CADOP com o da última execução e reenriquece, revalida e reagrega "
+            "só as linhas das operadoras alteradas (implica --incremental)."
+        ),
+    )
+    parser.add_argument(
+        "--cadop-historico",
+        action="store_true",
+        help=(
+            "Join por data: cada trimestre usa o cadastro em vigor naquele trimestre, a partir do "
+            "histórico dos CADOPs baixados e da lista de operadoras canceladas."
+        ),
+    )
+    parser.add_argument(
+        "--ordenar-por-operadora",
+        action="store_true",
+        help=(
+            "Grava o CSV enriquecido ordenado por REG_ANS, Ano, Trimestre, com o índice "
+            "output/despesas_enriquecidas.csv.idx para consultas por operadora."
+        ),
+    )
+    parser.add_argument(
+        "--formato",
+        choices=FORMATS,
+        default="csv",
+        help=(
+            "Formato dos arquivos entre as etapas (enriquecido e validado): csv (padrão) ou "
+            "arrow (Arrow IPC, lido mapeado em memória; precisa do pyarrow)."
+        ),
+    )
+    parser.add_argument(
+        "--exportar-csv",
+        action="store_true",
+        help="Com --formato arrow, grava também os CSVs intermediários (para inspeção ou outras ferramentas).",
+    )
+    parser.add_argument(
+        "--etapas",
+        type=parse_steps,
+        default=DEFAULT_STEPS,
+        help=(
+            f"Etapas a executar, separadas por vírgula ({', '.join(STEPS)}). "
+            "Padrão: todas menos 'cadop' (usado pelo pipeline/runner.py)."
+        ),
+    )
+    parser.add_argument(
+        "--codec",
+        choices=list(CODECS),
+        default="deflate",
+        help="Compressão do ZIP final (padrão: deflate).",
+    )
+    parser.add_argument(
+        "--nivel",
+        type=int,
+        default=None,
+        help="Nível de compressão (deflate 0-9, bzip2 1-9; padrão: 6 / 9).",
+    )
+    parser.add_argument(
+        "--threads-compressao",
+        type=int,
+        default=1,
+        help="Threads do deflate em blocos paralelos (padrão: 1, compressão serial).",
+    )
+    args = parser.parse_args()
+
+    if args.top_crescimento < 1:
+        parser.error("--top-crescimento deve ser pelo menos 1.")
+
+    if args.alteracoes_cadop and args.cadop_historico:
+        parser.error("--alteracoes-cadop compara com um único cadastro; não use com --cadop-historico.")
+
+    if args.exportar_csv and args.formato != "arrow":
+        parser.error("--exportar-csv só vale com --formato arrow (no formato csv os CSVs já são gravados).")
+
+    if args.alteracoes_cadop and args.trimestres is not None:
+        parser.error("--alteracoes-cadop reaplica todos os trimestres das operadoras alteradas; não use --trimestres.")
+
+    return args
+
+
 def main() -> None:
     """
     Orquestra o Teste 2 na ordem correta:
@@ -23,8 +190,14 @@ def main() -> None:
     2) Validação (CNPJ, valor, razão social)
     3) Agregação (total, média, desvio padrão)
     4) Empacotamento ZIP final
+
+    Com --etapas roda só as etapas pedidas (ex: 'validacao,agregacao'),
+    lendo as saídas das anteriores já gravadas em teste_2/output.
     """
+    args = parse_args()
     root = project_root()
+    compression = CompressionSettings(args.codec, args.nivel, args.threads_compressao)
+    table_format = TableFormat(args.formato, args.exportar_csv)
 
     print("=" * 60)
     print("🚀 Iniciando TESTE 2 — Transformação e Validação de Dados")
@@ -32,25 +205,71 @@ def main() -> None:
     print(f"📁 Raiz do projeto: {root}")
     print()
 
-    print("🔹 PASSO 1/4 — Enriquecimento (CADOP) + join por REG_ANS")
-    run_enrichment()
-    print("✅ PASSO 1 finalizado.")
-    print()
+    steps = args.etapas
+    incremental = args.incremental or args.alteracoes_cadop
 
-    print("🔹 PASSO 2/4 — Validação (CNPJ, Razão Social, Valor > 0)")
-    validate_csv()
-    print("✅ PASSO 2 finalizado.")
-    print()
+    if "cadop" in steps:
+        print("🔹 CADOP — Download do cadastro de operadoras")
+        cadop_csv = download_latest_cadop_csv(args.atualizar_cadop)
+        print(f"✅ CADOP disponível em: {cadop_csv}")
+        if args.cadop_historico:
+            canceled_csv = download_canceled_cadop_csv(args.atualizar_cadop)
+            print(f"✅ Operadoras canceladas em: {canceled_csv}")
+        print()
 
-    print("🔹 PASSO 3/4 — Agregação (total, média por trimestre, desvio padrão)")
-    aggregate()
-    print("✅ PASSO 3 finalizado.")
-    print()
+    if "enriquecimento" in steps:
+        print("🔹 PASSO 1/4 — Enriquecimento (CADOP) + join por REG_ANS")
+        refresh_cadop = args.atualizar_cadop and "cadop" not in steps
 
-    print("🔹 PASSO 4/4 — Gerando ZIP final (Teste_Whybid.zip)")
-    zip_path = pack_output()
-    print(f"✅ PASSO 4 finalizado. ZIP gerado em: {zip_path}")
-    print()
+        if args.alteracoes_cadop and load_state() is None:
+            # O diff só troca linhas: sem estado salvo, a agregação precisa de tudo
+            print("   ⚠ Sem estado da agregação incremental: enriquecimento completo.")
+            run_enrichment(
+                memory_limit=args.memory_limit,
+                refresh_cadop=refresh_cadop,
+                sort_by_operator=args.ordenar_por_operadora,
+                table_format=table_format,
+            )
+        elif args.alteracoes_cadop:
+            run_cadop_update(memory_limit=args.memory_limit, refresh_cadop=refresh_cadop, table_format=table_format)
+        else:
+            run_enrichment(
+                memory_limit=args.memory_limit,
+                window=args.trimestres,
+                refresh_cadop=refresh_cadop,
+                sort_by_operator=args.ordenar_por_operadora,
+                as_of=args.cadop_historico,
+                table_format=table_format,
+            )
+        print("✅ PASSO 1 finalizado.")
+        print()
+
+    if "validacao" in steps:
+        print("🔹 PASSO 2/4 — Validação (CNPJ, Razão Social, Valor > 0)")
+        validate_csv(table_format)
+        print("✅ PASSO 2 finalizado.")
+        print()
+
+    if "agregacao" in steps:
+        print("🔹 PASSO 3/4 — Agregação (total, média por trimestre, desvio padrão)")
+        aggregate(
+            workers=args.workers,
+            incremental=incremental,
+            engine=args.engine,
+            memory_limit=args.memory_limit,
+            growth_top_k=args.top_crescimento,
+        )
+        print("✅ PASSO 3 finalizado.")
+        print()
+
+    if "pacote" in steps:
+        print("🔹 PASSO 4/4 — Gerando ZIP final (Teste_Whybid.zip)")
+        started = time.perf_counter()
+        zip_path = pack_output(compression)
+        print(f"✅ PASSO 4 finalizado. ZIP gerado em: {zip_path} "
+              f"({zip_path.stat().st_size / 1024:.1f} KB, {compression.describe()}, "
+              f"{time.perf_counter() - started:.2f}s)")
+        print()
 
     print("=" * 60)
     print("🎉 TESTE 2 concluído com sucesso!")
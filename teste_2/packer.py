@@ -1,8 +1,9 @@
 from __future__ import annotations
 
-import zipfile
 from pathlib import Path
-from typing import List
+from typing import List, Optional
+
+from archive import CompressionSettings, add_file, zip_archive
 
 
 def project_root() -> Path:
@@ -31,9 +32,12 @@ def files_to_pack() -> List[Path]:
     return [path for path in candidates if path.exists()]
 
 
-def pack_output() -> Path:
+def pack_output(settings: Optional[CompressionSettings] = None) -> Path:
     """
-    Compacta os arquivos do output em Teste_Whybid.zip.
+    Compacta os arquivos do output em Teste_Whybid.zip
+    (codec/nível/threads conforme `settings`; padrão: deflate nível 6).
+
+    O ZIP é montado num arquivo temporário e só substitui o anterior no final.
     """
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -43,8 +47,8 @@ def pack_output() -> Path:
             f"Nenhum arquivo encontrado em {OUTPUT_DIR}. Rode o pipeline primeiro."
         )
 
-    with zipfile.ZipFile(ZIP_PATH, mode="w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+    with zip_archive(ZIP_PATH) as zip_file:
         for file_path in selected_files:
-            zip_file.write(file_path, arcname=file_path.name)
+            add_file(zip_file, file_path, settings=settings)
 
     return ZIP_PATH
@@ -0,0 +1,390 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import math
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Sketches de memória limitada calculados na mesma leitura da agregação:
+# - KLLSketch: quantis aproximados (mediana, p95) do total de despesas de
+#   cada operadora no trimestre (os totais são somados pela agregação antes
+#   de entrar no sketch);
+# - HyperLogLog: contagem aproximada de operadoras distintas (REG_ANS).
+#
+# Os dois são "mergeáveis": sketches de faixas do CSV (processos),
+# de partições ou de execuções incrementais se juntam sem reler os dados.
+
+# Parâmetro k do KLL: erro de rank ~ 1,7 / k (k=200 -> ~0,8%).
+# Cada sketch guarda no máximo ~3k valores.
+DEFAULT_KLL_K = 200
+
+# Capacidade mínima de um nível do KLL e fator de decaimento entre níveis
+KLL_MIN_CAPACITY = 2
+KLL_DECAY = 2 / 3
+
+# Precisão do HyperLogLog: 2^p registradores de 1 byte
+# (p=12 -> 4 KB por sketch, erro padrão ~1,6%)
+DEFAULT_HLL_PRECISION = 12
+HLL_HASH_BITS = 64
+
+# Tipos do estado dos sketches (mesmo formato do estado de agregação,
+# com um GroupSketch no lugar de [centavos, linhas]):
+# SketchState[conjunto][chave_do_grupo][(Ano, Trimestre)] = GroupSketch
+QuarterSketches = Dict[Tuple[str, str], "GroupSketch"]
+SketchGroups = Dict[Tuple[str, ...], QuarterSketches]
+SketchState = Dict[Tuple[str, ...], SketchGroups]
+
+
+class KLLSketch:
+    """
+    Sketch de quantis KLL (Karnin, Lang e Liberty).
+
+    Os valores ficam em níveis; um item do nível h vale 2^h valores.
+    Quando o sketch passa da capacidade, o nível mais baixo cheio é
+    ordenado e metade dos itens (posições pares ou ímpares, alternando)
+    sobe para o nível seguinte. A soma dos pesos continua igual a n.
+
+    Enquanto n cabe no nível 0 os quantis são exatos. A alternância das
+    posições é determinística: a mesma sequência de valores gera sempre o
+    mesmo sketch (a ordem dos merges ainda pode mudar o resultado dentro
+    do erro).
+    """
+
+    def __init__(self, k: int = DEFAULT_KLL_K) -> None:
+        self.k = k
+        self.n = 0
+        self.levels: List[List[int]] = [[]]
+        self.compactions: List[int] = [0]
+
+    def capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(KLL_MIN_CAPACITY, int(math.ceil(self.k * KLL_DECAY ** depth)))
+
+    def size(self) -> int:
+        return sum(len(items) for items in self.levels)
+
+    def max_size(self) -> int:
+        return sum(self.capacity(level) for level in range(len(self.levels)))
+
+    def update(self, value: int) -> None:
+        self.levels[0].append(value)
+        self.n += 1
+        if len(self.levels[0]) >= self.capacity(0):
+            self._compress()
+
+    def update_many(self, values: Iterable[int]) -> None:
+        before = len(self.levels[0])
+        self.levels[0].extend(values)
+        self.n += len(self.levels[0]) - before
+        self._compress()
+
+    def merge(self, other: "KLLSketch") -> "KLLSketch":
+        if other.k != self.k:
+            raise ValueError(f"KLL com k diferentes não podem ser juntados ({self.k} x {other.k}).")
+
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+            self.compactions.append(0)
+
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+
+        self.n += other.n
+        self._compress()
+        return self
+
+    def _compress(self) -> None:
+        while self.size() >= self.max_size():
+            for level in range(len(self.levels)):
+                if len(self.levels[level]) >= self.capacity(level):
+                    self._compact(level)
+                    break
+            else:
+                return
+
+    def _compact(self, level: int) -> None:
+        if level + 1 == len(self.levels):
+            self.levels.append([])
+            self.compactions.append(0)
+
+        items = sorted(self.levels[level])
+        # Com quantidade ímpar um item fica no nível (o peso total não muda)
+        kept = [items.pop()] if len(items) % 2 else []
+        offset = self.compactions[level] % 2
+        self.compactions[level] += 1
+
+        self.levels[level + 1].extend(items[offset::2])
+        self.levels[level] = kept
+
+    def weighted_items(self) -> List[Tuple[int, int]]:
+        """
+        (valor, peso) de todos os itens, ordenados pelo valor.
+        """
+        return sorted(
+            (value, 1 << level)
+            for level, items in enumerate(self.levels)
+            for value in items
+        )
+
+    def quantile(self, fraction: float) -> Optional[int]:
+        """
+        Menor valor cujo rank acumulado atinge fraction * n
+        (percentil "nearest rank"). None se o sketch estiver vazio.
+        """
+        if self.n == 0:
+            return None
+
+        target = max(1, math.ceil(fraction * self.n))
+        cumulative = 0
+        items = self.weighted_items()
+        for value, weight in items:
+            cumulative += weight
+            if cumulative >= target:
+                return value
+        return items[-1][0]
+
+    def to_payload(self) -> Dict[str, object]:
+        return {"k": self.k, "n": self.n, "niveis": self.levels, "compactacoes": self.compactions}
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, object]) -> "KLLSketch":
+        sketch = cls(int(payload["k"]))
+        sketch.n = int(payload["n"])
+        sketch.levels = [[int(value) for value in items] for items in payload["niveis"]]
+        sketch.compactions = [int(count) for count in payload["compactacoes"]]
+        return sketch
+
+
+def hll_hash(text: str) -> int:
+    """
+    Hash de 64 bits estável entre processos (o hash() do Python não é).
+    """
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """
+    Contador aproximado de valores distintos (HyperLogLog).
+
+    Os p primeiros bits do hash escolhem o registrador; o registrador
+    guarda a maior posição do primeiro bit 1 no restante. Merge = máximo
+    registrador a registrador. Para cardinalidades pequenas usa contagem
+    linear (praticamente exata).
+    """
+
+    def __init__(self, precision: int = DEFAULT_HLL_PRECISION) -> None:
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add_hash(self, value_hash: int) -> None:
+        remaining_bits = HLL_HASH_BITS - self.precision
+        index = value_hash >> remaining_bits
+        rest = value_hash & ((1 << remaining_bits) - 1)
+        rank = remaining_bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def add(self, text: str) -> None:
+        self.add_hash(hll_hash(text))
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.precision != self.precision:
+            raise ValueError("HyperLogLog com precisões diferentes não podem ser juntados.")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self) -> int:
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -register for register in self.registers)
+
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)
+
+        return int(round(estimate))
+
+    def to_payload(self) -> Dict[str, object]:
+        # Registradores quase todos zerados comprimem muito bem
+        encoded = base64.b64encode(zlib.compress(bytes(self.registers))).decode("ascii")
+        return {"p": self.precision, "registradores": encoded}
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, object]) -> "HyperLogLog":
+        sketch = cls(int(payload["p"]))
+        sketch.registers = bytearray(zlib.decompress(base64.b64decode(str(payload["registradores"]))))
+        return sketch
+
+
+class GroupSketch:
+    """
+    Sketches de um grupo num trimestre: quantis dos totais das operadoras
+    no trimestre (centavos) e operadoras distintas.
+
+    Sketches não aceitam remoção: `stale` marca os que deveriam ter
+    perdido valores (linhas trocadas por um diff do CADOP) e só é limpo
+    quando o trimestre é reaplicado.
+    """
+
+    def __init__(
+        self,
+        quantiles: Optional[KLLSketch] = None,
+        distinct: Optional[HyperLogLog] = None,
+        stale: bool = False,
+    ) -> None:
+        self.quantiles = quantiles or KLLSketch()
+        self.distinct = distinct or HyperLogLog()
+        self.stale = stale
+
+    def add(self, cents: int, reg_ans_hash: int) -> None:
+        self.quantiles.update(cents)
+        self.distinct.add_hash(reg_ans_hash)
+
+    def merge(self, other: "GroupSketch") -> "GroupSketch":
+        self.quantiles.merge(other.quantiles)
+        self.distinct.merge(other.distinct)
+        self.stale = self.stale or other.stale
+        return self
+
+    def to_payload(self) -> Dict[str, object]:
+        payload: Dict[str, object] = {"quantis": self.quantiles.to_payload(), "distintos": self.distinct.to_payload()}
+        if self.stale:
+            payload["desatualizado"] = True
+        return payload
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, object]) -> "GroupSketch":
+        return cls(
+            KLLSketch.from_payload(payload["quantis"]),
+            HyperLogLog.from_payload(payload["distintos"]),
+            bool(payload.get("desatualizado", False)),
+        )
+
+
+def new_sketch_state(sketch_sets: List[Tuple[str, ...]]) -> SketchState:
+    """
+    Cria um estado de sketches vazio para os conjuntos informados.
+    """
+    return {grouping: {} for grouping in sketch_sets}
+
+
+def sketch_for(
+    state: SketchState,
+    grouping: Tuple[str, ...],
+    group_key: Tuple[str, ...],
+    quarter_key: Tuple[str, str]
+) -> GroupSketch:
+    """
+    Sketch de (conjunto, grupo, trimestre), criado na primeira vez.
+    """
+    quarter_map = state[grouping].setdefault(group_key, {})
+    sketch = quarter_map.get(quarter_key)
+    if sketch is None:
+        sketch = quarter_map[quarter_key] = GroupSketch()
+    return sketch
+
+
+def merge_sketch_states(target: SketchState, other: SketchState) -> SketchState:
+    """
+    Junta um estado parcial de sketches em outro (mesma ideia do merge_states).
+    """
+    for grouping, groups in other.items():
+        target_groups = target.setdefault(grouping, {})
+
+        for group_key, quarter_map in groups.items():
+            target_quarters = target_groups.setdefault(group_key, {})
+
+            for quarter_key, sketch in quarter_map.items():
+                if quarter_key in target_quarters:
+                    target_quarters[quarter_key].merge(sketch)
+                else:
+                    target_quarters[quarter_key] = sketch
+
+    return target
+
+
+def retract_sketch_quarters(state: SketchState, quarters: List[Tuple[str, str]]) -> None:
+    """
+    Remove os sketches dos trimestres informados (republicação).
+    Como os sketches são guardados por trimestre, nada precisa ser "desfeito".
+    """
+    to_remove = set(quarters)
+
+    for groups in state.values():
+        for group_key in list(groups):
+            quarter_map = groups[group_key]
+            for quarter_key in [key for key in quarter_map if key in to_remove]:
+                del quarter_map[quarter_key]
+            if not quarter_map:
+                del groups[group_key]
+
+
+def combined_sketch(quarter_map: QuarterSketches) -> GroupSketch:
+    """
+    Junta os sketches trimestrais de um grupo num sketch novo
+    (os do estado não são alterados).
+    """
+    combined = GroupSketch()
+    for quarter_key in sorted(quarter_map):
+        combined.merge(quarter_map[quarter_key])
+    return combined
+
+
+def summarize_sketch_groups(
+    grouping: Tuple[str, ...],
+    groups: SketchGroups,
+    quantiles: List[Tuple[str, float]]
+) -> List[Dict[str, object]]:
+    """
+    Linhas de resultado de um conjunto: quantidade de totais
+    (operadora, trimestre), quantis pedidos (em reais) e operadoras
+    distintas (estimadas).
+    """
+    results: List[Dict[str, object]] = []
+
+    for group_key, quarter_map in groups.items():
+        combined = combined_sketch(quarter_map)
+        result: Dict[str, object] = dict(zip(grouping, group_key))
+        result["QtdOperadoraTrimestre"] = combined.quantiles.n
+
+        for field, fraction in quantiles:
+            cents = combined.quantiles.quantile(fraction)
+            result[field] = round(cents / 100, 2) if cents is not None else ""
+
+        result["OperadorasDistintas"] = combined.distinct.count()
+        results.append(result)
+
+    return results
+
+
+def sketch_state_to_payload(state: SketchState) -> List[Dict[str, object]]:
+    """
+    Estado dos sketches em estrutura serializável (JSON).
+    """
+    return [
+        {
+            "colunas": list(grouping),
+            "grupos": [
+                [
+                    list(group_key),
+                    {f"{ano}-{trimestre}": sketch.to_payload() for (ano, trimestre), sketch in quarter_map.items()},
+                ]
+                for group_key, quarter_map in groups.items()
+            ],
+        }
+        for grouping, groups in state.items()
+    ]
+
+
+def sketch_state_from_payload(payload: List[Dict[str, object]]) -> SketchState:
+    state: SketchState = {}
+    for entry in payload:
+        groups: SketchGroups = {}
+        for group_key, quarter_map in entry["grupos"]:
+            groups[tuple(group_key)] = {
+                tuple(quarter.split("-", 1)): GroupSketch.from_payload(sketch)
+                for quarter, sketch in quarter_map.items()
+            }
+        state[tuple(entry["colunas"])] = groups
+    return state
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import heapq
+import os
+import pickle
+import re
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+# Quantidade de registros processados entre duas leituras do RSS
+MEMORY_CHECK_INTERVAL = 5_000
+
+# Partições de hash dos arquivos de spill (join por REG_ANS e agrupamento)
+SPILL_PARTITIONS = 16
+
+_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+class MemoryLimitExceeded(Exception):
+    """
+    Sinaliza que uma estrutura em memória passou do limite configurado
+    (quem chama troca para o caminho com spill em disco).
+    """
+
+
+def parse_memory_size(text: str) -> int:
+    """
+    Converte tamanhos como '512M', '2G', '800k' ou '1048576' em bytes.
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?)i?B?\s*", text or "", re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Tamanho de memória inválido: {text!r} (ex: 512M, 2G)")
+
+    number, unit = match.groups()
+    return int(float(number) * _SIZE_UNITS[unit.upper()])
+
+
+def current_rss_bytes() -> int:
+    """
+    Memória residente (RSS) do processo atual.
+    Usa /proc/self/statm (Linux); fora do Linux, cai para o pico do
+    getrusage (aproximação conservadora).
+    """
+    try:
+        with open("/proc/self/statm", "r", encoding="ascii") as fin:
+            resident_pages = int(fin.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux informa em KB; macOS em bytes
+        return peak if peak > 1 << 32 else peak * 1024
+
+
+class MemoryBudget:
+    """
+    Acompanha o RSS do processo contra um limite (em bytes).
+
+    O RSS é lido a cada `check_interval` chamadas de over_limit(),
+    para não pesar no laço de leitura; com force=True é lido na hora
+    (início e fim de uma carga, que pode ter menos chamadas que o
+    intervalo). Sem limite, nunca estoura.
+    """
+
+    def __init__(self, limit_bytes: Optional[int], check_interval: int = MEMORY_CHECK_INTERVAL) -> None:
+        self.limit_bytes = limit_bytes
+        self.check_interval = max(1, check_interval)
+        self.calls = 0
+        self.peak_bytes = 0
+        self.spills = 0
+
+    def over_limit(self, force: bool = False) -> bool:
+        """
+        True quando o RSS passou do limite (verificado periodicamente,
+        ou sempre com force=True).
+        """
+        if self.limit_bytes is None:
+            return False
+
+        self.calls += 1
+        if self.calls % self.check_interval and not force:
+            return False
+
+        rss = current_rss_bytes()
+        self.peak_bytes = max(self.peak_bytes, rss)
+        return rss > self.limit_bytes
+
+    def describe(self) -> str:
+        """
+        Resumo para os logs do pipeline.
+        """
+        if self.limit_bytes is None:
+            return "sem limite"
+        return (
+            f"limite {self.limit_bytes / 1024 ** 2:.0f} MB | pico medido {self.peak_bytes / 1024 ** 2:.0f} MB "
+            f"| spills: {self.spills}"
+        )
+
+
+def spill_directory(base_dir: Optional[Path] = None) -> tempfile.TemporaryDirectory:
+    """
+    Pasta temporária para os arquivos de spill (removida ao sair do `with`).
+    """
+    if base_dir is not None:
+        base_dir.mkdir(parents=True, exist_ok=True)
+    return tempfile.TemporaryDirectory(prefix="spill_", dir=str(base_dir) if base_dir else None)
+
+
+def append_records(path: Path, records: Iterable[Any]) -> int:
+    """
+    Acrescenta registros (pickle, um após o outro) ao final de um arquivo.
+    Retorna a quantidade gravada.
+    """
+    count = 0
+    with path.open("ab") as fout:
+        for record in records:
+            pickle.dump(record, fout, protocol=pickle.HIGHEST_PROTOCOL)
+            count += 1
+    return count
+
+
+def read_records(path: Path) -> Iterator[Any]:
+    """
+    Lê, em streaming, os registros gravados por append_records.
+    Arquivo inexistente equivale a vazio.
+    """
+    if not path.exists():
+        return
+
+    with path.open("rb") as fin:
+        while True:
+            try:
+                yield pickle.load(fin)
+            except EOFError:
+                return
+
+
+def external_sort(
+    items: Iterable[Any],
+    key: Callable[[Any], Any],
+    budget: MemoryBudget,
+    work_dir: Path,
+    prefix: str = "run",
+) -> Iterator[Any]:
+    """
+    Ordenação externa: acumula itens em memória e, quando o orçamento
+    estoura, ordena o bloco e grava um "run" em disco. No final faz o
+    merge (heapq.merge) dos runs com o bloco que ficou em memória.
+
+    O resultado é o mesmo de sorted(items, key=key) (inclusive empates,
+    pois os runs são gerados e intercalados na ordem de chegada).
+    """
+    buffer: List[Any] = []
+    runs: List[Path] = []
+
+    for item in items:
+        buffer.append(item)
+        if budget.over_limit():
+            buffer.sort(key=key)
+            run_path = work_dir / f"{prefix}_{len(runs):05d}.pkl"
+            append_records(run_path, buffer)
+            runs.append(run_path)
+            budget.spills += 1
+            buffer = []
+
+    buffer.sort(key=key)
+    if not runs:
+        yield from buffer
+        return
+
+    yield from heapq.merge(*(read_records(run) for run in runs), buffer, key=key)
+
+    for run in runs:
+        run.unlink()
+
+
+class PartitionedWriter:
+    """
+    Distribui registros em N arquivos de spill por partição, com buffer
+    em memória descarregado quando o orçamento estoura (ou no close()).
+    """
+
+    def __init__(self, work_dir: Path, prefix: str, partitions: int, budget: MemoryBudget) -> None:
+        self.paths = [work_dir / f"{prefix}_p{index:03d}.pkl" for index in range(partitions)]
+        self.buffers: List[List[Any]] = [[] for _ in range(partitions)]
+        self.budget = budget
+
+    def add(self, partition: int, record: Any) -> None:
+        self.buffers[partition].append(record)
+        if self.budget.over_limit():
+            self.flush()
+            self.budget.spills += 1
+
+    def flush(self) -> None:
+        for path, buffer in zip(self.paths, self.buffers):
+            if buffer:
+                append_records(path, buffer)
+                buffer.clear()
+
+    def close(self) -> List[Path]:
+        """
+        Descarrega o que falta e devolve os arquivos de cada partição.
+        """
+        self.flush()
+        return self.paths
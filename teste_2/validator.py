@@ -2,9 +2,12 @@ from __future__ import annotations
 
 import csv
 import re
+from contextlib import nullcontext
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
+from arrow_io import TableFormat, iter_rows, read_fieldnames, remove_table, resolve_table, table_exists
+
 
 def project_root() -> Path:
     """
@@ -22,6 +25,12 @@ CSV_INPUT = OUTPUT_DIR / "despesas_enriquecidas.csv"
 CSV_VALIDATED = OUTPUT_DIR / "despesas_validadas.csv"
 CSV_INVALID = OUTPUT_DIR / "registros_invalidos.csv"
 
+# Versão nova e anterior das linhas reenriquecidas por um diff do CADOP (ver enricher.py)
+CSV_INPUT_DELTA = OUTPUT_DIR / "despesas_enriquecidas_alteradas.csv"
+CSV_INPUT_PREVIOUS = OUTPUT_DIR / "despesas_enriquecidas_anteriores.csv"
+CSV_VALIDATED_DELTA = OUTPUT_DIR / "despesas_validadas_alteradas.csv"
+CSV_VALIDATED_PREVIOUS = OUTPUT_DIR / "despesas_validadas_anteriores.csv"
+
 DELIMITER = ";"
 
 
@@ -120,52 +129,89 @@ def validate_row(row: Dict[str, str]) -> Tuple[bool, List[str]]:
     return (len(reasons) == 0), reasons
 
 
-def validate_csv() -> None:
+def validate_file(
+    input_path: Path,
+    valid_path: Path,
+    invalid_path: Optional[Path] = None,
+    table_format: Optional[TableFormat] = None,
+) -> Tuple[int, int]:
+    """
+    Valida um CSV enriquecido em streaming (sem guardar as linhas em memória),
+    gravando os válidos em valid_path e, se informado, o relatório de
+    inválidos com motivo em invalid_path.
+
+    A entrada é lida no formato em que foi gravada (.arrow ao lado do CSV,
+    se existir); os válidos saem no formato table_format (padrão: CSV) e
+    o relatório de inválidos é sempre CSV.
+    Retorna (válidos, inválidos).
+    """
+    table_format = table_format or TableFormat()
+    source = resolve_table(input_path)
+    valid_count = 0
+    invalid_count = 0
+
+    input_fields = read_fieldnames(source)
+    if not input_fields:
+        raise ValueError("CSV de entrada não possui cabeçalho.")
+    invalid_fields = input_fields + ["Motivos"]
+
+    with table_format.writer(valid_path, input_fields) as valid_writer, \
+            (invalid_path.open(mode="w", encoding="utf-8", newline="") if invalid_path else nullcontext()) as finvalid:
+        invalid_writer = None
+        if finvalid is not None:
+            invalid_writer = csv.DictWriter(finvalid, fieldnames=invalid_fields, delimiter=DELIMITER)
+            invalid_writer.writeheader()
+
+        for row in iter_rows(source):
+            is_valid, reasons = validate_row(row)
+
+            if is_valid:
+                valid_writer.writerow(row)
+                valid_count += 1
+            else:
+                if invalid_writer is not None:
+                    row_copy = dict(row)
+                    row_copy["Motivos"] = ",".join(reasons)
+                    invalid_writer.writerow(row_copy)
+                invalid_count += 1
+
+    return valid_count, invalid_count
+
+
+def validate_csv(table_format: Optional[TableFormat] = None) -> None:
     """
     Lê o CSV enriquecido e gera:
-    - despesas_validadas.csv (somente válidos)
+    - despesas_validadas.csv (somente válidos; .arrow com table_format arrow)
     - registros_invalidos.csv (relatório com motivo)
+
+    Depois de um diff do CADOP, as duas versões das linhas alteradas
+    também são validadas (despesas_validadas_alteradas.csv e
+    despesas_validadas_anteriores.csv), para a agregação incremental
+    retirar exatamente o que tinha sido somado e somar a versão nova.
     """
     ensure_output_dir()
+    table_format = table_format or TableFormat()
 
-    if not CSV_INPUT.exists():
+    if not table_exists(CSV_INPUT):
         raise FileNotFoundError(
             f"Arquivo não encontrado: {CSV_INPUT}. Rode antes: python teste_2/enricher.py"
         )
 
-    valid_rows: List[Dict[str, str]] = []
-    invalid_rows: List[Dict[str, str]] = []
-
-    with CSV_INPUT.open(mode="r", encoding="utf-8", newline="") as fin:
-        reader = csv.DictReader(fin, delimiter=DELIMITER)
-
-        if not reader.fieldnames:
-            raise ValueError("CSV de entrada não possui cabeçalho.")
-
-        input_fields = list(reader.fieldnames)
-        invalid_fields = input_fields + ["Motivos"]
-
-        for row in reader:
-            is_valid, reasons = validate_row(row)
-
-            if is_valid:
-                valid_rows.append(row)
-            else:
-                row_copy = dict(row)
-                row_copy["Motivos"] = ",".join(reasons)
-                invalid_rows.append(row_copy)
-
-    with CSV_VALIDATED.open(mode="w", encoding="utf-8", newline="") as fout:
-        writer = csv.DictWriter(fout, fieldnames=input_fields, delimiter=DELIMITER)
-        writer.writeheader()
-        writer.writerows(valid_rows)
-
-    with CSV_INVALID.open(mode="w", encoding="utf-8", newline="") as fout:
-        writer = csv.DictWriter(fout, fieldnames=invalid_fields, delimiter=DELIMITER)
-        writer.writeheader()
-        writer.writerows(invalid_rows)
+    valid_count, invalid_count = validate_file(CSV_INPUT, CSV_VALIDATED, CSV_INVALID, table_format)
 
     print("✅ Validação concluída!")
-    print(f"   ✔ Válidos: {len(valid_rows)} -> {CSV_VALIDATED}")
-    print(f"   ✔ Inválidos: {len(invalid_rows)} -> {CSV_INVALID}")
+    print(f"   ✔ Válidos: {valid_count} -> {CSV_VALIDATED} ({table_format.describe()})")
+    print(f"   ✔ Inválidos: {invalid_count} -> {CSV_INVALID}")
 
+    if table_exists(CSV_INPUT_DELTA) and table_exists(CSV_INPUT_PREVIOUS):
+        delta_valid, delta_invalid = validate_file(CSV_INPUT_DELTA, CSV_VALIDATED_DELTA, table_format=table_format)
+        previous_valid, previous_invalid = validate_file(
+            CSV_INPUT_PREVIOUS, CSV_VALIDATED_PREVIOUS, table_format=table_format
+        )
+        print(f"   ✔ Versão nova (diff do CADOP): {delta_valid} válidos, "
+              f"{delta_invalid} inválidos -> {CSV_VALIDATED_DELTA}")
+        print(f"   ✔ Versão anterior (diff do CADOP): {previous_valid} válidos, "
+              f"{previous_invalid} inválidos -> {CSV_VALIDATED_PREVIOUS}")
+    else:
+        remove_table(CSV_VALIDATED_DELTA)
+        remove_table(CSV_VALIDATED_PREVIOUS)
@@ -0,0 +1,252 @@
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+import csv
+import os
+import re
+from pathlib import Path
+
+from arrow_io import ARROW_SUFFIX, ArrowWriter, iter_rows
+
+# Dataset particionado no estilo Hive:
+# <raiz>/ano=2025/trimestre=3/part-00000.csv (ou part-00000.arrow)
+#
+# Este arquivo é copiado sem alterações em teste_1, teste_2 e teste_3
+# (mesma estratégia do utils.py), para cada etapa ler o dataset sem
+# depender dos módulos das outras.
+
+DATASET_DIRNAME = "despesas_eventos_sinistros"
+PART_FILENAME = "part-00000.csv"
+PART_ARROW_FILENAME = "part-00000" + ARROW_SUFFIX
+DELIMITER = ";"
+
+FIELDNAMES = [
+    "REG_ANS",
+    "CNPJ",
+    "RazaoSocial",
+    "Ano",
+    "Trimestre",
+    "ValorDespesas",
+    "Conta"
+]
+
+PARTITION_PATTERN = re.compile(r"^ano=(\d{4})$")
+QUARTER_DIR_PATTERN = re.compile(r"^trimestre=([1-4])$")
+
+# Trimestre na linha de comando: 2023T1 (ou 1T2023)
+QUARTER_PATTERN = re.compile(r"^(?:(20\d{2})T([1-4])|([1-4])T(20\d{2}))$", re.IGNORECASE)
+
+QuarterWindow = Optional[Tuple[Tuple[int, int], Tuple[int, int]]]
+PartitionPredicate = Callable[[int, int], bool]
+
+
+def parse_quarter(text: str) -> Tuple[int, int]:
+    """
+    Converte '2023T1' (ou '1T2023') em (2023, 1).
+    """
+    match = QUARTER_PATTERN.match(text.strip())
+
+    if not match:
+        raise ValueError(f"Trimestre inválido: {text!r} (use o formato 2023T1)")
+
+    if match.group(1):
+        return int(match.group(1)), int(match.group(2))
+
+    return int(match.group(4)), int(match.group(3))
+
+
+def parse_quarter_window(text: str) -> QuarterWindow:
+    """
+    Interpreta a janela de trimestres:
+    - 'all'            -> todos os trimestres disponíveis (None)
+    - '2019T1:2023T4'  -> intervalo fechado
+    - '2019T1:'        -> de 2019T1 em diante
+    - '2023T2'         -> um único trimestre
+    """
+    text = text.strip()
+
+    if text.lower() == "all":
+        return None
+
+    if ":" not in text:
+        quarter = parse_quarter(text)
+        return quarter, quarter
+
+    start_text, end_text = text.split(":", 1)
+    start = parse_quarter(start_text) if start_text.strip() else (0, 1)
+    end = parse_quarter(end_text) if end_text.strip() else (9999, 4)
+
+    if start > end:
+        raise ValueError(f"Intervalo de trimestres invertido: {text!r}")
+
+    return start, end
+
+
+def partition_dir(root: Path, year: int, quarter: int) -> Path:
+    """
+    Pasta de uma partição: <raiz>/ano=AAAA/trimestre=T
+    """
+    return root / f"ano={year}" / f"trimestre={quarter}"
+
+
+def list_partitions(
+    root: Path,
+    window: QuarterWindow = None,
+    predicate: Optional[PartitionPredicate] = None
+) -> List[Tuple[int, int, Path]]:
+    """
+    Lista as partições (ano, trimestre, arquivo) que atendem aos filtros,
+    do trimestre mais recente para o mais antigo (mesma ordem do CSV
+    consolidado).
+
+    O filtro usa só os nomes das pastas: partições fora da janela
+    nem são abertas. Se a partição tiver as duas versões, vale a Arrow.
+    """
+    partitions: List[Tuple[int, int, Path]] = []
+
+    if not root.is_dir():
+        return partitions
+
+    for year_dir in root.iterdir():
+        year_match = PARTITION_PATTERN.match(year_dir.name)
+        if not year_match or not year_dir.is_dir():
+            continue
+
+        year = int(year_match.group(1))
+        if window and not window[0][0] <= year <= window[1][0]:
+            continue
+
+        for quarter_dir in year_dir.iterdir():
+            quarter_match = QUARTER_DIR_PATTERN.match(quarter_dir.name)
+            if not quarter_match:
+                continue
+
+            quarter = int(quarter_match.group(1))
+            part_path = quarter_dir / PART_ARROW_FILENAME
+            if not part_path.exists():
+                part_path = quarter_dir / PART_FILENAME
+
+            if window and not window[0] <= (year, quarter) <= window[1]:
+                continue
+            if predicate and not predicate(year, quarter):
+                continue
+            if not part_path.exists():
+                continue
+
+            partitions.append((year, quarter, part_path))
+
+    partitions.sort(key=lambda item: (item[0], item[1]), reverse=True)
+    return partitions
+
+
+def dataset_exists(root: Path) -> bool:
+    """
+    True se a pasta tem ao menos uma partição.
+    """
+    return bool(list_partitions(root))
+
+
+def read_dataset(
+    root: Path,
+    window: QuarterWindow = None,
+    predicate: Optional[PartitionPredicate] = None
+) -> Iterator[Dict[str, str]]:
+    """
+    Lê, em streaming, as linhas das partições selecionadas
+    (ex: window=((2024, 1), (2024, 4)) ou predicate=lambda ano, tri: tri == 4).
+    """
+    for _, _, part_path in list_partitions(root, window, predicate):
+        yield from iter_rows(part_path)
+
+
+class DatasetWriter:
+    """
+    Grava linhas no dataset particionado por (Ano, Trimestre).
+
+    Cada partição é escrita num arquivo temporário e só substitui a
+    anterior no commit() (os.replace, atômico). Partições que não
+    aparecem nas linhas gravadas ficam intactas — assim um trimestre
+    republicado pela ANS pode ser substituído sozinho.
+
+    file_format="arrow" grava part-00000.arrow (ver arrow_io.py); a versão
+    da partição no outro formato é apagada no commit().
+    """
+
+    def __init__(self, root: Path, fieldnames: Optional[List[str]] = None, file_format: str = "csv") -> None:
+        self.root = root
+        self.fieldnames = fieldnames or FIELDNAMES
+        self.file_format = file_format
+        self.files: Dict[Tuple[int, int], Tuple[Optional[TextIO], "csv.DictWriter", Optional[Path]]] = {}
+        self.counts: Dict[Tuple[int, int], int] = {}
+
+    def __enter__(self) -> "DatasetWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+    def add(self, row: Dict[str, object]) -> None:
+        key = (int(row["Ano"]), int(row["Trimestre"]))
+        entry = self.files.get(key)
+
+        if entry is None:
+            directory = partition_dir(self.root, *key)
+            directory.mkdir(parents=True, exist_ok=True)
+
+            if self.file_format == "arrow":
+                # O ArrowWriter já grava num temporário e publica no close()
+                entry = (None, ArrowWriter(directory / PART_ARROW_FILENAME, self.fieldnames), None)
+            else:
+                temp_path = directory / f".{PART_FILENAME}.{os.getpid()}.tmp"
+
+                file = temp_path.open(mode="w", encoding="utf-8", newline="")
+                writer = csv.DictWriter(file, fieldnames=self.fieldnames, delimiter=DELIMITER)
+                writer.writeheader()
+
+                entry = (file, writer, temp_path)
+            self.files[key] = entry
+            self.counts[key] = 0
+
+        entry[1].writerow(row)
+        self.counts[key] += 1
+
+    def add_all(self, rows: Iterable[Dict[str, object]]) -> None:
+        for row in rows:
+            self.add(row)
+
+    def commit(self) -> Dict[Tuple[int, int], int]:
+        """
+        Publica as partições gravadas. Retorna {(ano, trimestre): linhas}.
+        """
+        for (year, quarter), (file, writer, temp_path) in self.files.items():
+            directory = partition_dir(self.root, year, quarter)
+
+            if file is None:
+                writer.close()
+                stale = directory / PART_FILENAME
+            else:
+                file.close()
+                os.replace(temp_path, directory / PART_FILENAME)
+                stale = directory / PART_ARROW_FILENAME
+
+            if stale.exists():
+                stale.unlink()
+
+        self.files = {}
+        return dict(self.counts)
+
+    def abort(self) -> None:
+        """
+        Descarta as partições ainda não publicadas.
+        """
+        for file, writer, temp_path in self.files.values():
+            if file is None:
+                writer.abort()
+                continue
+
+            file.close()
+            if temp_path.exists():
+                temp_path.unlink()
+
+        self.files = {}
@@ -0,0 +1,533 @@
+from __future__ import annotations
+
+import csv
+import re
+import time
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow é opcional: sem ele o DuckDB recebe INSERTs de várias linhas
+    pa = None
+
+from dataset import DATASET_DIRNAME, QuarterWindow, list_partitions, read_dataset
+from local_db import ROOT_DIR
+
+CADOP_DIR = ROOT_DIR / "teste_2" / "data" / "cadop"
+CSV_CONSOLIDADO = ROOT_DIR / "teste_1" / "output" / "despesas_eventos_sinistros.csv"
+DATASET_CONSOLIDADO = ROOT_DIR / "teste_1" / "output" / DATASET_DIRNAME
+CSV_AGREGADO = ROOT_DIR / "teste_2" / "output" / "despesas_agregadas.csv"
+
+# Linhas por executemany/transação
+BATCH_SIZE = 50_000
+
+# Nome da tabela Arrow registrada no DuckDB durante a carga de um lote
+INGEST_VIEW = "lote_carga"
+
+DIGITS = re.compile(r"^[0-9]+$")
+YEAR = re.compile(r"^[0-9]{4}$")
+QUARTER = re.compile(r"^[1-4]$")
+NUMBER = re.compile(r"^[0-9]+(\.[0-9]+)?$")
+
+# Conta carregada em despesas_consolidadas (o consolidado pode trazer outras)
+EXPENSE_ACCOUNT = "EVENTOS_SINISTROS"
+
+INSERT_OPERADORAS = (
+    "INSERT INTO operadoras (registro_ans, cnpj, razao_social, modalidade, uf) VALUES ({})"
+)
+INSERT_DESPESAS = (
+    "INSERT INTO despesas_consolidadas (registro_ans, ano, trimestre, valor_despesas) VALUES ({})"
+)
+INSERT_AGREGADAS = (
+    "INSERT INTO despesas_agregadas (razao_social, uf, total_despesas, media_despesas_trimestre, "
+    "desvio_padrao_despesas, qtd_trimestres) VALUES ({})"
+)
+
+
+def latest_cadop_csv() -> Path:
+    """
+    Retorna o CSV de cadastro (CADOP) mais recente baixado pelo Teste 2.
+    """
+    candidates = sorted(CADOP_DIR.glob("*.csv"))
+    if not candidates:
+        raise FileNotFoundError(f"Nenhum CSV do CADOP em {CADOP_DIR}. Rode antes: python teste_2/main.py")
+    return candidates[-1]
+
+
+def detect_encoding(file_path: Path) -> str:
+    """
+    O CADOP já foi publicado em UTF-8 e em LATIN1: tenta UTF-8 primeiro.
+    """
+    try:
+        with file_path.open(mode="r", encoding="utf-8") as f:
+            for _ in f:
+                pass
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+
+def placeholders(count: int, paramstyle: str) -> str:
+    """
+    Monta os marcadores de parâmetro conforme o paramstyle do driver DB-API
+    (sqlite3/duckdb: qmark; mysql-connector/psycopg: format/pyformat).
+    """
+    if paramstyle == "qmark":
+        return ", ".join("?" for _ in range(count))
+    if paramstyle in {"format", "pyformat"}:
+        return ", ".join("%s" for _ in range(count))
+    if paramstyle == "numeric":
+        return ", ".join(f":{index}" for index in range(1, count + 1))
+    raise ValueError(f"paramstyle não suportado: {paramstyle}")
+
+
+def clean(value: Optional[str]) -> str:
+    """
+    Equivalente ao TRIM do SQL (None vira '').
+    """
+    return (value or "").strip()
+
+
+def to_decimal(value: str) -> Decimal:
+    """
+    Equivalente a CAST(REPLACE(TRIM(x), ',', '.') AS DECIMAL(18,2)).
+    Valor inválido vira 0 (mesmo comportamento do MySQL).
+    """
+    try:
+        return Decimal(clean(value).replace(",", ".")).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        return Decimal("0.00")
+
+
+def money(value: Decimal, decimal_as_float: bool) -> Any:
+    """
+    SQLite guarda dinheiro como REAL; os demais drivers aceitam Decimal.
+    """
+    return float(value) if decimal_as_float else value
+
+
+def clean_operadora(row: Dict[str, str]) -> Optional[Tuple[int, str, str, Optional[str], Optional[str]]]:
+    """
+    Regras do INSERT em operadoras (import_mysql.sql).
+    """
+    registro = clean(row.get("REGISTRO_OPERADORA"))
+    if not DIGITS.match(registro):
+        return None
+
+    uf = clean(row.get("UF"))
+
+    return (
+        int(registro),
+        re.sub(r"[^0-9]", "", row.get("CNPJ") or ""),
+        clean(row.get("RAZAO_SOCIAL")) or "DESCONHECIDO",
+        clean(row.get("MODALIDADE")) or None,
+        uf[:2].upper() if len(uf) >= 2 else None,
+    )
+
+
+def clean_despesa(row: Dict[str, str], decimal_as_float: bool) -> Optional[Tuple[int, int, int, Any]]:
+    """
+    Regras do INSERT em despesas_consolidadas (import_mysql.sql),
+    exceto o JOIN com operadoras (feito por quem chama).
+    Linhas de outras contas (coluna "Conta") ficam de fora.
+    """
+    account = clean(row.get("Conta"))
+    if account and account != EXPENSE_ACCOUNT:
+        return None
+
+    reg_ans = clean(row.get("REG_ANS"))
+    ano = clean(row.get("Ano"))
+    trimestre = clean(row.get("Trimestre"))
+    valor = clean(row.get("ValorDespesas")).replace(",", ".")
+
+    if not DIGITS.match(reg_ans) or not YEAR.match(ano) or not QUARTER.match(trimestre):
+        return None
+
+    if not valor or not NUMBER.match(valor):
+        return None
+
+    amount = to_decimal(valor)
+    if amount <= 0:
+        return None
+
+    return int(reg_ans), int(ano), int(trimestre), money(amount, decimal_as_float)
+
+
+def clean_agregada(row: Dict[str, str], decimal_as_float: bool) -> Optional[Tuple[Any, ...]]:
+    """
+    Regras do INSERT em despesas_agregadas (import_mysql.sql).
+    """
+    uf = clean(row.get("UF"))
+    total = clean(row.get("TotalDespesas")).replace(",", ".")
+
+    if not uf or not NUMBER.match(total):
+        return None
+
+    qtd = clean(row.get("QtdTrimestres"))
+
+    return (
+        clean(row.get("RazaoSocial")) or "DESCONHECIDO",
+        uf[:2].upper(),
+        money(to_decimal(total), decimal_as_float),
+        money(to_decimal(row.get("MediaDespesasPorTrimestre", "")), decimal_as_float),
+        money(to_decimal(row.get("DesvioPadraoDespesas", "")), decimal_as_float),
+        int(qtd) if DIGITS.match(qtd) else 0,
+    )
+
+
+def iter_cadop_rows(cadop_csv: Path) -> Iterator[Dict[str, str]]:
+    """
+    Lê o CADOP em streaming, com cabeçalhos normalizados (maiúsculas).
+    """
+    with cadop_csv.open(mode="r", encoding=detect_encoding(cadop_csv), newline="") as f:
+        reader = csv.DictReader(f, delimiter=";")
+        headers = [clean(header).upper() for header in reader.fieldnames or []]
+        for raw_row in reader:
+            yield {header: value for header, value in zip(headers, raw_row.values())}
+
+
+def default_consolidado() -> Path:
+    """
+    Entrada de despesas: o dataset particionado do Teste 1, se existir,
+    senão o CSV consolidado.
+    """
+    return DATASET_CONSOLIDADO if list_partitions(DATASET_CONSOLIDADO) else CSV_CONSOLIDADO
+
+
+def iter_consolidado_rows(path: Path, window: QuarterWindow = None) -> Iterator[Dict[str, str]]:
+    """
+    Linhas de despesas de um CSV ou de um dataset particionado (pasta).
+    No dataset, só as partições da janela são abertas.
+    """
+    if path.is_dir():
+        return read_dataset(path, window)
+    if window is not None:
+        raise ValueError("Filtro de trimestres (--trimestres) requer o dataset particionado do Teste 1.")
+    return iter_csv_rows(path)
+
+
+def iter_csv_rows(csv_path: Path) -> Iterator[Dict[str, str]]:
+    """
+    Lê um CSV do pipeline (UTF-8, ';') em streaming.
+    """
+    with csv_path.open(mode="r", encoding="utf-8", newline="") as f:
+        yield from csv.DictReader(f, delimiter=";")
+
+
+def dedupe_operadoras(
+    rows: Iterable[Tuple[int, str, str, Optional[str], Optional[str]]]
+) -> List[Tuple[int, str, str, Optional[str], Optional[str]]]:
+    """
+    Emula o INSERT ... ON DUPLICATE KEY UPDATE do MySQL:
+    conflito em registro_ans (PK) ou cnpj (UNIQUE) atualiza a linha existente.
+
+    O cadastro é pequeno (alguns milhares de linhas), então fica em memória.
+    """
+    by_registro: Dict[int, List[Any]] = {}
+    registro_by_cnpj: Dict[str, int] = {}
+
+    for registro, cnpj, razao, modalidade, uf in rows:
+        existing = registro if registro in by_registro else registro_by_cnpj.get(cnpj)
+
+        if existing is None:
+            by_registro[registro] = [registro, cnpj, razao, modalidade, uf]
+            registro_by_cnpj[cnpj] = registro
+            continue
+
+        target = by_registro[existing]
+        registro_by_cnpj.pop(target[1], None)
+        target[1:] = [cnpj, razao, modalidade, uf]
+        registro_by_cnpj[cnpj] = existing
+
+    return [tuple(values) for values in by_registro.values()]
+
+
+def multi_row_sql(sql: str, count: int) -> str:
+    """
+    Transforma 'INSERT ... VALUES (?, ?)' em 'INSERT ... VALUES (?, ?), (?, ?), ...'.
+    """
+    head, group = sql.rsplit("VALUES", 1)
+    return f"{head}VALUES " + ", ".join([group.strip()] * count)
+
+
+def ingest_arrow(cursor: Any, sql: str, batch: List[Tuple[Any, ...]]) -> None:
+    """
+    Carga nativa do DuckDB: o lote vira uma tabela Arrow (uma coluna por
+    campo do INSERT), registrada na conexão, e entra com um único
+    'INSERT INTO t (...) SELECT * FROM lote' — sem bind linha a linha.
+    """
+    head = sql.rsplit("VALUES", 1)[0]
+    names = [name.strip() for name in head[head.index("(") + 1:head.rindex(")")].split(",")]
+
+    table = pa.table({name: list(values) for name, values in zip(names, zip(*batch))})
+    cursor.register(INGEST_VIEW, table)
+    try:
+        cursor.execute(f"{head}SELECT * FROM {INGEST_VIEW}")
+    finally:
+        cursor.unregister(INGEST_VIEW)
+
+
+def execute_batch(
+    cursor: Any,
+    sql: str,
+    batch: List[Tuple[Any, ...]],
+    rows_per_statement: int,
+    native_ingest: bool = False,
+) -> None:
+    """
+    Envia um lote: executemany simples ou, com rows_per_statement > 1,
+    INSERTs de várias linhas (bem mais rápido em drivers como o DuckDB,
+    cujo executemany executa linha a linha). Com native_ingest (DuckDB)
+    e pyarrow instalado, o lote entra de uma vez via Arrow.
+    """
+    if native_ingest and pa is not None:
+        ingest_arrow(cursor, sql, batch)
+        return
+
+    if rows_per_statement <= 1:
+        cursor.executemany(sql, batch)
+        return
+
+    full_sql = multi_row_sql(sql, rows_per_statement)
+    for start in range(0, len(batch), rows_per_statement):
+        chunk = batch[start:start + rows_per_statement]
+        statement = full_sql if len(chunk) == rows_per_statement else multi_row_sql(sql, len(chunk))
+        cursor.execute(statement, [value for row in chunk for value in row])
+
+
+def insert_batches(
+    conn: Any,
+    sql: str,
+    rows: Iterable[Tuple[Any, ...]],
+    batch_size: int = BATCH_SIZE,
+    rows_per_statement: int = 1,
+    native_ingest: bool = False,
+) -> int:
+    """
+    Insere em lotes: um executemany + commit por lote.
+    Retorna a quantidade de linhas inseridas.
+    """
+    cursor = conn.cursor()
+    batch: List[Tuple[Any, ...]] = []
+    total = 0
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            execute_batch(cursor, sql, batch, rows_per_statement, native_ingest)
+            conn.commit()
+            total += len(batch)
+            batch = []
+
+    if batch:
+        execute_batch(cursor, sql, batch, rows_per_statement, native_ingest)
+        conn.commit()
+        total += len(batch)
+
+    return total
+
+
+def secondary_indexes(index_statements: List[str]) -> List[Tuple[str, str]]:
+    """
+    Filtra os índices secundários (não UNIQUE) que podem ser removidos
+    durante a carga. Retorna [(nome, CREATE INDEX ...)].
+    """
+    result: List[Tuple[str, str]] = []
+    for statement in index_statements:
+        match = re.match(r"CREATE\s+INDEX\s+(\w+)\s+ON", statement, re.IGNORECASE)
+        if match:
+            result.append((match.group(1), statement))
+    return result
+
+
+def drop_indexes(conn: Any, indexes: List[Tuple[str, str]], drop_template: str) -> None:
+    """
+    Remove os índices antes da carga em lote.
+    drop_template: 'DROP INDEX {name}' (SQLite/DuckDB/PostgreSQL)
+    ou 'DROP INDEX {name} ON {table}' (MySQL).
+    """
+    cursor = conn.cursor()
+    for name, statement in indexes:
+        table = re.search(r"\bON\s+(\w+)", statement, re.IGNORECASE).group(1)
+        cursor.execute(drop_template.format(name=name, table=table))
+    conn.commit()
+
+
+def rebuild_indexes(conn: Any, indexes: List[Tuple[str, str]]) -> None:
+    """
+    Recria os índices depois da carga (um único build por índice).
+    """
+    cursor = conn.cursor()
+    for _, statement in indexes:
+        cursor.execute(statement)
+    conn.commit()
+
+
+def loaded_registros(conn: Any) -> Set[int]:
+    """
+    Registros ANS já presentes em operadoras (usado no "JOIN" da carga de despesas).
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT registro_ans FROM operadoras")
+    return {int(row[0]) for row in cursor.fetchall()}
+
+
+def load_despesas(
+    conn: Any,
+    consolidado_csv: Path,
+    paramstyle: str = "qmark",
+    decimal_as_float: bool = True,
+    batch_size: int = BATCH_SIZE,
+    replace_quarters: bool = False,
+    rows_per_statement: int = 1,
+    window: QuarterWindow = None,
+    native_ingest: bool = False,
+) -> Tuple[int, Set[Tuple[int, int]]]:
+    """
+    Carrega despesas_consolidadas em lotes, mantendo só REG_ANS cadastrados.
+
+    `consolidado_csv` pode ser o CSV ou a pasta do dataset particionado
+    (com `window`, só os trimestres da janela são lidos).
+
+    Com replace_quarters=True, cada trimestre encontrado no CSV tem suas
+    linhas antigas apagadas antes da inserção (carga incremental de um
+    trimestre novo ou republicado).
+
+    Retorna (linhas inseridas, trimestres carregados).
+    """
+    registros = loaded_registros(conn)
+    quarters: Set[Tuple[int, int]] = set()
+    marker = placeholders(2, paramstyle).split(", ")
+    delete_sql = (
+        f"DELETE FROM despesas_consolidadas WHERE ano = {marker[0]} AND trimestre = {marker[1]}"
+    )
+    cursor = conn.cursor()
+
+    def rows() -> Iterator[Tuple[int, int, int, Any]]:
+        for row in iter_consolidado_rows(consolidado_csv, window):
+            cleaned = clean_despesa(row, decimal_as_float)
+            if cleaned is None or cleaned[0] not in registros:
+                continue
+
+            quarter = (cleaned[1], cleaned[2])
+            if quarter not in quarters:
+                quarters.add(quarter)
+                if replace_quarters:
+                    # Roda antes de qualquer linha deste trimestre ser inserida
+                    cursor.execute(delete_sql, quarter)
+
+            yield cleaned
+
+    total = insert_batches(
+        conn,
+        INSERT_DESPESAS.format(placeholders(4, paramstyle)),
+        rows(),
+        batch_size,
+        rows_per_statement,
+        native_ingest,
+    )
+    return total, quarters
+
+
+def report(table: str, rows: int, elapsed: float) -> None:
+    """
+    Exibe linhas carregadas e throughput (linhas/s).
+    """
+    rate = rows / elapsed if elapsed > 0 else 0.0
+    print(f"   ✔ {table}: {rows} linhas em {elapsed:.3f}s ({rate:,.0f} linhas/s)")
+
+
+def load_all(
+    conn: Any,
+    cadop_csv: Optional[Path],
+    consolidado_csv: Optional[Path],
+    agregado_csv: Optional[Path],
+    index_statements: Optional[List[str]] = None,
+    paramstyle: str = "qmark",
+    decimal_as_float: bool = True,
+    drop_template: str = "DROP INDEX {name}",
+    batch_size: int = BATCH_SIZE,
+    rows_per_statement: int = 1,
+    window: QuarterWindow = None,
+    native_ingest: bool = False,
+) -> Dict[str, Tuple[int, float]]:
+    """
+    Carrega os CSVs do pipeline direto nas tabelas finais, substituindo o
+    import_mysql.sql (staging + TRIM/REGEXP/CAST em SQL):
+    - a limpeza é feita em Python, linha a linha, em streaming;
+    - as linhas vão em lotes grandes (executemany + commit por lote);
+    - os índices secundários são removidos durante a carga e recriados no fim.
+
+    Funciona com qualquer conexão DB-API (ajuste paramstyle, decimal_as_float
+    e drop_template conforme o driver; rows_per_statement > 1 usa INSERTs de
+    várias linhas para drivers com executemany lento e native_ingest carrega
+    cada lote via Arrow no DuckDB). Arquivos None são ignorados.
+    As despesas podem vir do dataset particionado (pasta), filtradas por `window`.
+
+    Retorna {tabela: (linhas, segundos)}.
+    """
+    stats: Dict[str, Tuple[int, float]] = {}
+    indexes = secondary_indexes(index_statements or [])
+
+    if indexes:
+        drop_indexes(conn, indexes, drop_template)
+
+    if cadop_csv is not None:
+        started = time.perf_counter()
+        operadoras = dedupe_operadoras(
+            cleaned
+            for cleaned in (clean_operadora(row) for row in iter_cadop_rows(cadop_csv))
+            if cleaned is not None
+        )
+        total = insert_batches(
+            conn,
+            INSERT_OPERADORAS.format(placeholders(5, paramstyle)),
+            operadoras,
+            batch_size,
+            rows_per_statement,
+            native_ingest,
+        )
+        stats["operadoras"] = (total, time.perf_counter() - started)
+        report("operadoras", *stats["operadoras"])
+
+    if consolidado_csv is not None:
+        started = time.perf_counter()
+        total, _ = load_despesas(
+            conn,
+            consolidado_csv,
+            paramstyle,
+            decimal_as_float,
+            batch_size,
+            rows_per_statement=rows_per_statement,
+            window=window,
+            native_ingest=native_ingest,
+        )
+        stats["despesas_consolidadas"] = (total, time.perf_counter() - started)
+        report("despesas_consolidadas", *stats["despesas_consolidadas"])
+
+    if agregado_csv is not None:
+        started = time.perf_counter()
+        agregadas = (
+            cleaned
+            for cleaned in (clean_agregada(row, decimal_as_float) for row in iter_csv_rows(agregado_csv))
+            if cleaned is not None
+        )
+        total = insert_batches(
+            conn,
+            INSERT_AGREGADAS.format(placeholders(6, paramstyle)),
+            agregadas,
+            batch_size,
+            rows_per_statement,
+            native_ingest,
+        )
+        stats["despesas_agregadas"] = (total, time.perf_counter() - started)
+        report("despesas_agregadas", *stats["despesas_agregadas"])
+
+    if indexes:
+        started = time.perf_counter()
+        rebuild_indexes(conn, indexes)
+        print(f"   ✔ Índices recriados: {len(indexes)} em {time.perf_counter() - started:.3f}s")
+
+    return stats
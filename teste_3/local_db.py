@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import re
+import sqlite3
+from pathlib import Path
+from typing import Any, List, Tuple
+
+try:
+    import duckdb
+except ImportError:  # DuckDB é opcional: sem ele usamos SQLite (stdlib)
+    duckdb = None
+
+
+def project_root() -> Path:
+    """
+    Retorna a raiz do projeto assumindo a estrutura:
+    <raiz>/teste_1, <raiz>/teste_2 e <raiz>/teste_3
+    """
+    return Path(__file__).resolve().parents[1]
+
+
+ROOT_DIR = project_root()
+
+SQL_DIR = ROOT_DIR / "teste_3" / "sql"
+DDL_FILE = SQL_DIR / "ddl_mysql.sql"
+QUERIES_FILE = SQL_DIR / "queries_mysql.sql"
+
+OUTPUT_DIR = ROOT_DIR / "teste_3" / "output"
+DEFAULT_DB_PATH = OUTPUT_DIR / "analytics.db"
+
+# Nomes das queries de queries_mysql.sql, na ordem em que aparecem no arquivo
+QUERY_NAMES = [
+    "crescimento_percentual",
+    "distribuicao_uf",
+    "operadoras_acima_media",
+]
+
+# Índices extras para as queries analíticas (além dos KEYs do DDL).
+# O índice de cobertura evita ler a tabela de fatos nas queries 1 e 3.
+EXTRA_INDEXES = [
+    "CREATE INDEX idx_despesas_cobertura "
+    "ON despesas_consolidadas (registro_ans, ano, trimestre, valor_despesas)",
+]
+
+
+# Carga em lote: o executemany do DuckDB roda linha a linha (e INSERTs
+# parametrizados de várias linhas ainda ficam em ~2k linhas/s). Lá cada lote
+# vira uma tabela Arrow registrada e entra com um único INSERT ... SELECT;
+# sem pyarrow, o loader volta para INSERTs de várias linhas.
+NATIVE_INGEST = {
+    "sqlite": False,
+    "duckdb": True,
+}
+
+ROWS_PER_STATEMENT = {
+    "sqlite": 1,
+    "duckdb": 500,
+}
+
+
+def available_backend(requested: str = "auto") -> str:
+    """
+    Resolve o backend: 'auto' usa DuckDB quando instalado, senão SQLite.
+    """
+    if requested == "auto":
+        return "duckdb" if duckdb is not None else "sqlite"
+
+    if requested == "duckdb" and duckdb is None:
+        raise RuntimeError("DuckDB não está instalado. Use --backend sqlite ou pip install duckdb.")
+
+    if requested not in {"sqlite", "duckdb"}:
+        raise ValueError(f"Backend desconhecido: {requested}")
+
+    return requested
+
+
+def connect(backend: str, db_path: Path, fresh: bool = True) -> Any:
+    """
+    Abre uma conexão DB-API no backend escolhido.
+    Com fresh=True o arquivo do banco é recriado do zero.
+    """
+    if str(db_path) != ":memory:":
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        if fresh:
+            for suffix in ("", ".wal", "-wal", "-shm", "-journal"):
+                path = Path(f"{db_path}{suffix}")
+                if path.exists():
+                    path.unlink()
+
+    if backend == "duckdb":
+        return duckdb.connect(str(db_path))
+
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+def strip_sql_comments(sql: str) -> str:
+    """
+    Remove comentários de linha (-- ...).
+    """
+    return "\n".join(line.split("--", 1)[0] for line in sql.splitlines())
+
+
+def split_top_level(body: str) -> List[str]:
+    """
+    Separa os itens de um CREATE TABLE por vírgulas fora de parênteses
+    (DECIMAL(18,2) e KEY idx (a, b) não podem ser quebrados).
+    """
+    items: List[str] = []
+    depth = 0
+    current: List[str] = []
+
+    for char in body:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+
+        if char == "," and depth == 0:
+            items.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+
+    if "".join(current).strip():
+        items.append("".join(current).strip())
+
+    return [item for item in items if item]
+
+
+def index_columns(columns: str) -> str:
+    """
+    Remove prefixos de índice do MySQL: razao_social(150) -> razao_social.
+    """
+    return re.sub(r"(\w+)\s*\(\d+\)", r"\1", columns)
+
+
+def translate_column(table: str, item: str, backend: str) -> Tuple[str, List[str]]:
+    """
+    Converte uma definição de coluna MySQL para o backend.
+    Retorna (definição, comandos que precisam rodar antes do CREATE TABLE).
+    """
+    before: List[str] = []
+
+    if re.search(r"AUTO_INCREMENT", item, re.IGNORECASE):
+        name = item.split()[0]
+        if backend == "sqlite":
+            return f"{name} INTEGER PRIMARY KEY AUTOINCREMENT", before
+
+        sequence = f"seq_{table}_{name}"
+        before.append(f"CREATE SEQUENCE {sequence}")
+        return f"{name} BIGINT DEFAULT nextval('{sequence}') PRIMARY KEY", before
+
+    if backend == "sqlite":
+        # DECIMAL no SQLite vira NUMERIC e valores inteiros seriam guardados
+        # como INTEGER (divisão inteira nas queries). REAL mantém o resultado.
+        item = re.sub(r"DECIMAL\s*\(\s*\d+\s*,\s*\d+\s*\)", "REAL", item, flags=re.IGNORECASE)
+
+    return item, before
+
+
+def translate_ddl(ddl_text: str, backend: str) -> List[str]:
+    """
+    Traduz o ddl_mysql.sql para comandos do backend local.
+
+    - ignora as tabelas de staging (stg_*), que não são usadas aqui;
+    - KEY / UNIQUE KEY viram CREATE [UNIQUE] INDEX separados;
+    - AUTO_INCREMENT, DECIMAL e ENGINE=InnoDB são adaptados.
+    """
+    statements: List[str] = []
+    indexes: List[str] = []
+
+    pattern = re.compile(r"CREATE TABLE\s+(\w+)\s*\((.*?)\)\s*ENGINE\s*=\s*\w+\s*;", re.IGNORECASE | re.DOTALL)
+
+    for match in pattern.finditer(strip_sql_comments(ddl_text)):
+        table, body = match.group(1), match.group(2)
+        if table.lower().startswith("stg_"):
+            continue
+
+        definitions: List[str] = []
+
+        for item in split_top_level(body):
+            key_match = re.match(r"(UNIQUE\s+)?KEY\s+(\w+)\s*\((.*)\)$", item, re.IGNORECASE | re.DOTALL)
+            if key_match:
+                unique = "UNIQUE " if key_match.group(1) else ""
+                name, columns = key_match.group(2), index_columns(key_match.group(3))
+                indexes.append(f"CREATE {unique}INDEX {name} ON {table} ({columns})")
+                continue
+
+            definition, before = translate_column(table, item, backend)
+            statements.extend(before)
+            definitions.append(definition)
+
+        columns_sql = ",\n    ".join(definitions)
+        statements.append(f"CREATE TABLE {table} (\n    {columns_sql}\n)")
+
+    return statements + indexes
+
+
+def create_schema(conn: Any, backend: str) -> List[str]:
+    """
+    Cria as tabelas finais (operadoras, despesas_consolidadas,
+    despesas_agregadas) e os índices a partir do ddl_mysql.sql.
+    Retorna os comandos de índice (úteis para recriar após carga em lote).
+    """
+    statements = translate_ddl(DDL_FILE.read_text(encoding="utf-8"), backend)
+
+    cursor = conn.cursor()
+    for statement in statements:
+        cursor.execute(statement)
+    for statement in EXTRA_INDEXES:
+        cursor.execute(statement)
+    conn.commit()
+
+    return [statement for statement in statements if " INDEX " in statement] + EXTRA_INDEXES
+
+
+def load_queries() -> List[Tuple[str, str]]:
+    """
+    Lê as queries analíticas de queries_mysql.sql.
+    Retorna [(nome, sql)], na ordem do arquivo.
+    """
+    text = strip_sql_comments(QUERIES_FILE.read_text(encoding="utf-8"))
+    queries = [query.strip() for query in text.split(";") if query.strip()]
+
+    names = QUERY_NAMES + [f"query_{index}" for index in range(len(QUERY_NAMES) + 1, len(queries) + 1)]
+    return list(zip(names, queries))
+
+
+def fetch_all(conn: Any, sql: str, params: Tuple[Any, ...] = ()) -> Tuple[List[str], List[Tuple[Any, ...]]]:
+    """
+    Executa uma consulta e retorna (colunas, linhas).
+    """
+    cursor = conn.cursor()
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+    columns = [description[0] for description in cursor.description or []]
+    return columns, [tuple(row) for row in rows]
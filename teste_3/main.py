@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Any, List, Tuple
+
+from local_db import (
+    DEFAULT_DB_PATH,
+    NATIVE_INGEST,
+    ROWS_PER_STATEMENT,
+    available_backend,
+    connect,
+    create_schema,
+    fetch_all,
+    load_queries,
+)
+from dataset import parse_quarter_window
+from loader import CSV_AGREGADO, default_consolidado, latest_cadop_csv, load_all, load_despesas, report
+from summaries import SUMMARY_QUERIES, create_summary_tables, refresh_summaries, verify_against_original
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Opções de linha de comando do Teste 3 (execução local, sem MySQL).
+    """
+    parser = argparse.ArgumentParser(description="Teste 3 — queries analíticas em banco local")
+    parser.add_argument(
+        "--backend",
+        choices=["auto", "sqlite", "duckdb"],
+        default="auto",
+        help="Banco local: 'auto' usa DuckDB se instalado, senão SQLite.",
+    )
+    parser.add_argument("--db", type=Path, default=DEFAULT_DB_PATH, help="Arquivo do banco (ou :memory:).")
+    parser.add_argument("--cadop", type=Path, default=None, help="CSV do CADOP (padrão: o mais recente do Teste 2).")
+    parser.add_argument(
+        "--consolidado",
+        type=Path,
+        default=None,
+        help="Despesas do Teste 1: CSV ou pasta do dataset particionado (padrão: o dataset, se existir).",
+    )
+    parser.add_argument(
+        "--trimestres",
+        type=parse_quarter_window,
+        default=None,
+        help="Só os trimestres da janela no dataset particionado (ex: 2025T3, 2024T1:2025T2).",
+    )
+    parser.add_argument("--agregado", type=Path, default=CSV_AGREGADO, help="CSV agregado do Teste 2.")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help=(
+            "Usa o banco existente: carrega só os trimestres do consolidado (ou de --trimestres) "
+            "(substituindo os republicados) e atualiza apenas esses resumos."
+        ),
+    )
+    parser.add_argument(
+        "--verificar",
+        action="store_true",
+        help="No modo incremental, também confere os resumos contra as queries originais.",
+    )
+    return parser.parse_args()
+
+
+def format_value(value: Any) -> str:
+    """
+    Texto de uma célula. No SQLite o dinheiro é REAL (ver local_db.py) e
+    somas saem com ruído de ponto flutuante (4014414.389999999): floats
+    são mostrados com 2 casas, como o DECIMAL(18,2) do MySQL/DuckDB.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
+
+
+def print_table(columns: List[str], rows: List[Tuple[Any, ...]]) -> None:
+    """
+    Imprime o resultado de uma query em formato de tabela simples.
+    """
+    print("   " + " | ".join(columns))
+    for row in rows:
+        print("   " + " | ".join(format_value(value) for value in row))
+
+
+def run_queries(conn: Any, queries: List[Tuple[str, str]], label: str) -> List[Tuple[str, float]]:
+    """
+    Executa as queries, imprime os resultados e retorna o tempo de cada uma.
+    """
+    timings: List[Tuple[str, float]] = []
+
+    for name, sql in queries:
+        print(f"📊 Query ({label}): {name}")
+        started = time.perf_counter()
+        columns, rows = fetch_all(conn, sql)
+        elapsed = time.perf_counter() - started
+        timings.append((f"{name} [{label}]", elapsed))
+
+        print_table(columns, rows)
+        print(f"   ⏱ {elapsed * 1000:.1f} ms\n")
+
+    return timings
+
+
+def full_load(conn: Any, backend: str, args: argparse.Namespace) -> None:
+    """
+    Cria o schema do zero, carrega todos os CSVs e monta os resumos.
+    """
+    cadop_csv = args.cadop or latest_cadop_csv()
+
+    print("🗄️  Criando tabelas e índices (ddl_mysql.sql + resumos)...")
+    index_statements = create_schema(conn, backend)
+    create_summary_tables(conn, backend)
+
+    print("📥 Carregando CSVs do pipeline (carga em lote)...")
+    started = time.perf_counter()
+    stats = load_all(
+        conn,
+        cadop_csv,
+        args.consolidado,
+        args.agregado,
+        index_statements=index_statements,
+        decimal_as_float=(backend == "sqlite"),
+        rows_per_statement=ROWS_PER_STATEMENT[backend],
+        window=args.trimestres,
+        native_ingest=NATIVE_INGEST[backend],
+    )
+    elapsed = time.perf_counter() - started
+    total_rows = sum(rows for rows, _ in stats.values())
+    rate = total_rows / elapsed if elapsed > 0 else 0.0
+    print(f"   ⏱ Carga total: {total_rows} linhas em {elapsed:.3f}s ({rate:,.0f} linhas/s)\n")
+
+    started = time.perf_counter()
+    quarters = refresh_summaries(conn)
+    print(f"🧮 Resumos montados para {len(quarters)} trimestre(s) em {time.perf_counter() - started:.3f}s\n")
+
+
+def incremental_load(conn: Any, backend: str, args: argparse.Namespace) -> None:
+    """
+    Carrega no banco existente apenas os trimestres do CSV consolidado
+    (substituindo trimestres republicados) e atualiza só esses resumos.
+    """
+    create_summary_tables(conn, backend)
+
+    print("📥 Carregando trimestres novos/republicados...")
+    started = time.perf_counter()
+    total, quarters = load_despesas(
+        conn,
+        args.consolidado,
+        decimal_as_float=(backend == "sqlite"),
+        replace_quarters=True,
+        rows_per_statement=ROWS_PER_STATEMENT[backend],
+        window=args.trimestres,
+        native_ingest=NATIVE_INGEST[backend],
+    )
+    report("despesas_consolidadas", total, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    refreshed = refresh_summaries(conn, quarters)
+    labels = ", ".join(f"{ano}/{trimestre}T" for ano, trimestre in refreshed) or "nenhum"
+    print(f"🧮 Resumos atualizados ({labels}) em {time.perf_counter() - started:.3f}s\n")
+
+
+def main() -> None:
+    """
+    Executa o Teste 3 localmente:
+    1) cria o schema do ddl_mysql.sql no SQLite (ou DuckDB)
+    2) carrega os CSVs do pipeline aplicando as regras do import_mysql.sql
+    3) mantém os resumos por (operadora, trimestre) e (UF, trimestre)
+    4) roda as queries, medindo o tempo de cada uma, e confere os
+       relatórios dos resumos contra as queries originais
+       (termina com código 1 se algum divergir)
+    """
+    args = parse_args()
+    args.consolidado = args.consolidado or default_consolidado()
+    backend = available_backend(args.backend)
+
+    print("=" * 60)
+    print(f"🚀 Iniciando TESTE 3 — Queries analíticas ({backend})")
+    print("=" * 60)
+
+    incremental = args.incremental and Path(args.db).exists()
+    conn = connect(backend, args.db, fresh=not incremental)
+
+    if incremental:
+        incremental_load(conn, backend, args)
+    else:
+        full_load(conn, backend, args)
+
+    if backend == "sqlite":
+        conn.execute("ANALYZE")
+
+    timings: List[Tuple[str, float]] = []
+    if not incremental:
+        timings += run_queries(conn, load_queries(), "original")
+    timings += run_queries(conn, SUMMARY_QUERIES, "resumos")
+
+    verified = True
+    if not incremental or args.verificar:
+        print("🔎 Conferindo relatórios dos resumos contra as queries originais...")
+        verified = verify_against_original(conn)
+        print()
+
+    print("⏱ Tempo por query:")
+    for name, elapsed in timings:
+        print(f"   {name}: {elapsed * 1000:.1f} ms")
+
+    conn.close()
+
+    if not verified:
+        sys.exit("❌ Resumos divergentes das queries originais.")
+
+
+if __name__ == "__main__":
+    main()
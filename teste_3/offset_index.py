@@ -0,0 +1,340 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import csv
+import heapq
+import io
+import mmap
+import os
+import pickle
+import struct
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# CSV ordenado por (REG_ANS, Ano, Trimestre) com um índice ao lado
+# (<arquivo>.csv.idx) que diz onde começam as linhas de cada operadora:
+# a consulta de uma operadora faz busca binária no índice e lê só o
+# trecho dela no CSV, via mmap, sem varrer o arquivo.
+#
+# Este arquivo é copiado sem alterações em teste_1, teste_2 e teste_3
+# (mesma estratégia do dataset.py).
+
+KEY_COLUMN = "REG_ANS"
+DELIMITER = ";"
+INDEX_SUFFIX = ".idx"
+
+# Cabeçalho do índice: assinatura, versão, largura da chave, entradas,
+# tamanho e mtime do CSV indexado (um CSV regravado invalida o índice)
+INDEX_MAGIC = b"OIDX"
+INDEX_VERSION = 1
+HEADER_FORMAT = "<4sBHIQq"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# Linhas ordenadas em memória por bloco; acima disso os blocos vão para
+# arquivos temporários e são intercalados no final (ordenação externa)
+SORT_CHUNK_ROWS = 200_000
+
+
+class OffsetIndexUnavailable(Exception):
+    """
+    Índice inexistente, inválido ou desatualizado em relação ao CSV.
+    """
+
+
+def index_path_for(csv_path: Path) -> Path:
+    """
+    Caminho do índice de um CSV: <arquivo>.csv.idx
+    """
+    return csv_path.with_name(csv_path.name + INDEX_SUFFIX)
+
+
+def remove_index(csv_path: Path) -> None:
+    """
+    Apaga o índice de um CSV que foi regravado sem ordenação.
+    """
+    index_path = index_path_for(csv_path)
+    if index_path.exists():
+        index_path.unlink()
+
+
+def _as_int(value: object) -> int:
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        return 0
+
+
+def sort_key(row: Dict[str, object]) -> Tuple[str, int, int]:
+    """
+    Ordem do CSV indexado: REG_ANS, Ano, Trimestre.
+    """
+    return (str(row.get(KEY_COLUMN, "") or "").strip(), _as_int(row.get("Ano", 0)), _as_int(row.get("Trimestre", 0)))
+
+
+def _write_run(path: Path, rows: List[Dict[str, object]]) -> Path:
+    with path.open("wb") as file:
+        for row in rows:
+            pickle.dump(row, file, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def _read_run(path: Path) -> Iterator[Dict[str, object]]:
+    with path.open("rb") as file:
+        while True:
+            try:
+                yield pickle.load(file)
+            except EOFError:
+                return
+
+
+def sorted_rows(
+    rows: Iterable[Dict[str, object]],
+    chunk_rows: int = SORT_CHUNK_ROWS,
+    work_dir: Optional[Path] = None
+) -> Iterator[Dict[str, object]]:
+    """
+    Ordena as linhas por sort_key com memória limitada: blocos de
+    `chunk_rows` linhas são ordenados e gravados em arquivos temporários
+    (em work_dir) e intercalados com heapq.merge.
+
+    A ordenação é estável (empates mantêm a ordem de chegada).
+    """
+    with tempfile.TemporaryDirectory(prefix="ordenacao_", dir=work_dir) as temp_dir:
+        runs: List[Path] = []
+        buffer: List[Dict[str, object]] = []
+
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) >= chunk_rows:
+                buffer.sort(key=sort_key)
+                runs.append(_write_run(Path(temp_dir) / f"run_{len(runs):05d}.pkl", buffer))
+                buffer = []
+
+        buffer.sort(key=sort_key)
+        if not runs:
+            yield from buffer
+            return
+
+        yield from heapq.merge(*(_read_run(run) for run in runs), buffer, key=sort_key)
+
+
+def _key_reader(header: List[str]):
+    """
+    Função que extrai a chave de uma linha (bytes) do CSV.
+    Com REG_ANS na primeira coluna, basta um split do início da linha.
+    """
+    if KEY_COLUMN not in header:
+        raise ValueError(f"Coluna {KEY_COLUMN} não encontrada no CSV.")
+
+    position = header.index(KEY_COLUMN)
+    if position == 0:
+        return lambda line: line.split(DELIMITER.encode(), 1)[0].strip().strip(b'"').decode("utf-8")
+
+    def parse(line: bytes) -> str:
+        values = next(csv.reader([line.decode("utf-8")], delimiter=DELIMITER), [])
+        return values[position].strip() if position < len(values) else ""
+
+    return parse
+
+
+def write_index(csv_path: Path) -> Path:
+    """
+    Lê o CSV ordenado uma vez e grava o índice: para cada REG_ANS,
+    (offset em bytes, tamanho em bytes, quantidade de linhas).
+
+    As entradas têm largura fixa e ficam ordenadas pela chave, então a
+    busca é binária direto no arquivo mapeado. Levanta ValueError se as
+    linhas de uma operadora não estiverem contíguas (CSV não ordenado).
+    Campos com quebra de linha não são suportados (não ocorrem nestes CSVs).
+    """
+    entries: List[Tuple[bytes, int, int, int]] = []
+    seen = set()
+
+    with csv_path.open("rb") as file:
+        header_line = file.readline()
+        header = next(csv.reader([header_line.decode("utf-8")], delimiter=DELIMITER), [])
+        key_of = _key_reader(header)
+
+        offset = len(header_line)
+        current: Optional[str] = None
+        start = offset
+        count = 0
+
+        for line in file:
+            key = key_of(line)
+            if key != current:
+                if current is not None:
+                    entries.append((current.encode("utf-8"), start, offset - start, count))
+                if key in seen:
+                    raise ValueError(f"{csv_path} não está ordenado por {KEY_COLUMN} ({key} aparece separado).")
+                seen.add(key)
+                current, start, count = key, offset, 0
+
+            count += 1
+            offset += len(line)
+
+        if current is not None:
+            entries.append((current.encode("utf-8"), start, offset - start, count))
+
+    width = max((len(key) for key, _, _, _ in entries), default=1)
+    entry_format = f"<{width}sQQI"
+    entries.sort(key=lambda entry: entry[0].ljust(width, b"\0"))
+
+    stat = csv_path.stat()
+    index_path = index_path_for(csv_path)
+    temp_path = index_path.with_name(f".{index_path.name}.{os.getpid()}.tmp")
+
+    with temp_path.open("wb") as file:
+        file.write(struct.pack(HEADER_FORMAT, INDEX_MAGIC, INDEX_VERSION, width, len(entries), stat.st_size, stat.st_mtime_ns))
+        for key, start, length, count in entries:
+            file.write(struct.pack(entry_format, key, start, length, count))
+    os.replace(temp_path, index_path)
+
+    return index_path
+
+
+class OffsetIndex:
+    """
+    Consulta as linhas de uma operadora num CSV indexado.
+
+    Índice e CSV ficam mapeados em memória (mmap): a busca é binária nas
+    entradas do índice (O(log n)) e a leitura pega só o trecho da
+    operadora. Pode ser usado por várias threads (só leitura).
+    """
+
+    def __init__(self, csv_path: Path) -> None:
+        self.csv_path = Path(csv_path)
+        self.index_path = index_path_for(self.csv_path)
+
+        if not self.csv_path.exists() or not self.index_path.exists():
+            raise OffsetIndexUnavailable(f"CSV indexado não encontrado: {self.index_path}")
+
+        with self.index_path.open("rb") as file:
+            self.index_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.width, self.entries, self.csv_size, self.csv_mtime_ns = struct.unpack_from(
+            HEADER_FORMAT, self.index_map, 0
+        )
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            self.close()
+            raise OffsetIndexUnavailable(f"Índice inválido: {self.index_path}")
+        if self.is_stale():
+            self.close()
+            raise OffsetIndexUnavailable(f"Índice desatualizado (o CSV foi regravado): {self.index_path}")
+
+        self.entry = struct.Struct(f"<{self.width}sQQI")
+
+        with self.csv_path.open("rb") as file:
+            self.header_line = file.readline()
+            self.csv_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if self.csv_size else None
+        self.fieldnames = next(csv.reader([self.header_line.decode("utf-8")], delimiter=DELIMITER), [])
+
+    def __enter__(self) -> "OffsetIndex":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.entries
+
+    def close(self) -> None:
+        for name in ("index_map", "csv_map"):
+            mapped = getattr(self, name, None)
+            if mapped is not None:
+                mapped.close()
+                setattr(self, name, None)
+
+    def is_stale(self) -> bool:
+        """
+        True se o CSV mudou (tamanho ou mtime) depois de indexado.
+        """
+        try:
+            stat = self.csv_path.stat()
+        except FileNotFoundError:
+            return True
+        return (stat.st_size, stat.st_mtime_ns) != (self.csv_size, self.csv_mtime_ns)
+
+    def _entry(self, position: int) -> Tuple[bytes, int, int, int]:
+        return self.entry.unpack_from(self.index_map, HEADER_SIZE + position * self.entry.size)
+
+    def keys(self) -> Iterator[str]:
+        """
+        REG_ANS indexados, em ordem.
+        """
+        for position in range(self.entries):
+            yield self._entry(position)[0].rstrip(b"\0").decode("utf-8")
+
+    def find(self, key: str) -> Optional[Tuple[int, int, int]]:
+        """
+        (offset, tamanho em bytes, linhas) de um REG_ANS, ou None.
+        """
+        target = key.strip().encode("utf-8")
+        if not target or len(target) > self.width:
+            return None
+        target = target.ljust(self.width, b"\0")
+
+        low, high = 0, self.entries
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle)[0] < target:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < self.entries:
+            found, start, length, count = self._entry(low)
+            if found == target:
+                return start, length, count
+        return None
+
+    def rows(self, key: str) -> List[Dict[str, str]]:
+        """
+        Linhas de um REG_ANS (na ordem do CSV: Ano, Trimestre).
+        Lista vazia se a operadora não estiver no arquivo.
+        """
+        location = self.find(key)
+        if location is None or self.csv_map is None:
+            return []
+
+        start, length, _ = location
+        text = self.csv_map[start:start + length].decode("utf-8")
+        reader = csv.reader(io.StringIO(text, newline=""), delimiter=DELIMITER)
+        return [dict(zip(self.fieldnames, values)) for values in reader]
+
+
+def read_operator_rows(csv_path: Path, key: str) -> List[Dict[str, str]]:
+    """
+    Atalho: abre o índice, lê as linhas de um REG_ANS e fecha.
+    """
+    with OffsetIndex(csv_path) as index:
+        return index.rows(key)
+
+
+if __name__ == "__main__":
+    # Uso: python offset_index.py <arquivo.csv> [REG_ANS ...]
+    # Sem REG_ANS, (re)gera o índice de um CSV já ordenado; com REG_ANS,
+    # mostra as linhas de cada operadora (conferência pontual).
+    if len(sys.argv) < 2:
+        sys.exit("Uso: python offset_index.py <arquivo.csv> [REG_ANS ...]")
+
+    source_path = Path(sys.argv[1])
+
+    if len(sys.argv) == 2:
+        started = time.perf_counter()
+        path = write_index(source_path)
+        with OffsetIndex(source_path) as built:
+            print(f"✅ Índice gravado: {path} ({len(built)} operadoras, {time.perf_counter() - started:.2f}s)")
+        sys.exit(0)
+
+    try:
+        with OffsetIndex(source_path) as opened:
+            for reg_ans in sys.argv[2:]:
+                started = time.perf_counter()
+                found = opened.rows(reg_ans)
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                print(f"🔎 REG_ANS {reg_ans}: {len(found)} linha(s) em {elapsed_ms:.2f} ms")
+                for item in found:
+                    print("   " + DELIMITER.join(item.get(column, "") for column in opened.fieldnames))
+    except OffsetIndexUnavailable as exc:
+        sys.exit(f"❌ {exc}")
@@ -0,0 +1,676 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+from local_db import DEFAULT_DB_PATH, ROOT_DIR, available_backend, duckdb
+from offset_index import OffsetIndex, OffsetIndexUnavailable
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+
+# LRU de resultados (por rota + parâmetros)
+CACHE_MAX_ENTRIES = 1024
+
+# Últimas latências guardadas por rota (para p50/p95)
+LATENCY_WINDOW = 1000
+
+# CSV ordenado por operadora e indexado (teste_2/main.py --ordenar-por-operadora),
+# usado por /operadoras/<id>/linhas
+DEFAULT_ROWS_CSV = ROOT_DIR / "teste_2" / "output" / "despesas_enriquecidas.csv"
+
+TOP_N_DEFAULT = 10
+TOP_N_MAX = 1000
+
+# As consultas usam as tabelas de resumo (teste_3/summaries.py) e os
+# índices criados pelo teste_3/main.py — nenhuma varre a tabela de fatos.
+SQL_OPERADORA_POR_REGISTRO = """
+SELECT registro_ans, cnpj, razao_social, modalidade, uf
+FROM operadoras
+WHERE registro_ans = ?
+"""
+
+SQL_OPERADORA_POR_CNPJ = """
+SELECT registro_ans, cnpj, razao_social, modalidade, uf
+FROM operadoras
+WHERE cnpj = ?
+"""
+
+SQL_DESPESAS_OPERADORA = """
+SELECT ano, trimestre, total_despesas, qtd_lancamentos
+FROM resumo_operadora_trimestre
+WHERE registro_ans = ?
+ORDER BY ano, trimestre
+"""
+
+SQL_DESPESAS_UF = """
+SELECT ano, trimestre, total_despesas, qtd_operadoras
+FROM resumo_uf_trimestre
+WHERE uf = ?
+ORDER BY ano, trimestre
+"""
+
+SQL_TRIMESTRES = """
+SELECT r.ano, r.trimestre, SUM(r.total_despesas), COUNT(DISTINCT r.registro_ans)
+FROM resumo_operadora_trimestre r
+JOIN operadoras o ON o.registro_ans = r.registro_ans
+GROUP BY r.ano, r.trimestre
+ORDER BY r.ano, r.trimestre
+"""
+
+SQL_TRIMESTRE_POR_UF = """
+SELECT uf, total_despesas, qtd_operadoras
+FROM resumo_uf_trimestre
+WHERE ano = ? AND trimestre = ?
+ORDER BY total_despesas DESC, uf
+"""
+
+SQL_TOP_OPERADORAS = """
+SELECT r.registro_ans, o.razao_social, o.uf, SUM(r.total_despesas) AS total
+FROM resumo_operadora_trimestre r
+JOIN operadoras o ON o.registro_ans = r.registro_ans
+{where}
+GROUP BY r.registro_ans, o.razao_social, o.uf
+ORDER BY total DESC, r.registro_ans
+LIMIT ?
+"""
+
+# qtd_operadoras conta operadoras distintas: somar resumo_uf_trimestre.qtd_operadoras
+# entre trimestres contaria a mesma operadora uma vez por trimestre
+SQL_TOP_UFS = """
+SELECT o.uf, SUM(r.total_despesas) AS total, COUNT(DISTINCT r.registro_ans)
+FROM resumo_operadora_trimestre r
+JOIN operadoras o ON o.registro_ans = r.registro_ans
+WHERE o.uf IS NOT NULL AND o.uf <> '' {where}
+GROUP BY o.uf
+ORDER BY total DESC, o.uf
+LIMIT ?
+"""
+
+
+class NotFound(Exception):
+    """
+    Recurso inexistente (vira HTTP 404).
+    """
+
+
+class DatabaseUnavailable(Exception):
+    """
+    Banco ainda não foi gerado pelo pipeline (vira HTTP 503).
+    """
+
+
+def output_version(db_path: Path) -> Optional[Tuple[Tuple[str, int, int], ...]]:
+    """
+    Identifica a versão publicada do banco pelo (mtime, tamanho) do arquivo
+    e do WAL. Qualquer nova carga do teste_3/main.py muda esse valor.
+    WAL vazio é ignorado (o próprio leitor SQLite pode criá-lo).
+    Retorna None se o banco não existe.
+    """
+    if not db_path.exists():
+        return None
+
+    version = []
+    for suffix in ("", ".wal", "-wal"):
+        path = Path(f"{db_path}{suffix}")
+        stat = path.stat() if path.exists() else None
+        if stat is not None and (suffix == "" or stat.st_size > 0):
+            version.append((suffix, stat.st_mtime_ns, stat.st_size))
+    return tuple(version)
+
+
+def detect_backend(db_path: Path) -> str:
+    """
+    Descobre o formato do arquivo (SQLite tem cabeçalho fixo; o resto é DuckDB).
+    """
+    with db_path.open("rb") as fin:
+        header = fin.read(16)
+    return "sqlite" if header.startswith(b"SQLite format 3") else available_backend("duckdb")
+
+
+def open_read_only(db_path: Path) -> Any:
+    """
+    Abre o banco somente leitura.
+    """
+    if detect_backend(db_path) == "duckdb":
+        return duckdb.connect(str(db_path), read_only=True)
+
+    return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+
+
+def json_value(value: Any) -> Any:
+    """
+    Converte valores do banco para JSON (DECIMAL do DuckDB -> float).
+    """
+    if isinstance(value, Decimal):
+        return round(float(value), 2)
+    if isinstance(value, float):
+        return round(value, 2)
+    return value
+
+
+def parse_int(value: str, name: str) -> int:
+    """
+    Converte um parâmetro inteiro, com erro claro (HTTP 400) se inválido.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Parâmetro '{name}' deve ser inteiro: {value!r}") from None
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """
+    Percentil por vizinho mais próximo (suficiente para métricas).
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[position]
+
+
+class ResultCache:
+    """
+    Cache LRU de resultados, invalidado inteiro quando muda a versão
+    publicada dos dados.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Tuple[Any, ...], Any]" = OrderedDict()
+        self.version: Any = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def sync(self, version: Any) -> None:
+        """
+        Descarta tudo se os dados mudaram desde a última consulta.
+        """
+        with self.lock:
+            if version != self.version:
+                if self.entries:
+                    self.invalidations += 1
+                self.entries.clear()
+                self.version = version
+
+    def get(self, key: Tuple[Any, ...]) -> Tuple[bool, Any]:
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, self.entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key: Tuple[Any, ...], value: Any, version: Any) -> None:
+        with self.lock:
+            # Resultado calculado sobre dados que já foram substituídos
+            if version != self.version:
+                return
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entradas": len(self.entries),
+                "capacidade": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidacoes": self.invalidations,
+            }
+
+
+class Metrics:
+    """
+    Contagem de requisições e latência por rota.
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW) -> None:
+        self.window = window
+        self.requests: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.total_ms: Dict[str, float] = {}
+        self.recent_ms: Dict[str, Deque[float]] = {}
+        self.lock = threading.Lock()
+
+    def record(self, route: str, elapsed_ms: float, failed: bool) -> None:
+        with self.lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            self.total_ms[route] = self.total_ms.get(route, 0.0) + elapsed_ms
+            self.recent_ms.setdefault(route, deque(maxlen=self.window)).append(elapsed_ms)
+            if failed:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            routes = {}
+            for route, count in sorted(self.requests.items()):
+                recent = list(self.recent_ms[route])
+                routes[route] = {
+                    "requisicoes": count,
+                    "erros": self.errors.get(route, 0),
+                    "latencia_media_ms": round(self.total_ms[route] / count, 3),
+                    "latencia_p50_ms": round(percentile(recent, 0.50), 3),
+                    "latencia_p95_ms": round(percentile(recent, 0.95), 3),
+                }
+            return routes
+
+
+class QueryService:
+    """
+    Consultas de despesas sobre o banco gerado pelo Teste 3, com cache LRU.
+    As conexões somente leitura ficam num pool (o ThreadingHTTPServer cria
+    uma thread por requisição) e são reabertas quando o pipeline publica
+    um banco novo.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        cache_size: int = CACHE_MAX_ENTRIES,
+        rows_csv: Path = DEFAULT_ROWS_CSV,
+    ) -> None:
+        self.db_path = Path(db_path)
+        self.cache = ResultCache(cache_size)
+        self.metrics = Metrics()
+        self.pool: List[Tuple[Any, Any]] = []
+        self.pool_lock = threading.Lock()
+        self.rows_csv = Path(rows_csv)
+        self.rows_index: Optional[OffsetIndex] = None
+
+    def acquire(self, version: Any) -> Any:
+        """
+        Pega uma conexão livre da versão informada (ou abre uma nova).
+        Conexões de versões antigas são fechadas.
+        """
+        with self.pool_lock:
+            stale = [conn for conn_version, conn in self.pool if conn_version != version]
+            self.pool = [(conn_version, conn) for conn_version, conn in self.pool if conn_version == version]
+            conn = self.pool.pop()[1] if self.pool else None
+
+        for old in stale:
+            old.close()
+
+        return conn if conn is not None else open_read_only(self.db_path)
+
+    def release(self, version: Any, conn: Any) -> None:
+        with self.pool_lock:
+            self.pool.append((version, conn))
+
+    def query(self, version: Any, sql: str, params: Tuple[Any, ...] = ()) -> List[Tuple[Any, ...]]:
+        conn = self.acquire(version)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        except Exception:
+            conn.close()
+            raise
+        self.release(version, conn)
+        return [tuple(json_value(value) for value in row) for row in rows]
+
+    def cached(self, key: Tuple[Any, ...], compute: Callable[[Any], Any]) -> Any:
+        """
+        Retorna o resultado do cache ou calcula e guarda.
+        """
+        version = output_version(self.db_path)
+        if version is None:
+            raise DatabaseUnavailable(
+                f"Banco não encontrado em {self.db_path}. Rode antes: python teste_3/main.py"
+            )
+
+        self.cache.sync(version)
+        hit, value = self.cache.get(key)
+        if hit:
+            return value
+
+        value = compute(version)
+        self.cache.put(key, value, version)
+        return value
+
+    # ----- consultas -----
+
+    def operadora(self, identifier: str) -> Dict[str, Any]:
+        """
+        Cadastro e despesas por trimestre de uma operadora.
+        Aceita REG_ANS ou CNPJ (14 dígitos).
+        """
+        identifier = "".join(char for char in identifier if char.isdigit())
+        if not identifier:
+            raise ValueError("Informe o REG_ANS ou o CNPJ da operadora.")
+
+        def compute(version: Any) -> Dict[str, Any]:
+            if len(identifier) == 14:
+                rows = self.query(version, SQL_OPERADORA_POR_CNPJ, (identifier,))
+            else:
+                rows = self.query(version, SQL_OPERADORA_POR_REGISTRO, (int(identifier),))
+            if not rows:
+                raise NotFound(f"Operadora não encontrada: {identifier}")
+
+            registro_ans, cnpj, razao_social, modalidade, uf = rows[0]
+            trimestres = [
+                {"ano": ano, "trimestre": trimestre, "total_despesas": total, "qtd_lancamentos": qtd}
+                for ano, trimestre, total, qtd in self.query(version, SQL_DESPESAS_OPERADORA, (registro_ans,))
+            ]
+            return {
+                "registro_ans": registro_ans,
+                "cnpj": cnpj,
+                "razao_social": razao_social,
+                "modalidade": modalidade,
+                "uf": uf,
+                "total_despesas": round(sum(item["total_despesas"] for item in trimestres), 2),
+                "trimestres": trimestres,
+            }
+
+        return self.cached(("operadora", identifier), compute)
+
+    def row_index(self) -> OffsetIndex:
+        """
+        Índice do CSV ordenado por operadora, reaberto quando o CSV é
+        regravado (o antigo é liberado quando nenhuma requisição o usa).
+        """
+        with self.pool_lock:
+            if self.rows_index is None or self.rows_index.is_stale():
+                self.rows_index = OffsetIndex(self.rows_csv)
+            return self.rows_index
+
+    def operadora_linhas(self, identifier: str) -> Dict[str, Any]:
+        """
+        Linhas do CSV enriquecido de uma operadora (REG_ANS ou CNPJ), lidas
+        direto do arquivo pelo índice: busca binária + leitura só do trecho.
+        O CNPJ é resolvido para REG_ANS pelo banco.
+        """
+        identifier = "".join(char for char in identifier if char.isdigit())
+        if not identifier:
+            raise ValueError("Informe o REG_ANS ou o CNPJ da operadora.")
+
+        registro_ans = identifier
+        if len(identifier) == 14:
+            def compute(version: Any) -> str:
+                rows = self.query(version, SQL_OPERADORA_POR_CNPJ, (identifier,))
+                if not rows:
+                    raise NotFound(f"Operadora não encontrada: {identifier}")
+                return str(rows[0][0])
+
+            registro_ans = self.cached(("registro_por_cnpj", identifier), compute)
+
+        index = self.row_index()
+        linhas = index.rows(registro_ans)
+        if not linhas:
+            raise NotFound(f"Operadora sem linhas em {self.rows_csv.name}: {registro_ans}")
+
+        return {
+            "registro_ans": registro_ans,
+            "arquivo": str(self.rows_csv),
+            "qtd_linhas": len(linhas),
+            "linhas": linhas,
+        }
+
+    def uf(self, uf: str) -> Dict[str, Any]:
+        """
+        Despesas por trimestre de uma UF.
+        """
+        uf = uf.strip().upper()
+        if len(uf) != 2 or not uf.isalpha():
+            raise ValueError(f"UF inválida: {uf!r}")
+
+        def compute(version: Any) -> Dict[str, Any]:
+            rows = self.query(version, SQL_DESPESAS_UF, (uf,))
+            if not rows:
+                raise NotFound(f"Sem despesas para a UF {uf}")
+
+            trimestres = [
+                {"ano": ano, "trimestre": trimestre, "total_despesas": total, "qtd_operadoras": qtd}
+                for ano, trimestre, total, qtd in rows
+            ]
+            return {
+                "uf": uf,
+                "total_despesas": round(sum(item["total_despesas"] for item in trimestres), 2),
+                "trimestres": trimestres,
+            }
+
+        return self.cached(("uf", uf), compute)
+
+    def trimestres(self) -> Dict[str, Any]:
+        """
+        Totais de todos os trimestres carregados.
+        """
+
+        def compute(version: Any) -> Dict[str, Any]:
+            return {
+                "trimestres": [
+                    {"ano": ano, "trimestre": trimestre, "total_despesas": total, "qtd_operadoras": qtd}
+                    for ano, trimestre, total, qtd in self.query(version, SQL_TRIMESTRES)
+                ]
+            }
+
+        return self.cached(("trimestres",), compute)
+
+    def trimestre(self, ano: int, trimestre: int) -> Dict[str, Any]:
+        """
+        Total de um trimestre, aberto por UF.
+        """
+
+        def compute(version: Any) -> Dict[str, Any]:
+            rows = self.query(version, SQL_TRIMESTRE_POR_UF, (ano, trimestre))
+            if not rows:
+                raise NotFound(f"Trimestre não carregado: {ano}/{trimestre}T")
+
+            por_uf = [
+                {"uf": uf or None, "total_despesas": total, "qtd_operadoras": qtd}
+                for uf, total, qtd in rows
+            ]
+            return {
+                "ano": ano,
+                "trimestre": trimestre,
+                "total_despesas": round(sum(item["total_despesas"] for item in por_uf), 2),
+                "qtd_operadoras": sum(item["qtd_operadoras"] for item in por_uf),
+                "por_uf": por_uf,
+            }
+
+        return self.cached(("trimestre", ano, trimestre), compute)
+
+    def top(self, por: str, n: int, ano: Optional[int] = None, trimestre: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Ranking das maiores despesas por operadora ou por UF
+        (no período todo ou em um trimestre).
+        """
+        if por not in {"operadora", "uf"}:
+            raise ValueError("Parâmetro 'por' deve ser 'operadora' ou 'uf'.")
+        if not 1 <= n <= TOP_N_MAX:
+            raise ValueError(f"Parâmetro 'n' deve estar entre 1 e {TOP_N_MAX}.")
+        if (ano is None) != (trimestre is None):
+            raise ValueError("Informe 'ano' e 'trimestre' juntos.")
+
+        def compute(version: Any) -> Dict[str, Any]:
+            params: Tuple[Any, ...] = () if ano is None else (ano, trimestre)
+
+            if por == "operadora":
+                where = "" if ano is None else "WHERE r.ano = ? AND r.trimestre = ?"
+                ranking = [
+                    {"registro_ans": registro_ans, "razao_social": razao_social, "uf": uf, "total_despesas": total}
+                    for registro_ans, razao_social, uf, total in self.query(
+                        version, SQL_TOP_OPERADORAS.format(where=where), params + (n,)
+                    )
+                ]
+            else:
+                where = "" if ano is None else "AND r.ano = ? AND r.trimestre = ?"
+                ranking = [
+                    {"uf": uf, "total_despesas": total, "qtd_operadoras": qtd}
+                    for uf, total, qtd in self.query(version, SQL_TOP_UFS.format(where=where), params + (n,))
+                ]
+
+            return {"por": por, "n": n, "ano": ano, "trimestre": trimestre, "ranking": ranking}
+
+        return self.cached(("top", por, n, ano, trimestre), compute)
+
+    def metrics_snapshot(self) -> Dict[str, Any]:
+        return {
+            "banco": str(self.db_path),
+            "versao_dados": output_version(self.db_path),
+            "cache": self.cache.stats(),
+            "rotas": self.metrics.stats(),
+        }
+
+
+def route_request(service: QueryService, path: str, query: Dict[str, List[str]]) -> Tuple[str, Any]:
+    """
+    Resolve a rota. Retorna (nome da rota para métricas, resposta).
+
+    Rotas:
+    - /operadoras/<REG_ANS ou CNPJ>
+    - /operadoras/<REG_ANS ou CNPJ>/linhas
+    - /ufs/<UF>
+    - /trimestres
+    - /trimestres/<ano>/<trimestre>
+    - /top?por=operadora|uf&n=10[&ano=2025&trimestre=1]
+    - /metrics
+    """
+    parts = [unquote(part) for part in path.strip("/").split("/") if part]
+
+    def param(name: str) -> Optional[str]:
+        values = query.get(name)
+        return values[0] if values else None
+
+    if parts == ["metrics"]:
+        return "/metrics", service.metrics_snapshot()
+
+    if len(parts) == 2 and parts[0] == "operadoras":
+        return "/operadoras/{id}", service.operadora(parts[1])
+
+    if len(parts) == 3 and parts[0] == "operadoras" and parts[2] == "linhas":
+        return "/operadoras/{id}/linhas", service.operadora_linhas(parts[1])
+
+    if len(parts) == 2 and parts[0] == "ufs":
+        return "/ufs/{uf}", service.uf(parts[1])
+
+    if parts == ["trimestres"]:
+        return "/trimestres", service.trimestres()
+
+    if len(parts) == 3 and parts[0] == "trimestres":
+        return "/trimestres/{ano}/{trimestre}", service.trimestre(
+            parse_int(parts[1], "ano"), parse_int(parts[2], "trimestre")
+        )
+
+    if parts == ["top"]:
+        ano, trimestre = param("ano"), param("trimestre")
+        return "/top", service.top(
+            por=param("por") or "operadora",
+            n=parse_int(param("n") or str(TOP_N_DEFAULT), "n"),
+            ano=None if ano is None else parse_int(ano, "ano"),
+            trimestre=None if trimestre is None else parse_int(trimestre, "trimestre"),
+        )
+
+    raise NotFound(f"Rota desconhecida: {path}")
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    Handler HTTP/JSON (somente GET).
+    """
+
+    server_version = "TesteWhybidQuery/1.0"
+
+    def do_GET(self) -> None:  # noqa: N802 (nome exigido pelo http.server)
+        service: QueryService = self.server.service  # type: ignore[attr-defined]
+        started = time.perf_counter()
+        url = urlparse(self.path)
+        route = "desconhecida"
+
+        try:
+            route, body = route_request(service, url.path, parse_qs(url.query))
+            status = 200
+        except NotFound as exc:
+            status, body = 404, {"erro": str(exc)}
+        except ValueError as exc:
+            status, body = 400, {"erro": str(exc)}
+        except (DatabaseUnavailable, OffsetIndexUnavailable) as exc:
+            status, body = 503, {"erro": str(exc)}
+        except Exception as exc:  # erro inesperado: responde 500 sem derrubar o servidor
+            status, body = 500, {"erro": f"{type(exc).__name__}: {exc}"}
+
+        self.send_json(status, body)
+        service.metrics.record(route, (time.perf_counter() - started) * 1000, failed=status >= 400)
+
+    def send_json(self, status: int, body: Any) -> None:
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if getattr(self.server, "verbose", False):
+            super().log_message(format, *args)
+
+
+def make_server(
+    db_path: Path,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    verbose: bool = False,
+    rows_csv: Path = DEFAULT_ROWS_CSV,
+) -> ThreadingHTTPServer:
+    """
+    Cria o servidor (sem iniciar). Útil para rodar em thread em testes/notebooks.
+    """
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    server.daemon_threads = True
+    server.service = QueryService(db_path, rows_csv=rows_csv)  # type: ignore[attr-defined]
+    server.verbose = verbose  # type: ignore[attr-defined]
+    return server
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Teste 3 — serviço local de consulta de despesas (HTTP/JSON)")
+    parser.add_argument("--db", type=Path, default=DEFAULT_DB_PATH, help="Banco gerado pelo teste_3/main.py.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Endereço de escuta (padrão: só localhost).")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Porta HTTP.")
+    parser.add_argument(
+        "--linhas-csv",
+        type=Path,
+        default=DEFAULT_ROWS_CSV,
+        help="CSV ordenado e indexado por operadora usado em /operadoras/<id>/linhas.",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Loga cada requisição.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    server = make_server(args.db, args.host, args.port, args.verbose, args.linhas_csv)
+
+    print("=" * 60)
+    print(f"🌐 Serviço de consulta em http://{args.host}:{server.server_address[1]}")
+    print(f"🗄️  Banco: {args.db}")
+    print("   Rotas: /operadoras/<REG_ANS|CNPJ>[/linhas], /ufs/<UF>, /trimestres, /trimestres/<ano>/<tri>, /top, /metrics")
+    print("=" * 60)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Encerrando serviço...")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
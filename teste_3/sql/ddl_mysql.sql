@@ -63,7 +63,8 @@ CREATE TABLE stg_despesas_consolidadas (
     razaosocial     TEXT,
     ano             TEXT,
     trimestre       TEXT,
-    valordespesas   TEXT
+    valordespesas   TEXT,
+    conta           TEXT
 ) ENGINE=InnoDB;
 
 CREATE TABLE stg_despesas_agregadas (
@@ -30,7 +30,8 @@ FIELDS TERMINATED BY ';'
 OPTIONALLY ENCLOSED BY '"'
 LINES TERMINATED BY '\n'
 IGNORE 1 LINES
-(reg_ans, cnpj, razaosocial, ano, trimestre, valordespesas);
+(reg_ans, cnpj, razaosocial, ano, trimestre, valordespesas, @conta)
+SET conta = NULLIF(TRIM(@conta), '');
 
 
 LOAD DATA INFILE 'CAMINHO_ABSOLUTO/despesas_agregadas.csv'
@@ -77,7 +78,9 @@ WHERE
     AND TRIM(s.trimestre) REGEXP '^[1-4]$'
     AND TRIM(s.valordespesas) <> ''
     AND REPLACE(TRIM(s.valordespesas), ',', '.') REGEXP '^[0-9]+(\\.[0-9]+)?$'
-    AND CAST(REPLACE(TRIM(s.valordespesas), ',', '.') AS DECIMAL(18,2)) > 0;
+    AND CAST(REPLACE(TRIM(s.valordespesas), ',', '.') AS DECIMAL(18,2)) > 0
+    -- Consolidado com várias contas: só eventos / sinistros (arquivos antigos não têm a coluna)
+    AND (s.conta IS NULL OR s.conta = 'EVENTOS_SINISTROS');
 
 
 INSERT INTO despesas_agregadas (
@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import math
+from typing import Any, Iterable, List, Optional, Tuple
+
+from local_db import fetch_all, load_queries
+
+# Resumos mantidos por trimestre.
+# - resumo_operadora_trimestre: total por (registro_ans, ano, trimestre)
+# - resumo_uf_trimestre: total e qtd. de operadoras por (uf, ano, trimestre);
+#   operadoras sem UF ficam com uf = '' para que a soma por trimestre
+#   cubra todas as operadoras (usado na média geral da query 3).
+SUMMARY_DDL = [
+    """CREATE TABLE IF NOT EXISTS resumo_operadora_trimestre (
+    registro_ans    INT NOT NULL,
+    ano             SMALLINT NOT NULL,
+    trimestre       SMALLINT NOT NULL,
+    total_despesas  {money} NOT NULL,
+    qtd_lancamentos INT NOT NULL,
+    PRIMARY KEY (registro_ans, ano, trimestre)
+)""",
+    """CREATE TABLE IF NOT EXISTS resumo_uf_trimestre (
+    uf              VARCHAR(2) NOT NULL,
+    ano             SMALLINT NOT NULL,
+    trimestre       SMALLINT NOT NULL,
+    total_despesas  {money} NOT NULL,
+    qtd_operadoras  INT NOT NULL,
+    PRIMARY KEY (uf, ano, trimestre)
+)""",
+    "CREATE INDEX IF NOT EXISTS idx_resumo_operadora_periodo ON resumo_operadora_trimestre (ano, trimestre)",
+    "CREATE INDEX IF NOT EXISTS idx_resumo_uf_periodo ON resumo_uf_trimestre (ano, trimestre)",
+]
+
+REFRESH_OPERADORA = """
+INSERT INTO resumo_operadora_trimestre (registro_ans, ano, trimestre, total_despesas, qtd_lancamentos)
+SELECT registro_ans, ano, trimestre, SUM(valor_despesas), COUNT(*)
+FROM despesas_consolidadas
+WHERE ano = ? AND trimestre = ?
+GROUP BY registro_ans, ano, trimestre
+"""
+
+REFRESH_UF = """
+INSERT INTO resumo_uf_trimestre (uf, ano, trimestre, total_despesas, qtd_operadoras)
+SELECT COALESCE(o.uf, ''), r.ano, r.trimestre, SUM(r.total_despesas), COUNT(*)
+FROM resumo_operadora_trimestre r
+JOIN operadoras o ON o.registro_ans = r.registro_ans
+WHERE r.ano = ? AND r.trimestre = ?
+GROUP BY COALESCE(o.uf, ''), r.ano, r.trimestre
+"""
+
+# Versões das 3 queries de queries_mysql.sql sobre os resumos
+SUMMARY_QUERIES = [
+    (
+        "crescimento_percentual",
+        """
+WITH limits AS (
+    SELECT
+        registro_ans,
+        MIN(ano * 10 + trimestre) AS first_periodo,
+        MAX(ano * 10 + trimestre) AS last_periodo
+    FROM resumo_operadora_trimestre
+    GROUP BY registro_ans
+),
+paired AS (
+    SELECT
+        l.registro_ans,
+        o.razao_social,
+        f.total_despesas AS first_total,
+        t.total_despesas AS last_total
+    FROM limits l
+    JOIN operadoras o ON o.registro_ans = l.registro_ans
+    JOIN resumo_operadora_trimestre f
+      ON f.registro_ans = l.registro_ans
+     AND f.ano * 10 + f.trimestre = l.first_periodo
+    JOIN resumo_operadora_trimestre t
+      ON t.registro_ans = l.registro_ans
+     AND t.ano * 10 + t.trimestre = l.last_periodo
+)
+SELECT
+    registro_ans,
+    razao_social,
+    first_total,
+    last_total,
+    ROUND(((last_total - first_total) / NULLIF(first_total, 0)) * 100, 2) AS crescimento_percentual
+FROM paired
+WHERE first_total > 0
+ORDER BY crescimento_percentual DESC
+LIMIT 5
+""",
+    ),
+    (
+        "distribuicao_uf",
+        """
+WITH por_uf AS (
+    SELECT uf, SUM(total_despesas) AS total_uf
+    FROM resumo_uf_trimestre
+    WHERE uf <> ''
+    GROUP BY uf
+),
+operadoras_uf AS (
+    SELECT o.uf, COUNT(DISTINCT r.registro_ans) AS qtd_operadoras
+    FROM resumo_operadora_trimestre r
+    JOIN operadoras o ON o.registro_ans = r.registro_ans
+    WHERE o.uf IS NOT NULL AND o.uf <> ''
+    GROUP BY o.uf
+)
+SELECT
+    p.uf,
+    ROUND(p.total_uf, 2) AS total_despesas_uf,
+    ROUND(p.total_uf / q.qtd_operadoras, 2) AS media_despesas_por_operadora
+FROM por_uf p
+JOIN operadoras_uf q ON q.uf = p.uf
+ORDER BY p.total_uf DESC
+LIMIT 5
+""",
+    ),
+    (
+        "operadoras_acima_media",
+        """
+WITH media_geral_trimestre AS (
+    SELECT
+        ano,
+        trimestre,
+        SUM(total_despesas) / SUM(qtd_operadoras) AS media_trimestre
+    FROM resumo_uf_trimestre
+    GROUP BY ano, trimestre
+),
+acima_media AS (
+    SELECT
+        r.registro_ans,
+        COUNT(*) AS qtd_trimestres_acima
+    FROM resumo_operadora_trimestre r
+    JOIN media_geral_trimestre m
+      ON m.ano = r.ano
+     AND m.trimestre = r.trimestre
+    WHERE r.total_despesas > m.media_trimestre
+    GROUP BY r.registro_ans
+)
+SELECT
+    COUNT(*) AS operadoras_acima_media_em_2_trimestres
+FROM acima_media
+WHERE qtd_trimestres_acima >= 2
+""",
+    ),
+]
+
+
+def create_summary_tables(conn: Any, backend: str) -> None:
+    """
+    Cria as tabelas de resumo (se ainda não existirem).
+    """
+    money = "REAL" if backend == "sqlite" else "DECIMAL(38,2)"
+
+    cursor = conn.cursor()
+    for statement in SUMMARY_DDL:
+        cursor.execute(statement.format(money=money))
+    conn.commit()
+
+
+def loaded_quarters(conn: Any) -> List[Tuple[int, int]]:
+    """
+    Trimestres presentes na tabela de fatos.
+    """
+    _, rows = fetch_all(conn, "SELECT DISTINCT ano, trimestre FROM despesas_consolidadas ORDER BY ano, trimestre")
+    return [(int(ano), int(trimestre)) for ano, trimestre in rows]
+
+
+def refresh_summaries(conn: Any, quarters: Optional[Iterable[Tuple[int, int]]] = None) -> List[Tuple[int, int]]:
+    """
+    Atualiza os resumos somente dos trimestres informados
+    (apaga e recalcula cada trimestre usando o índice por período).
+    Sem trimestres informados, recalcula todos os trimestres carregados.
+
+    Observação: mudanças de UF no cadastro afetam resumo_uf_trimestre de
+    todos os trimestres; após recarregar operadoras, chame sem `quarters`.
+    """
+    if quarters is None:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM resumo_uf_trimestre")
+        cursor.execute("DELETE FROM resumo_operadora_trimestre")
+        quarters = loaded_quarters(conn)
+
+    quarters = sorted(set(quarters))
+    cursor = conn.cursor()
+
+    for ano, trimestre in quarters:
+        cursor.execute("DELETE FROM resumo_uf_trimestre WHERE ano = ? AND trimestre = ?", (ano, trimestre))
+        cursor.execute("DELETE FROM resumo_operadora_trimestre WHERE ano = ? AND trimestre = ?", (ano, trimestre))
+        cursor.execute(REFRESH_OPERADORA, (ano, trimestre))
+        cursor.execute(REFRESH_UF, (ano, trimestre))
+
+    conn.commit()
+    return quarters
+
+
+def same_value(left: Any, right: Any) -> bool:
+    """
+    Compara valores de resultado tolerando diferenças de ponto flutuante
+    (a ordem das somas muda entre a tabela de fatos e os resumos).
+    """
+    if isinstance(left, (int, float)) or isinstance(right, (int, float)):
+        try:
+            return math.isclose(float(left), float(right), rel_tol=1e-9, abs_tol=0.01)
+        except (TypeError, ValueError):
+            return False
+    return str(left) == str(right)
+
+
+def same_rows(left: List[Tuple[Any, ...]], right: List[Tuple[Any, ...]]) -> bool:
+    """
+    Compara dois resultados linha a linha.
+    """
+    if len(left) != len(right):
+        return False
+    return all(
+        len(row_left) == len(row_right) and all(same_value(a, b) for a, b in zip(row_left, row_right))
+        for row_left, row_right in zip(left, right)
+    )
+
+
+def verify_against_original(conn: Any) -> bool:
+    """
+    Roda as queries originais (queries_mysql.sql) e as versões sobre os
+    resumos, e confere se os resultados batem.
+    """
+    all_ok = True
+    summary_queries = dict(SUMMARY_QUERIES)
+
+    for name, sql in load_queries():
+        if name not in summary_queries:
+            continue
+
+        _, original = fetch_all(conn, sql)
+        _, summarized = fetch_all(conn, summary_queries[name])
+        ok = same_rows(original, summarized)
+        all_ok = all_ok and ok
+
+        print(f"   {'✔' if ok else '✖'} {name}: {'resultado idêntico' if ok else 'DIVERGENTE'}")
+
+    return all_ok